@@ -47,6 +47,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'main.roles.RolesMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -66,6 +67,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'main.roles.roles_context',
             ],
         },
     },
@@ -137,7 +139,9 @@ TIME_ZONE = 'Asia/Ho_Chi_Minh'
 USE_TZ = True
 
 # settings.py (thêm hoặc kiểm tra)
-EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend" #Cách gửi email mà hệ thống sử dụng là SMTP, kết nối với gmail để gửi mail
+# Request chỉ ghi mail vào bảng OutboxEmail; worker `manage.py send_outbox --loop` mới gửi thật qua SMTP
+EMAIL_BACKEND = "main.outbox.OutboxBackend"
+GLAMUP_OUTBOX_DELIVERY_BACKEND = "django.core.mail.backends.smtp.EmailBackend" #Cách gửi email mà hệ thống sử dụng là SMTP, kết nối với gmail để gửi mail
 EMAIL_HOST = "smtp.gmail.com" #Đây là địa chỉ máy chủ mail (SMTP server), smtp.gmail.com là server gửi mail của Google.
 EMAIL_PORT = 587 #Đây là cổng kết nối SMTP
 EMAIL_USE_TLS = True #Mã hóa dữ liệu khi gửi mail,Tránh bị nghe lén, đánh cắp thông tin,Nếu không bật TLS,Gmail từ chối kết nối
@@ -146,3 +150,26 @@ EMAIL_HOST_PASSWORD = "ocedmxogauwcztfk"
 DEFAULT_FROM_EMAIL = "Glamup Nails <tothiennha.ec@gmail.com>"
 
 
+
+# Pub/sub cho bảng lễ tân realtime (SSE). Đổi sang broker khác cùng interface khi chạy nhiều process.
+GLAMUP_EVENT_BROKER = "main.events.InProcessBroker"
+
+# Cache dữ liệu catalog (home / services). Muốn dùng chung giữa nhiều process thì đổi
+# BACKEND sang FileBasedCache / DatabaseCache (nhớ chạy createcachetable) hoặc thêm alias riêng.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "glamup-default",
+    },
+}
+GLAMUP_CATALOG_CACHE = "default"
+
+# main/scheduler.py (manage.py run_scheduler --loop)
+GLAMUP_NO_SHOW_GRACE_MINUTES = 30       # quá giờ hẹn 30' chưa check-in -> NO_SHOW
+GLAMUP_SLOT_HOLD_MINUTES = 10           # đặt ONLINE: giữ chỗ 10' chờ thanh toán, quá hạn thì nhả cho người khác
+GLAMUP_WAITLIST_OFFER_MINUTES = 30      # main/waitlist.py: chỗ mời khách trong danh sách chờ được giữ 30'
+GLAMUP_BOOKING_DAYS_AHEAD = 30          # danh sách chờ / lịch heatmap chỉ nhận tới 30 ngày tới
+GLAMUP_IDEMPOTENCY_TTL_HOURS = 24       # main/idempotency.py: khoá chống submit trùng giữ 24h
+
+# địa chỉ gốc của site, dùng cho link trong email gửi từ worker (không có request)
+GLAMUP_SITE_URL = "http://127.0.0.1:8000"
@@ -1,7 +1,9 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+
+from .assignment import optimize_day
 from .models import (
     User, Branch, Service, Appointment, AppointmentService, AppointmentStaff,
-    StaffSchedule, Review, Payment, LoyaltyPoints
+    StaffSchedule, Review, Payment, LoyaltyPoints, WaitlistEntry, WaitlistOffer
 )
 
 
@@ -57,6 +59,7 @@ class PaymentInline(admin.TabularInline):
     model = Payment
     extra = 0
     readonly_fields = ("payment_date",)
+    ordering = ("-payment_date",)
 
 
 class ReviewInline(admin.TabularInline):
@@ -72,8 +75,10 @@ class AppointmentAdmin(admin.ModelAdmin):
     list_filter  = ("status", "branch", "appointment_date")
     search_fields = ("customer__username", "customer__full_name", "branch__name")
     date_hierarchy = "appointment_date"
+    ordering = ("-appointment_date", "-appointment_time")
     inlines = [AppointmentServiceInline, AppointmentStaffInline, PaymentInline, ReviewInline]
     readonly_fields = ("created_at",)
+    actions = ["repack_technicians"]
     fieldsets = (
         ("Thông tin lịch hẹn", {
             "fields": (
@@ -84,6 +89,23 @@ class AppointmentAdmin(admin.ModelAdmin):
         ("Khác", {"fields": ("created_at",)}),
     )
 
+    @admin.action(description="Re-pack technicians for the selected appointments' branch/day")
+    def repack_technicians(self, request, queryset):
+        days = queryset.values_list("branch_id", "appointment_date").distinct()
+        for branch_id, day in days:
+            r = optimize_day(branch_id, day, apply=True)
+            delta = r["capacity_after"] - r["capacity_before"]
+            if r["applied"]:
+                level = messages.SUCCESS
+                text = f"{r['moved']} appointment(s) reassigned, recovered {delta} bookable slot(s)."
+            elif r["moved"] and delta > 0:
+                level = messages.WARNING
+                text = "Bookings changed while optimizing, nothing was written. Please try again."
+            else:
+                level = messages.INFO
+                text = "Already optimal, nothing to change."
+            self.message_user(request, f"Branch #{branch_id}, {day:%d/%m/%Y}: {text}", level)
+
 
 # ========== STAFF SCHEDULE ==========
 @admin.register(StaffSchedule)
@@ -121,3 +143,19 @@ class LoyaltyAdmin(admin.ModelAdmin):
     search_fields = ("customer__username",)
     readonly_fields = ("last_updated",)
     ordering = ("-last_updated",)
+
+
+# ========== WAITLIST ==========
+class WaitlistOfferInline(admin.TabularInline):
+    model = WaitlistOffer
+    extra = 0
+    readonly_fields = ("appointment", "status", "offered_at", "expires_at", "responded_at")
+
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ("id", "customer", "branch", "service", "date_from", "date_to", "status", "created_at")
+    list_filter  = ("status", "branch")
+    search_fields = ("customer__username", "customer__full_name")
+    readonly_fields = ("created_at",)
+    inlines = [WaitlistOfferInline]
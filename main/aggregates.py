@@ -0,0 +1,21 @@
+# main/aggregates.py
+from django.db.models import Aggregate, TextField, Value
+from django.db.models.functions import Cast
+
+
+class GroupConcat(Aggregate):
+    """
+    Nối chuỗi các giá trị trong 1 nhóm: GROUP_CONCAT (SQLite) / STRING_AGG (PostgreSQL).
+    Vd: .annotate(names=GroupConcat("service__service_name", delimiter="; "))
+    """
+    function = "GROUP_CONCAT"
+    output_field = TextField()
+
+    def __init__(self, expression, delimiter=", ", **extra):
+        super().__init__(expression, Value(delimiter), **extra)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        expression, delimiter = self.get_source_expressions()
+        clone = self.copy()
+        clone.set_source_expressions([Cast(expression, TextField()), delimiter])
+        return clone.as_sql(compiler, connection, function="STRING_AGG", **extra_context)
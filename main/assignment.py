@@ -0,0 +1,217 @@
+# main/assignment.py
+"""
+Xếp lại KTV cho các lịch chưa bắt đầu của 1 (chi nhánh, ngày).
+
+book_now chọn KTV tham lam lúc khách đặt (ai ít phút bận nhất), cuối ngày thời gian rảnh của KTV
+bị băm vụn -> giờ còn "trống" trên tổng số nhưng không KTV nào đủ 1 khoảng liền.
+pack() giải lại bài toán xếp khoảng (interval scheduling) cho cả ngày:
+  - duyệt lịch theo giờ bắt đầu, mỗi lịch gán cho KTV có ca phù hợp (shift_of(start), giống book_now)
+    mà khoảng trống ngay trước nó nhỏ nhất (best fit) -> khoảng trống lớn được giữ nguyên cho khách sau
+  - lịch đã bắt đầu / đang làm / ở chi nhánh khác / nhiều KTV là cố định, không đổi
+  - hoà thì giữ KTV cũ (ít xáo trộn nhất)
+optimize_day() đo "sức chứa" trước/sau (số cặp (giờ, KTV) còn nhận được 1 lịch probe_minutes phút)
+và nếu apply=True thì ghi AppointmentStaff + sổ StaffSlot mới trong 1 transaction.
+"""
+from bisect import bisect_left
+from datetime import time as dtime
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .availability import (
+    BUSY_STATUSES, DEFAULT_DURATION, SLOT_TIMES, DayAvailability, hold_alive, shift_of, slot_range, to_minute,
+)
+from .models import Appointment, AppointmentStaff, StaffSlot
+
+# chỉ lịch chưa có ai bắt tay vào làm mới được đổi KTV
+MOVABLE_STATUSES = [Appointment.Status.PENDING, Appointment.Status.CONFIRMED]
+
+
+class _Timeline:
+    """Các khoảng bận (không chồng nhau) của 1 KTV, sắp theo giờ bắt đầu."""
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, intervals=()):
+        self.starts, self.ends = [], []
+        for s, e in sorted(intervals):
+            self.starts.append(s)
+            self.ends.append(e)
+
+    def gap_before(self, start, end):
+        """Số phút trống ngay trước [start, end) nếu chèn được, None nếu trùng."""
+        i = bisect_left(self.starts, start)
+        if i < len(self.starts) and self.starts[i] < end:
+            return None
+        if i and self.ends[i - 1] > start:
+            return None
+        return start - (self.ends[i - 1] if i else 0)
+
+    def add(self, start, end):
+        i = bisect_left(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+
+
+def pack(jobs, shift_staff, fixed):
+    """
+    jobs        : [(key, start, end, current_staff_id), ...]   (phút tính từ 00:00)
+    shift_staff : {shift: [staff_id, ...]}                      KTV có ca APPROVED
+    fixed       : {staff_id: [(start, end), ...]}              lịch bận không được đổi
+    Trả về {key: staff_id}, hoặc None nếu có lịch không xếp được (khi đó giữ nguyên phân công cũ).
+    """
+    timelines = {sid: _Timeline(iv) for sid, iv in fixed.items()}
+    plan = {}
+    for key, start, end, current in sorted(jobs, key=lambda j: (j[1], -j[2])):
+        eligible = list(shift_staff.get(shift_of(dtime(start // 60, start % 60)), []))
+        if current is not None and current not in eligible:
+            eligible.append(current)
+        best = None
+        for sid in eligible:
+            tl = timelines.get(sid)
+            gap = start if tl is None else tl.gap_before(start, end)
+            if gap is None:
+                continue
+            rank = (gap, sid != current, sid)
+            if best is None or rank < best[0]:
+                best = (rank, sid)
+        if best is None:
+            return None
+        plan[key] = best[1]
+        timelines.setdefault(best[1], _Timeline()).add(start, end)
+    return plan
+
+
+def capacity(shift_staff, busy, probe_minutes=DEFAULT_DURATION, not_before=None):
+    """(tổng số cặp (giờ, KTV) nhận thêm được 1 lịch probe_minutes phút, số giờ còn ít nhất 1 KTV)."""
+    index = DayAvailability(None, None, shift_staff, busy)
+    rows = index.capacity(probe_minutes, SLOT_TIMES, not_before)
+    return sum(n for _, n in rows), sum(1 for _, n in rows if n)
+
+
+def _load(branch_id, day, now):
+    """Trả về (shift_staff, jobs, fixed, lines) của 1 chi nhánh/ngày."""
+    base = DayAvailability.load(branch_id, day)
+    local_now = timezone.localtime(now)
+    started_before = to_minute(local_now.time()) if day == local_now.date() else -1
+
+    qs = (
+        AppointmentStaff.objects
+        .filter(
+            hold_alive(now, prefix="appointment__"),
+            appointment__branch_id=branch_id,
+            appointment__appointment_date=day,
+            appointment__status__in=BUSY_STATUSES,
+        )
+        .annotate(n_staff=Count("appointment__staff_lines"))
+        .values_list(
+            "pk", "appointment_id", "staff_id", "appointment__appointment_time", "appointment__end_time",
+            "appointment__status", "n_staff",
+        )
+    )
+    jobs, lines = [], {}
+    for line_id, appt_id, sid, t, end_t, status, n_staff in qs:
+        start = to_minute(t)
+        end = to_minute(end_t) if end_t else start + DEFAULT_DURATION
+        if status in MOVABLE_STATUSES and start > started_before and n_staff == 1:
+            jobs.append((appt_id, start, end, sid))
+            lines[appt_id] = line_id
+
+    # phần bận cố định = toàn bộ lịch bận của các KTV có ca, trừ chính các lịch được xếp lại
+    fixed = {}
+    movable = {(appt_id, sid) for appt_id, _, _, sid in jobs}
+    busy_rows = (
+        AppointmentStaff.objects
+        .filter(
+            hold_alive(now, prefix="appointment__"),
+            appointment__appointment_date=day,
+            appointment__status__in=BUSY_STATUSES,
+            staff_id__in={sid for ids in base.shift_staff.values() for sid in ids} | {sid for _, _, _, sid in jobs},
+        )
+        .values_list("appointment_id", "staff_id", "appointment__appointment_time", "appointment__end_time")
+    )
+    for appt_id, sid, t, end_t in busy_rows:
+        if (appt_id, sid) in movable:
+            continue
+        start = to_minute(t)
+        end = to_minute(end_t) if end_t else start + DEFAULT_DURATION
+        fixed.setdefault(sid, []).append((start, end))
+    return base.shift_staff, jobs, fixed, lines
+
+
+def _busy_with(jobs, fixed, plan):
+    busy = {sid: list(iv) for sid, iv in fixed.items()}
+    for key, start, end, current in jobs:
+        busy.setdefault(plan.get(key, current), []).append((start, end))
+    return busy
+
+
+def optimize_day(branch_id, day, apply=False, probe_minutes=DEFAULT_DURATION, now=None):
+    """
+    Xếp lại KTV cho (chi nhánh, ngày). Trả về dict báo cáo:
+      appointments, moved, capacity_before/after, open_times_before/after, applied
+    """
+    now = now or timezone.now()
+    local_now = timezone.localtime(now)
+    not_before = local_now.time() if day == local_now.date() else None
+
+    shift_staff, jobs, fixed, lines = _load(branch_id, day, now)
+    current = {key: sid for key, _, _, sid in jobs}
+    plan = pack(jobs, shift_staff, fixed) or current
+    moved = {key: sid for key, sid in plan.items() if sid != current[key]}
+
+    cap_before, open_before = capacity(shift_staff, _busy_with(jobs, fixed, current), probe_minutes, not_before)
+    cap_after, open_after = capacity(shift_staff, _busy_with(jobs, fixed, plan), probe_minutes, not_before)
+    report = {
+        "branch_id": branch_id,
+        "day": day,
+        "appointments": len(jobs),
+        "moved": len(moved),
+        "capacity_before": cap_before,
+        "capacity_after": cap_after,
+        "open_times_before": open_before,
+        "open_times_after": open_after,
+        "applied": False,
+    }
+    # chỉ ghi khi thật sự nhận thêm được khách
+    if apply and moved and cap_after > cap_before:
+        report["applied"] = _apply(moved, lines, current)
+    return report
+
+
+def _apply(moved, lines, current):
+    """Ghi phương án mới. False nếu trong lúc tính có lịch đổi trạng thái / bị đặt chen vào sổ."""
+    try:
+        with transaction.atomic():
+            appts = {
+                a.pk: a for a in
+                Appointment.objects.select_for_update()
+                .filter(pk__in=list(moved), status__in=MOVABLE_STATUSES)
+            }
+            still_current = set(
+                AppointmentStaff.objects
+                .filter(pk__in=[lines[k] for k in moved])
+                .values_list("appointment_id", "staff_id")
+            )
+            if len(appts) != len(moved) or still_current != {(k, current[k]) for k in moved}:
+                transaction.set_rollback(True)
+                return False
+
+            # xoá hết ô cũ trước rồi mới chèn ô mới -> 2 lịch đổi chéo KTV cho nhau vẫn hợp lệ
+            StaffSlot.objects.filter(appointment_id__in=list(moved)).delete()
+            rows = []
+            for appt_id, staff_id in moved.items():
+                AppointmentStaff.objects.filter(pk=lines[appt_id]).update(staff_id=staff_id)
+                appt = appts[appt_id]
+                rows.extend(
+                    StaffSlot(
+                        staff_id=staff_id, appointment_id=appt_id, date=appt.appointment_date, slot=n,
+                        expires_at=appt.hold_expires_at,
+                    )
+                    for n in slot_range(appt.appointment_time, appt.duration_minutes)
+                )
+            StaffSlot.objects.bulk_create(rows)
+    except IntegrityError:
+        # có lịch mới vừa giữ đúng ô đó -> để lần chạy sau tính lại
+        return False
+    return True
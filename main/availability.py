@@ -0,0 +1,251 @@
+# main/availability.py
+"""
+Chỉ mục khung giờ rảnh của KTV theo (chi nhánh, ngày).
+
+Mỗi KTV có 2 mảng phút (tính từ 00:00) đã sắp xếp theo giờ bắt đầu:
+  - starts   : phút bắt đầu các lịch đang giữ KTV
+  - max_ends : max(phút kết thúc) tính dồn tới vị trí i
+=> kiểm tra [start, end) có trùng lịch nào không chỉ cần 1 lần bisect.
+"""
+import hashlib
+from array import array
+from bisect import bisect_left
+from datetime import time as dtime
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Appointment, AppointmentStaff, StaffSchedule, StaffSlot
+
+# các trạng thái vẫn đang "giữ" KTV (giống logic book_now cũ)
+BUSY_STATUSES = [
+    Appointment.Status.PENDING,
+    Appointment.Status.CONFIRMED,
+    Appointment.Status.IN_PROGRESS,
+]
+
+DEFAULT_DURATION = 60
+
+# các giờ bắt đầu hiển thị trên trang đặt lịch: 08:00 -> 18:00, mỗi 30 phút
+SLOT_TIMES = [dtime(m // 60, m % 60) for m in range(8 * 60, 18 * 60 + 1, 30)]
+
+
+def to_minute(t: dtime) -> int:
+    return t.hour * 60 + t.minute
+
+
+def shift_of(t: dtime):
+    """MORNING(06:00–11:59), AFTERNOON(12:00–17:59), còn lại EVENING."""
+    if dtime(6, 0) <= t <= dtime(11, 59):
+        return StaffSchedule.Shift.MORNING
+    if dtime(12, 0) <= t <= dtime(17, 59):
+        return StaffSchedule.Shift.AFTERNOON
+    return StaffSchedule.Shift.EVENING
+
+
+def hold_alive(now=None, prefix=""):
+    """Lịch đã chốt hoặc còn trong hạn giữ chỗ (lịch giữ tạm đã quá hạn coi như không chiếm KTV)."""
+    now = now or timezone.now()
+    return Q(**{f"{prefix}hold_expires_at__isnull": True}) | Q(**{f"{prefix}hold_expires_at__gt": now})
+
+
+def busy_overlapping(day, start_time: dtime, end_time: dtime, staff=None):
+    """
+    Lịch đang giữ KTV trong ngày `day` chồng lên [start_time, end_time):
+    1 điều kiện SQL start < :end AND end > :start trên cột end_time lưu sẵn.
+    """
+    qs = Appointment.objects.filter(
+        hold_alive(),
+        appointment_date=day,
+        status__in=BUSY_STATUSES,
+        appointment_time__lt=end_time,
+        end_time__gt=start_time,
+    )
+    if staff is not None:
+        qs = qs.filter(staff_lines__staff=staff)
+    return qs
+
+
+class _StaffIntervals:
+    __slots__ = ("starts", "max_ends", "total")
+
+    def __init__(self, intervals):
+        intervals = sorted(intervals)
+        self.starts = array("H", (s for s, _ in intervals))
+        self.max_ends = array("H")
+        self.total = 0
+        running = 0
+        for s, e in intervals:
+            running = max(running, e)
+            self.max_ends.append(running)
+            self.total += e - s
+
+    def is_free(self, start: int, end: int) -> bool:
+        # các lịch có start < end nằm ở [0, i)
+        i = bisect_left(self.starts, end)
+        return i == 0 or self.max_ends[i - 1] <= start
+
+
+_EMPTY = _StaffIntervals([])
+
+
+class DayAvailability:
+    """
+    Lịch bận của các KTV có ca APPROVED tại 1 chi nhánh trong 1 ngày.
+    Dùng chung cho book_now và api_free_slots.
+    """
+
+    def __init__(self, branch_id, day, shift_staff, busy):
+        self.branch_id = branch_id
+        self.day = day
+        self.shift_staff = shift_staff        # {shift: [staff_id, ...]}
+        self._raw_busy = busy                 # {staff_id: [(start, end), ...]}
+        self._busy = {sid: _StaffIntervals(iv) for sid, iv in busy.items()}
+
+    @classmethod
+    def load(cls, branch, day):
+        branch_id = getattr(branch, "pk", branch)
+
+        shift_staff = {}
+        sched_qs = (
+            StaffSchedule.objects
+            .filter(branch_id=branch_id, work_date=day, status=StaffSchedule.Status.APPROVED)
+            .values_list("shift", "staff_id")
+            .order_by("staff_id")
+        )
+        staff_ids = set()
+        for shift, sid in sched_qs:
+            shift_staff.setdefault(shift, []).append(sid)
+            staff_ids.add(sid)
+
+        # KTV có thể làm ca khác ở chi nhánh khác cùng ngày -> không lọc theo branch
+        busy = {}
+        if staff_ids:
+            busy_qs = (
+                AppointmentStaff.objects
+                .filter(
+                    hold_alive(prefix="appointment__"),
+                    staff__in=staff_ids,
+                    appointment__appointment_date=day,
+                    appointment__status__in=BUSY_STATUSES,
+                )
+                .values_list("staff_id", "appointment__appointment_time", "appointment__end_time")
+            )
+            for sid, t, end_t in busy_qs:
+                start = to_minute(t)
+                end = to_minute(end_t) if end_t else start + DEFAULT_DURATION
+                busy.setdefault(sid, []).append((start, end))
+
+        return cls(branch_id, day, shift_staff, busy)
+
+    def is_free(self, staff_id, start: int, end: int) -> bool:
+        return self._busy.get(staff_id, _EMPTY).is_free(start, end)
+
+    def load_minutes(self, staff_id) -> int:
+        """Tổng số phút đã bận trong ngày (dùng để chia đều lịch)."""
+        return self._busy.get(staff_id, _EMPTY).total
+
+    def free_staff(self, start_time: dtime, duration: int):
+        """Danh sách staff_id có ca tại giờ start_time và rảnh trong [start, start+duration)."""
+        start = to_minute(start_time)
+        end = start + int(duration or DEFAULT_DURATION)
+        return [
+            sid for sid in self.shift_staff.get(shift_of(start_time), [])
+            if self.is_free(sid, start, end)
+        ]
+
+    def capacity(self, duration: int, times=SLOT_TIMES, not_before: dtime | None = None):
+        """
+        [(giờ, số KTV còn rảnh), ...] cho từng giờ bắt đầu trong `times`.
+        Giờ <= not_before (đã qua trong hôm nay) luôn = 0.
+        """
+        rows = []
+        for t in times:
+            if not_before is not None and t <= not_before:
+                rows.append((t, 0))
+            else:
+                rows.append((t, len(self.free_staff(t, duration))))
+        return rows
+
+    def fingerprint(self) -> str:
+        """Chuỗi băm thay đổi khi ca làm hoặc lịch bận của ngày thay đổi (dùng làm ETag)."""
+        parts = [str(self.branch_id), self.day.isoformat()]
+        for shift in sorted(self.shift_staff):
+            parts.append(f"{shift}:{','.join(map(str, self.shift_staff[shift]))}")
+        for sid in sorted(self._raw_busy):
+            parts.append(f"{sid}:{sorted(self._raw_busy[sid])}")
+        return hashlib.md5("|".join(parts).encode()).hexdigest()
+
+
+# ---------- Sổ giữ chỗ (StaffSlot) ----------
+
+def slot_range(start_time: dtime, duration: int) -> range:
+    """Các ô StaffSlot mà [start, start+duration) chạm vào."""
+    start = to_minute(start_time)
+    end = start + int(duration or DEFAULT_DURATION)
+    return range(start // StaffSlot.MINUTES, -(-end // StaffSlot.MINUTES))
+
+
+def reserve_staff(appt, candidates):
+    """
+    Giữ chỗ cho appt với KTV đầu tiên trong `candidates` còn trống trong sổ.
+    Mỗi lần thử nằm trong 1 savepoint: đụng unique (staff, date, slot) -> rollback phần đó và thử người kế.
+    Ô của lịch giữ tạm đã quá hạn được xoá ngay trong savepoint đó để nhường chỗ.
+    appt.hold_expires_at != None -> các ô cũng chỉ là giữ tạm tới mốc đó (chốt bằng confirm_hold).
+    Phải gọi bên trong transaction.atomic() cùng với lúc tạo Appointment.
+    Trả về staff_id đã giữ, hoặc None nếu tất cả đều vừa bị người khác giữ.
+    """
+    slots = slot_range(appt.appointment_time, appt.duration_minutes)
+    now = timezone.now()
+    for staff_id in candidates:
+        try:
+            with transaction.atomic():
+                StaffSlot.objects.filter(
+                    staff_id=staff_id, date=appt.appointment_date, slot__in=slots, expires_at__lte=now,
+                ).delete()
+                StaffSlot.objects.bulk_create([
+                    StaffSlot(
+                        staff_id=staff_id, appointment=appt, date=appt.appointment_date, slot=n,
+                        expires_at=appt.hold_expires_at,
+                    )
+                    for n in slots
+                ])
+        except IntegrityError:
+            continue
+        return staff_id
+    return None
+
+
+def confirm_hold(appt, now=None):
+    """
+    Chốt chỗ đang giữ tạm của appt (khi thanh toán xong). Gọi trong transaction, appt đã select_for_update.
+    Giữ tạm quá hạn vẫn chốt được nếu chưa ai chiếm mất chỗ. Trả về False nếu chỗ đã mất.
+    """
+    if appt.hold_expires_at is None:
+        return True
+    if appt.status not in BUSY_STATUSES:
+        return False
+    now = now or timezone.now()
+    slots = slot_range(appt.appointment_time, appt.duration_minutes)
+    if StaffSlot.objects.filter(appointment=appt).update(expires_at=None) != len(slots):
+        return False
+    if appt.hold_expires_at <= now:
+        # lịch đặt không qua sổ (form lễ tân) có thể đã lấy giờ này sau khi hết hạn giữ
+        staff_ids = appt.staff_lines.values_list("staff_id", flat=True)
+        taken = Appointment.objects.filter(
+            appointment_date=appt.appointment_date,
+            status__in=BUSY_STATUSES,
+            appointment_time__lt=appt.end_time,
+            end_time__gt=appt.appointment_time,
+            staff_lines__staff_id__in=staff_ids,
+        ).filter(hold_alive(now)).exclude(pk=appt.pk)
+        if taken.exists():
+            return False
+    appt.hold_expires_at = None
+    appt.save(update_fields=["hold_expires_at"])
+    return True
+
+
+def release_slots(appt_id):
+    StaffSlot.objects.filter(appointment_id=appt_id).delete()
@@ -0,0 +1,44 @@
+# main/booking.py
+"""
+Transaction đặt lịch dùng chung cho book_now, lời mời từ danh sách chờ (waitlist) và bench_booking_contention.
+
+create_booking() tạo Appointment + giữ chỗ KTV trong sổ StaffSlot (reserve_staff) + dòng dịch vụ / KTV / Payment
+trong 1 transaction. Mọi KTV trong `candidates` đều vừa bị request khác giữ mất -> rollback, trả về (None, None).
+Việc báo bảng lễ tân / cập nhật số liệu do nơi gọi tự làm (mỗi nơi một kiểu).
+"""
+from django.db import transaction
+
+from .availability import DEFAULT_DURATION, reserve_staff
+from .models import Appointment, AppointmentService, AppointmentStaff, Payment
+
+
+def create_booking(customer, branch_id, day, start_time, service, candidates, *,
+                   pay_method=Payment.Method.CASH, hold_expires_at=None, note="", duration=None):
+    """
+    hold_expires_at != None -> lịch PENDING, chỉ giữ chỗ tạm tới mốc đó (chờ thanh toán); None -> CONFIRMED.
+    Gọi được bên trong 1 transaction khác (chạy thành savepoint).
+    Trả về (appointment, staff_id).
+    """
+    duration = int(duration or service.duration or DEFAULT_DURATION)
+    with transaction.atomic():
+        appt = Appointment.objects.create(
+            customer=customer,
+            branch_id=branch_id,
+            appointment_date=day,
+            appointment_time=start_time,
+            duration_minutes=duration,
+            status=Appointment.Status.PENDING if hold_expires_at else Appointment.Status.CONFIRMED,
+            hold_expires_at=hold_expires_at,
+            note=note,
+            total_price=service.price or 0,
+        )
+        staff_id = reserve_staff(appt, candidates)
+        if staff_id is None:
+            transaction.set_rollback(True)
+            return None, None
+        AppointmentService.objects.create(appointment=appt, service=service, quantity=1, unit_price=service.price)
+        AppointmentStaff.objects.create(appointment=appt, staff_id=staff_id)
+        Payment.objects.create(
+            appointment=appt, amount=appt.total_price, method=pay_method, status=Payment.Status.UNPAID,
+        )
+    return appt, staff_id
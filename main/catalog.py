@@ -0,0 +1,46 @@
+# main/catalog.py
+"""
+Cache dữ liệu catalog công khai (trang home, trang services) dạng dict đã map sẵn.
+
+Key có version: "catalog:<version>:<tên>". Khi Service / Review đổi (signals.py)
+chỉ cần tăng version -> mọi key cũ tự bỏ, không phải xoá từng key.
+Backend lấy theo alias trong settings.CACHES (locmem / file / DB cache đều dùng được),
+chọn alias bằng settings.GLAMUP_CATALOG_CACHE.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+VERSION_KEY = "catalog:version"
+DEFAULT_TIMEOUT = 60 * 60  # vẫn hết hạn định kỳ cho dữ liệu không có signal (vd: avatar khách)
+
+
+def _cache():
+    return caches[getattr(settings, "GLAMUP_CATALOG_CACHE", "default")]
+
+
+def _version(cache):
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex[:12]
+        # add: nếu process khác vừa đặt version thì dùng của nó
+        if not cache.add(VERSION_KEY, version, None):
+            version = cache.get(VERSION_KEY, version)
+    return version
+
+
+def get_or_build(name, builder, timeout=DEFAULT_TIMEOUT):
+    """Trả dữ liệu đã cache; chưa có thì gọi builder() và lưu lại."""
+    cache = _cache()
+    key = f"catalog:{_version(cache)}:{name}"
+    data = cache.get(key)
+    if data is None:
+        data = builder()
+        cache.set(key, data, timeout)
+    return data
+
+
+def invalidate():
+    """Đổi version -> toàn bộ entry catalog cũ không còn được đọc tới."""
+    _cache().set(VERSION_KEY, uuid.uuid4().hex[:12], None)
@@ -0,0 +1,137 @@
+# main/events.py
+"""
+Pub/sub nhỏ để đẩy thay đổi lịch hẹn tới bảng lễ tân (SSE, xem views.receptionist_stream).
+
+Kênh = 1 chi nhánh trong 1 ngày: "rx:<branch_id>:<YYYY-MM-DD>".
+Mặc định dùng InProcessBroker (chỉ trong 1 process ASGI); muốn chạy nhiều worker thì
+viết class khác cùng interface (publish / subscribe / has_subscribers) rồi trỏ settings.GLAMUP_EVENT_BROKER tới nó.
+"""
+import asyncio
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+DEFAULT_BROKER = "main.events.InProcessBroker"
+
+
+class InProcessBroker:
+    """
+    publish() gọi được từ view sync (thread bất kỳ); subscriber là coroutine trên event loop ASGI.
+    Mỗi subscriber có 1 asyncio.Queue riêng; đầy thì bỏ event (client sẽ tự reload khi reconnect).
+    """
+
+    queue_size = 100
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs = {}  # channel -> {(loop, queue), ...}
+
+    def has_subscribers(self, channel) -> bool:
+        with self._lock:
+            return bool(self._subs.get(channel))
+
+    def publish(self, channel, event):
+        with self._lock:
+            targets = list(self._subs.get(channel, ()))
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, event)
+            except RuntimeError:
+                # loop đã đóng (client ngắt kết nối giữa chừng)
+                pass
+
+    @staticmethod
+    def _offer(queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
+
+    def subscribe(self, *channels):
+        """async with broker.subscribe("rx:1:2025-01-01") as queue: event = await queue.get()"""
+        return _Subscription(self, channels)
+
+    def _add(self, channels, sub):
+        with self._lock:
+            for ch in channels:
+                self._subs.setdefault(ch, set()).add(sub)
+
+    def _remove(self, channels, sub):
+        with self._lock:
+            for ch in channels:
+                subs = self._subs.get(ch)
+                if subs:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._subs[ch]
+
+
+class _Subscription:
+    # context manager dạng class (không dùng @asynccontextmanager) để đóng được
+    # an toàn cả khi generator SSE bị huỷ lúc client ngắt kết nối
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = channels
+        self.sub = None
+
+    async def __aenter__(self):
+        self.sub = (asyncio.get_running_loop(), asyncio.Queue(maxsize=self.broker.queue_size))
+        self.broker._add(self.channels, self.sub)
+        return self.sub[1]
+
+    async def __aexit__(self, *exc):
+        self.broker._remove(self.channels, self.sub)
+        return False
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, "GLAMUP_EVENT_BROKER", DEFAULT_BROKER))()
+    return _broker
+
+
+def board_channel(branch_id, day) -> str:
+    return f"rx:{branch_id}:{day.isoformat()}"
+
+
+def appointment_payload(appt, kind: str) -> dict:
+    """Dữ liệu 1 dòng trên bảng lễ tân (cùng field với _map_appt_for_rx)."""
+    first_line = appt.service_lines.select_related("service").order_by("pk").first()
+    staff_link = appt.staff_lines.select_related("staff").order_by("pk").first()
+    customer = appt.customer
+    return {
+        "type": kind,
+        "id": appt.id,
+        "code": f"BK{appt.id:06d}",
+        "date": appt.appointment_date.isoformat(),
+        "time": appt.appointment_time.strftime("%H:%M"),
+        "status": appt.status,
+        "branch": appt.branch.name if appt.branch_id else "",
+        "customer": (customer.full_name or customer.username) if customer else "",
+        "service_name": first_line.service.service_name if first_line else "Service",
+        "staff_name": (staff_link.staff.full_name or "Chưa gán") if staff_link else "Chưa gán",
+    }
+
+
+def publish_appointment_event(appt, kind: str):
+    """
+    kind: created | checked_in | ongoing | done | canceled.
+    Gửi sau khi transaction commit để bảng lễ tân không thấy dữ liệu chưa lưu.
+    Không ai đang mở bảng của kênh đó thì bỏ qua, không dựng payload (tránh vài câu SELECT thừa).
+    """
+    def _send():
+        broker = get_broker()
+        channel = board_channel(appt.branch_id, appt.appointment_date)
+        if broker.has_subscribers(channel):
+            broker.publish(channel, appointment_payload(appt, kind))
+
+    transaction.on_commit(_send)
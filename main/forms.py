@@ -14,6 +14,7 @@ from django.utils.translation import gettext_lazy as _
 from .models import (
     User, Branch, Service, Appointment, StaffSchedule, Review
 )
+from .availability import busy_overlapping
 
 # --------- helpers ----------
 def _add_bs_classes(fields, *, input_cls="form-control", select_cls="form-select"):
@@ -139,30 +140,10 @@ class BookingForm(forms.Form):
                     _("Selected staff has no approved shift at this branch and time.")
                 )
 
-            # 2) Không trùng lịch hẹn cùng thời điểm (đơn giản theo date+time)
-            conflict = Appointment.objects.filter(
-                staff=staff,  # M2M qua through; filter bằng related name staff__...
-                appointment_date=d,
-                appointment_time=t,
-                status__in=[
-                    Appointment.Status.PENDING,
-                    Appointment.Status.CONFIRMED,
-                    Appointment.Status.IN_PROGRESS
-                ]
-            ).exists()
-            # NOTE: do staff là M2M, filter trực tiếp như trên có thể không chạy ở mọi DB backend.
-            # An toàn hơn: tìm theo appointment có staff đã gán:
-            if not conflict:
-                conflict = Appointment.objects.filter(
-                    appointment_date=d,
-                    appointment_time=t,
-                    status__in=[
-                        Appointment.Status.PENDING,
-                        Appointment.Status.CONFIRMED,
-                        Appointment.Status.IN_PROGRESS
-                    ],
-                    staff_lines__staff=staff
-                ).exists()
+            # 2) Không trùng giờ với lịch khác của staff (theo thời lượng các dịch vụ đã chọn)
+            minutes = sum(int(s.duration or 60) for s in (cleaned.get("services") or [])) or 60
+            end_t = Appointment.compute_end_time(t, minutes)
+            conflict = busy_overlapping(d, t, end_t, staff=staff).exists()
             if conflict:
                 raise ValidationError(_("Selected staff already has an appointment at this time."))
 
@@ -0,0 +1,133 @@
+# main/heatmap.py
+"""
+Độ "kín lịch" theo tháng cho lịch chọn ngày ở trang đặt lịch (api_month_availability).
+
+Mỗi (ngày, ca) của 1 chi nhánh:
+  capacity  = số KTV có ca APPROVED × số phút của ca (SHIFT_WINDOWS)
+  booked    = tổng phút của các lịch đang giữ KTV, xếp vào ca theo giờ bắt đầu (× số KTV của lịch)
+  remaining = capacity - booked
+Chỉ 2 câu GROUP BY cho cả tháng. Kết quả cache theo (chi nhánh, tháng), xoá khi có đặt / huỷ lịch
+hoặc duyệt ca (signals.py, scheduler._finish); vẫn có timeout vì giữ chỗ hết hạn không phát signal.
+"""
+import calendar
+from datetime import date, time as dtime, timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Case, CharField, Count, Sum, Value, When
+from django.utils import timezone
+
+from .availability import BUSY_STATUSES, DEFAULT_DURATION, hold_alive
+from .models import AppointmentStaff, StaffSchedule
+
+# giờ nhận khách của từng ca (giống shift_of: MORNING < 12:00 <= AFTERNOON < 18:00 <= EVENING)
+SHIFT_WINDOWS = {
+    StaffSchedule.Shift.MORNING: (dtime(8, 0), dtime(12, 0)),
+    StaffSchedule.Shift.AFTERNOON: (dtime(12, 0), dtime(18, 0)),
+    StaffSchedule.Shift.EVENING: (dtime(18, 0), dtime(22, 0)),
+}
+CACHE_TIMEOUT = 5 * 60
+
+
+def shift_minutes(shift) -> int:
+    start, end = SHIFT_WINDOWS[shift]
+    return (end.hour * 60 + end.minute) - (start.hour * 60 + start.minute)
+
+
+def _cache():
+    return caches[getattr(settings, "GLAMUP_CATALOG_CACHE", "default")]
+
+
+def _key(branch_id, year, month):
+    return f"heatmap:{branch_id}:{year:04d}-{month:02d}"
+
+
+def _shift_case(field):
+    return Case(
+        When(**{f"{field}__lt": dtime(12, 0)}, then=Value(StaffSchedule.Shift.MORNING)),
+        When(**{f"{field}__lt": dtime(18, 0)}, then=Value(StaffSchedule.Shift.AFTERNOON)),
+        default=Value(StaffSchedule.Shift.EVENING),
+        output_field=CharField(),
+    )
+
+
+def _compute(branch_id, year, month):
+    first = date(year, month, 1)
+    last = date(year, month, calendar.monthrange(year, month)[1])
+
+    days = {}
+
+    def cell(day, shift):
+        return days.setdefault(day.isoformat(), {}).setdefault(shift, {"capacity": 0, "booked": 0})
+
+    staff_rows = (
+        StaffSchedule.objects
+        .filter(branch_id=branch_id, work_date__range=(first, last), status=StaffSchedule.Status.APPROVED)
+        .values("work_date", "shift")
+        .annotate(n=Count("staff_id", distinct=True))
+        .order_by()
+    )
+    for row in staff_rows:
+        if row["shift"] in SHIFT_WINDOWS:
+            cell(row["work_date"], row["shift"])["capacity"] = row["n"] * shift_minutes(row["shift"])
+
+    booked_rows = (
+        AppointmentStaff.objects
+        .filter(
+            hold_alive(prefix="appointment__"),
+            appointment__branch_id=branch_id,
+            appointment__appointment_date__range=(first, last),
+            appointment__status__in=BUSY_STATUSES,
+        )
+        .annotate(shift=_shift_case("appointment__appointment_time"))
+        .values("appointment__appointment_date", "shift")
+        .annotate(minutes=Sum("appointment__duration_minutes"))
+        .order_by()
+    )
+    for row in booked_rows:
+        cell(row["appointment__appointment_date"], row["shift"])["booked"] = int(row["minutes"] or 0)
+
+    for shifts in days.values():
+        for c in shifts.values():
+            c["remaining"] = max(0, c["capacity"] - c["booked"])
+    return days
+
+
+def in_horizon(year, month, today=None) -> bool:
+    """Tháng được xem: từ tháng hiện tại tới tháng của ngày xa nhất nhận đặt (GLAMUP_BOOKING_DAYS_AHEAD)."""
+    today = today or timezone.localdate()
+    last = today + timedelta(days=getattr(settings, "GLAMUP_BOOKING_DAYS_AHEAD", 30))
+    return (today.year, today.month) <= (year, month) <= (last.year, last.month)
+
+
+def month_availability(branch_id, year, month):
+    """{ "YYYY-MM-DD": {shift: {"capacity", "booked", "remaining"}} } (chỉ các ngày có ca hoặc có lịch)."""
+    cache = _cache()
+    key = _key(branch_id, year, month)
+    data = cache.get(key)
+    if data is None:
+        data = _compute(branch_id, year, month)
+        cache.set(key, data, CACHE_TIMEOUT)
+    return data
+
+
+def day_level(shifts, probe_minutes=DEFAULT_DURATION) -> str:
+    """closed | full | low | open cho 1 ngày (dùng để tô màu lịch)."""
+    capacity = sum(c["capacity"] for c in shifts.values())
+    remaining = sum(c["remaining"] for c in shifts.values())
+    if not capacity:
+        return "closed"
+    if remaining < probe_minutes:
+        return "full"
+    if remaining * 4 < capacity:
+        return "low"
+    return "open"
+
+
+def invalidate(branch_id, day):
+    """Xoá cache của tháng chứa `day` (sau commit, để request khác không cache lại dữ liệu cũ)."""
+    if branch_id is None or day is None:
+        return
+    key = _key(branch_id, day.year, day.month)
+    transaction.on_commit(lambda: _cache().delete(key))
@@ -0,0 +1,152 @@
+# main/idempotency.py
+"""
+Chống submit trùng cho các view thay đổi dữ liệu (book_now, payment_complete, check_out).
+
+    @login_required
+    @idempotent("book")
+    def book_now(request): ...
+
+Form / link gửi kèm khoá `idempotency_key` (POST, query string hoặc header Idempotency-Key),
+sinh bằng {% idempotency_field %} / {% idempotency_key %} (main/templatetags/idempotency.py).
+  - lần đầu: INSERT 1 dòng IdempotencyKey (unique user + key) rồi mới chạy view, lưu lại response
+  - gửi lại cùng khoá + cùng nội dung: trả response đã lưu, view không chạy lại
+  - request trước còn đang chạy: chờ tối đa WAIT_SECONDS rồi trả response của nó (hoặc 409)
+  - cùng khoá nhưng nội dung khác: 422
+  - view lỗi (exception / 5xx): xoá dòng để khách thử lại được
+Không có khoá thì view chạy như cũ. Dòng cũ hơn GLAMUP_IDEMPOTENCY_TTL_HOURS được scheduler xoá (purge).
+"""
+import hashlib
+import time
+import uuid
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+FIELD_NAME = "idempotency_key"
+HEADER_NAME = "HTTP_IDEMPOTENCY_KEY"
+IGNORED_FIELDS = {FIELD_NAME, "csrfmiddlewaretoken"}
+WAIT_SECONDS = 5
+POLL_SECONDS = 0.2
+MAX_STORED_CONTENT = 64 * 1024
+MAX_ATTEMPTS = 3
+
+
+def new_key() -> str:
+    return uuid.uuid4().hex
+
+
+def _request_key(request):
+    key = request.POST.get(FIELD_NAME) or request.GET.get(FIELD_NAME) or request.META.get(HEADER_NAME) or ""
+    return key.strip()[:64]
+
+
+def fingerprint(request) -> str:
+    """Băm method + path + các tham số (bỏ khoá và csrf), không phụ thuộc thứ tự field."""
+    parts = [request.method, request.path]
+    for data in (request.GET, request.POST):
+        for name in sorted(data):
+            if name not in IGNORED_FIELDS:
+                parts.append(f"{name}={'|'.join(data.getlist(name))}")
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def _replay(row):
+    response = HttpResponse(row.content, status=row.status_code, content_type=row.content_type or None)
+    if row.location:
+        response["Location"] = row.location
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _store(row, response):
+    row.state = IdempotencyKey.State.DONE
+    row.status_code = response.status_code
+    row.location = (response.get("Location") or "")[:500]
+    row.content_type = response.get("Content-Type", "")[:100]
+    content = b"" if response.streaming else response.content
+    row.content = content.decode(response.charset or "utf-8", "replace") if len(content) <= MAX_STORED_CONTENT else ""
+    row.save(update_fields=["state", "status_code", "location", "content_type", "content"])
+
+
+def _wait_done(user, key):
+    """
+    Request trùng tới khi request đầu chưa xong: đọc lại (chỉ SELECT) tới khi DONE hoặc hết giờ.
+    None = request đầu đã lỗi và xoá khoá.
+    """
+    deadline = time.monotonic() + WAIT_SECONDS
+    row = None
+    while time.monotonic() < deadline:
+        time.sleep(POLL_SECONDS)
+        row = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if row is None or row.state == IdempotencyKey.State.DONE:
+            return row
+    return row
+
+
+def _run(row, view, request, *args, **kwargs):
+    try:
+        response = view(request, *args, **kwargs)
+    except Exception:
+        row.delete()
+        raise
+    if response.status_code >= 500:
+        row.delete()
+    else:
+        _store(row, response)
+    return response
+
+
+def idempotent(scope):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = _request_key(request)
+            if not key or not request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+
+            fp = fingerprint(request)
+            # mỗi vòng: bên giữ khoá vừa lỗi và xoá dòng -> thử giành lại khoá, tối đa MAX_ATTEMPTS lần
+            for _ in range(MAX_ATTEMPTS):
+                # gửi lại: chỉ 1 SELECT rồi trả response cũ
+                row = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+                if row is None:
+                    try:
+                        with transaction.atomic():
+                            row = IdempotencyKey.objects.create(
+                                user=request.user, key=key, scope=scope, fingerprint=fp,
+                            )
+                    except IntegrityError:
+                        # 2 request cùng khoá tới cùng lúc, bên kia INSERT trước
+                        row = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+                        if row is None:
+                            continue
+                    else:
+                        return _run(row, view, request, *args, **kwargs)
+
+                if row.scope != scope or row.fingerprint != fp:
+                    return HttpResponse("This idempotency key was already used for a different request.", status=422)
+                if row.state != IdempotencyKey.State.DONE:
+                    row = _wait_done(request.user, key)
+                    if row is None:
+                        # request đầu vừa lỗi và xoá khoá -> chạy lại như lần đầu
+                        continue
+                    if row.state != IdempotencyKey.State.DONE:
+                        break
+                return _replay(row)
+            return HttpResponse("This request is already being processed.", status=409)
+        return wrapper
+    return decorator
+
+
+def purge(now=None):
+    """Xoá khoá cũ. Trả về số dòng đã xoá."""
+    now = now or timezone.now()
+    cutoff = now - timedelta(hours=getattr(settings, "GLAMUP_IDEMPOTENCY_TTL_HOURS", 24))
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
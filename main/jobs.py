@@ -0,0 +1,134 @@
+# main/jobs.py
+"""
+Hàng đợi việc chạy nền lưu trong DB (bảng Job), không cần broker ngoài.
+
+    @job("loyalty.award")
+    def award(appointment_id): ...
+
+    enqueue("loyalty.award", appointment_id=12)               # chạy ngay khi worker rảnh
+    enqueue("loyalty.award", appointment_id=12, delay=60)     # hẹn sau 60 giây
+
+Worker: manage.py run_workers. Các hàm @job đăng ký trong main/tasks.py.
+Claim bằng UPDATE ... WHERE status='QUEUED' (chạy được cả SQLite lẫn PostgreSQL):
+chỉ worker nào UPDATE trúng 1 dòng mới được chạy job đó.
+"""
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+RETRY_BASE_SECONDS = 30
+LOCK_TIMEOUT = timedelta(minutes=15)  # worker chết khi đang chạy -> job được nhận lại
+
+_registry = {}
+_atomic = {}
+
+
+def job(name, atomic=True):
+    """
+    Decorator đăng ký hàm chạy nền theo tên.
+    atomic=False: không bọc cả job trong 1 transaction (job tự commit từng phần, vd. gửi email qua SMTP
+    -> không giữ khoá ghi của DB suốt phiên SMTP, rollback cũng không làm gửi lại mail đã đi).
+    """
+    def decorator(fn):
+        _registry[name] = fn
+        _atomic[name] = atomic
+        return fn
+    return decorator
+
+
+def registered():
+    return dict(_registry)
+
+
+def enqueue(name, *, delay=None, run_at=None, max_attempts=5, unique=False, **payload):
+    """
+    Thêm 1 job. Gọi trong transaction thì job chỉ hiện ra với worker sau khi commit.
+    unique=True: đã có job cùng tên + payload còn QUEUED (chưa worker nào nhận) thì dùng lại job đó.
+    Job đang RUNNING không tính: nó có thể đã đọc dữ liệu cũ.
+    """
+    if unique:
+        pending = Job.objects.filter(
+            name=name, status=Job.Status.QUEUED, **{f"payload__{k}": v for k, v in payload.items()},
+        ).order_by("pk").first()
+        if pending is not None:
+            return pending
+    if run_at is None:
+        run_at = timezone.now() + timedelta(seconds=delay or 0)
+    return Job.objects.create(name=name, payload=payload, run_at=run_at, max_attempts=max_attempts)
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def claim(worker, names=None):
+    """Nhận 1 job tới hạn (hoặc RUNNING quá hạn khoá). Trả về Job hoặc None."""
+    now = timezone.now()
+    due = (
+        Q(status=Job.Status.QUEUED, run_at__lte=now)
+        | Q(status=Job.Status.RUNNING, locked_at__lt=now - LOCK_TIMEOUT)
+    )
+    qs = Job.objects.filter(due)
+    if names:
+        qs = qs.filter(name__in=names)
+    for pk in qs.order_by("run_at", "pk").values_list("pk", flat=True)[:10]:
+        # thắng cuộc nếu UPDATE đổi đúng 1 dòng; thua thì thử job kế
+        won = Job.objects.filter(due, pk=pk).update(
+            status=Job.Status.RUNNING, locked_by=worker, locked_at=now, attempts=F("attempts") + 1,
+        )
+        if won:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def run(job_obj):
+    """Chạy 1 job đã claim; lỗi thì hẹn lại (backoff 30s, 60s, 120s, ...) hoặc chuyển DEAD."""
+    fn = _registry.get(job_obj.name)
+    try:
+        if fn is None:
+            raise LookupError(f"No job registered as {job_obj.name!r}")
+        if _atomic.get(job_obj.name, True):
+            with transaction.atomic():
+                fn(**job_obj.payload)
+        else:
+            fn(**job_obj.payload)
+    except Exception as e:
+        logger.exception("Job %s (%s) failed", job_obj.pk, job_obj.name)
+        fields = {"last_error": f"{type(e).__name__}: {e}"[:2000], "locked_by": "", "locked_at": None}
+        if job_obj.attempts >= job_obj.max_attempts:
+            fields.update(status=Job.Status.DEAD, finished_at=timezone.now())
+        else:
+            delay = RETRY_BASE_SECONDS * 2 ** (job_obj.attempts - 1)
+            fields.update(status=Job.Status.QUEUED, run_at=timezone.now() + timedelta(seconds=delay))
+        Job.objects.filter(pk=job_obj.pk, locked_by=job_obj.locked_by).update(**fields)
+        return False
+
+    Job.objects.filter(pk=job_obj.pk, locked_by=job_obj.locked_by).update(
+        status=Job.Status.DONE, finished_at=timezone.now(), locked_at=None,
+    )
+    return True
+
+
+def run_pending(worker=None, names=None, limit=None):
+    """Chạy các job tới hạn cho tới khi hết (hoặc đủ `limit`). Trả về (số thành công, số lỗi)."""
+    worker = worker or worker_id()
+    ok = failed = 0
+    while limit is None or ok + failed < limit:
+        job_obj = claim(worker, names)
+        if job_obj is None:
+            break
+        if run(job_obj):
+            ok += 1
+        else:
+            failed += 1
+    return ok, failed
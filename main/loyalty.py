@@ -0,0 +1,127 @@
+# main/loyalty.py
+"""
+Sổ điểm loyalty: mọi thay đổi điểm đi qua apply() (earn / use / adjust).
+
+  - 1 transaction: khoá dòng LoyaltyPoints (select_for_update), cộng/trừ bằng F() và
+    UPDATE có điều kiện current_points >= số điểm trừ -> 2 request cùng lúc không mất / tiêu trùng điểm
+  - balance_after đọc lại từ chính dòng vừa khoá
+  - dòng LoyaltyPoints chỉ được tạo ở lần ghi đầu tiên; trang chỉ đọc dùng balance() (không INSERT)
+Cộng điểm khi checkout chạy nền qua job "loyalty.award" (main/tasks.py).
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Appointment, LoyaltyPoints, LoyaltyTransaction
+
+MIN_REDEEM_POINTS = 100
+POINT_STEP = 10          # dùng điểm theo bội số 10
+VND_PER_STEP = 1000      # 10 điểm = 1.000đ
+
+
+class InsufficientPoints(Exception):
+    pass
+
+
+def balance(customer):
+    """Chỉ đọc: số dư của khách, chưa có dòng thì trả object rỗng chưa lưu."""
+    lp = LoyaltyPoints.objects.filter(customer=customer).first()
+    return lp or LoyaltyPoints(customer=customer)
+
+
+def _locked(customer_id, create):
+    """Dòng LoyaltyPoints đã select_for_update (tạo nếu create=True). Gọi trong transaction."""
+    lp = LoyaltyPoints.objects.select_for_update().filter(customer_id=customer_id).first()
+    if lp is None and create:
+        try:
+            with transaction.atomic():
+                LoyaltyPoints.objects.create(customer_id=customer_id)
+        except IntegrityError:
+            pass  # request khác vừa tạo
+        lp = LoyaltyPoints.objects.select_for_update().get(customer_id=customer_id)
+    return lp
+
+
+def apply(customer, points, type, *, appointment=None, description=""):
+    """
+    Ghi 1 giao dịch điểm (points > 0 cộng, < 0 trừ). Trả về LoyaltyTransaction.
+    Trừ quá số dư -> InsufficientPoints, không ghi gì.
+    """
+    customer_id = getattr(customer, "pk", customer)
+    with transaction.atomic():
+        lp = _locked(customer_id, create=points > 0)
+        if lp is None:
+            raise InsufficientPoints(f"Customer {customer_id} has no points.")
+
+        changes = {"current_points": F("current_points") + points, "last_updated": timezone.now()}
+        if type == LoyaltyTransaction.Type.EARN:
+            changes["points_earned"] = F("points_earned") + points
+        elif type == LoyaltyTransaction.Type.USE:
+            changes["points_used"] = F("points_used") - points
+
+        qs = LoyaltyPoints.objects.filter(pk=lp.pk)
+        if points < 0:
+            qs = qs.filter(current_points__gte=-points)
+        if not qs.update(**changes):
+            raise InsufficientPoints(f"Customer {customer_id} has fewer than {-points} points.")
+
+        balance_after = LoyaltyPoints.objects.filter(pk=lp.pk).values_list("current_points", flat=True).get()
+        return LoyaltyTransaction.objects.create(
+            customer_id=customer_id,
+            appointment=appointment,
+            type=type,
+            points=points,
+            balance_after=balance_after,
+            description=description,
+        )
+
+
+def redeemable(points):
+    """(số điểm dùng được, số tiền giảm) theo quy tắc: tối thiểu 100 điểm, bội số 10, 10 điểm = 1.000đ."""
+    usable = (points // POINT_STEP) * POINT_STEP
+    if usable < MIN_REDEEM_POINTS:
+        return 0, 0
+    return usable, (usable // POINT_STEP) * VND_PER_STEP
+
+
+def redeem_for_appointment(appt):
+    """
+    Dùng toàn bộ điểm hiện có cho lịch appt (khi thanh toán). Số điểm tính từ dòng đã khoá,
+    không phải từ số hiển thị lúc mở trang. Trả về (points_used, discount_vnd).
+    """
+    with transaction.atomic():
+        lp = _locked(appt.customer_id, create=False)
+        points_used, discount_vnd = redeemable(lp.current_points if lp else 0)
+        if not points_used:
+            return 0, 0
+        apply(
+            appt.customer_id, -points_used, LoyaltyTransaction.Type.USE, appointment=appt,
+            description=f"Redeemed {points_used} points for a {discount_vnd:,} VND for booking BK{appt.id:06d}",
+        )
+    return points_used, discount_vnd
+
+
+def award_for_appointment(appt):
+    """
+    Cộng điểm loyalty cho lịch hẹn đã hoàn tất nếu:
+    - Có customer
+    - Chưa cộng trước đó (loyalty_awarded = False, đánh dấu bằng UPDATE có điều kiện)
+    Quy tắc demo: 1 điểm cho mỗi 10.000đ của tổng tiền.
+    """
+    if not appt.customer_id:
+        return
+
+    total = int(appt.total_price or 0)
+    # Quy tắc tích điểm: 1 điểm / 10.000₫ (bạn muốn thì đổi lại)
+    pts = total // 10000
+    if pts <= 0:
+        return
+
+    with transaction.atomic():
+        if not Appointment.objects.filter(pk=appt.pk, loyalty_awarded=False).update(loyalty_awarded=True):
+            return
+        appt.loyalty_awarded = True
+        apply(
+            appt.customer_id, pts, LoyaltyTransaction.Type.EARN, appointment=appt,
+            description=f"Tích {pts} điểm cho lịch {f'BK{appt.id:06d}'}",
+        )
@@ -0,0 +1,83 @@
+# main/management/commands/bench_assignment.py
+import random
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from main.assignment import capacity, pack
+from main.availability import SLOT_TIMES, DayAvailability, to_minute
+from main.models import StaffSchedule
+
+DURATIONS = [30, 45, 60, 60, 90, 120]
+
+
+class Command(BaseCommand):
+    help = (
+        "Synthetic benchmark (no database): book random requests into one day the way book_now does "
+        "(least-loaded free technician), then re-pack them with main.assignment.pack and report solver time, "
+        "recovered capacity and how many rejected requests would fit afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bookings", type=int, nargs="+", default=[100, 300, 600],
+                            help="Booking requests per simulated day (default 100 300 600).")
+        parser.add_argument("--staff", type=int, default=0, help="Technicians on shift (default: bookings / 8).")
+        parser.add_argument("--probe", type=int, default=60, help="Booking length used to measure capacity.")
+        parser.add_argument("--repeat", type=int, default=5, help="Solver runs to time (best is reported).")
+        parser.add_argument("--seed", type=int, default=1)
+
+    def _greedy(self, shift_staff, requests):
+        """Giống book_now: KTV rảnh ít phút bận nhất; không ai rảnh thì từ chối."""
+        busy, accepted, rejected = {}, [], []
+        for key, (t, duration) in enumerate(requests):
+            index = DayAvailability(None, None, shift_staff, busy)
+            free = index.free_staff(t, duration)
+            if not free:
+                rejected.append((t, duration))
+                continue
+            sid = min(free, key=index.load_minutes)
+            start = to_minute(t)
+            busy.setdefault(sid, []).append((start, start + duration))
+            accepted.append((key, start, start + duration, sid))
+        return busy, accepted, rejected
+
+    def handle(self, *args, **opts):
+        rng = random.Random(opts["seed"])
+        self.stdout.write(f"{'bookings':>8} {'staff':>5} {'accepted':>8} {'moved':>5} {'solve ms':>9} "
+                          f"{'capacity':>15} {'refilled':>8}")
+        for n in opts["bookings"]:
+            n_staff = opts["staff"] or max(2, n // 8)
+            staff = list(range(1, n_staff + 1))
+            shift_staff = {StaffSchedule.Shift.MORNING: staff, StaffSchedule.Shift.AFTERNOON: staff}
+            requests = [(rng.choice(SLOT_TIMES), rng.choice(DURATIONS)) for _ in range(n)]
+
+            busy, jobs, rejected = self._greedy(shift_staff, requests)
+            best = None
+            for _ in range(max(1, opts["repeat"])):
+                t0 = perf_counter()
+                plan = pack(jobs, shift_staff, {})
+                elapsed = perf_counter() - t0
+                best = elapsed if best is None else min(best, elapsed)
+            plan = plan or {key: sid for key, _, _, sid in jobs}
+            moved = sum(1 for key, _, _, sid in jobs if plan[key] != sid)
+
+            packed = {}
+            for key, start, end, _ in jobs:
+                packed.setdefault(plan[key], []).append((start, end))
+            before, _ = capacity(shift_staff, busy, opts["probe"])
+            after, _ = capacity(shift_staff, packed, opts["probe"])
+
+            # các yêu cầu bị từ chối lúc đầu giờ có chỗ hay không sau khi xếp lại
+            refilled = 0
+            for t, duration in rejected:
+                index = DayAvailability(None, None, shift_staff, packed)
+                free = index.free_staff(t, duration)
+                if free:
+                    start = to_minute(t)
+                    packed.setdefault(free[0], []).append((start, start + duration))
+                    refilled += 1
+
+            self.stdout.write(
+                f"{n:>8} {n_staff:>5} {len(jobs):>8} {moved:>5} {best * 1000:>9.2f} "
+                f"{f'{before} → {after}':>15} {f'{refilled}/{len(rejected)}':>8}"
+            )
@@ -0,0 +1,125 @@
+# main/management/commands/bench_booking_contention.py
+import random
+import threading
+from collections import Counter
+from datetime import date
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from main.availability import BUSY_STATUSES, SLOT_TIMES, DayAvailability, to_minute
+from main.booking import create_booking
+from main.models import Appointment, AppointmentStaff, Branch, Service, User
+
+BENCH_NOTE = "bench_booking_contention"
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire many simultaneous bookings at one branch/day from several threads (same path as book_now: "
+        "create Appointment + reserve StaffSlot in one transaction), then check that no technician is "
+        "double-booked. Created appointments are deleted afterwards. Use PostgreSQL/MySQL for real numbers; "
+        "SQLite serialises writers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--branch", type=int, required=True, help="Branch id (needs APPROVED shifts on --date).")
+        parser.add_argument("--date", required=True, help="Day to book (YYYY-MM-DD).")
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--bookings", type=int, default=400, help="Total booking attempts.")
+        parser.add_argument("--duration", type=int, help="Minutes per booking (default: the service duration).")
+        parser.add_argument("--keep", action="store_true", help="Keep the created appointments.")
+
+    def _book(self, customer, branch_id, day, start_time, service, duration):
+        """Giống book_now: chọn KTV theo chỉ mục rảnh, giữ chỗ trong sổ, trượt sang người kế nếu trùng."""
+        day_index = DayAvailability.load(branch_id, day)
+        candidates = sorted(day_index.free_staff(start_time, duration), key=day_index.load_minutes)
+        if not candidates:
+            return "full"
+        _, staff_id = create_booking(
+            customer, branch_id, day, start_time, service, candidates, note=BENCH_NOTE, duration=duration,
+        )
+        if staff_id is None:
+            return "conflict"
+        return "booked" if staff_id == candidates[0] else "fallthrough"
+
+    def handle(self, *args, **opts):
+        try:
+            day = date.fromisoformat(opts["date"])
+        except ValueError as e:
+            raise CommandError(f"Invalid date: {e}")
+        branch = Branch.objects.filter(pk=opts["branch"]).first()
+        if not branch:
+            raise CommandError("Branch not found.")
+        customer = User.objects.filter(role=User.Role.CUSTOMER).first()
+        if not customer:
+            raise CommandError("Need at least one customer user.")
+        service = Service.objects.filter(is_active=True).order_by("pk").first()
+        if not service:
+            raise CommandError("Need at least one active service.")
+        duration = opts["duration"] or service.duration
+
+        per_thread = max(1, opts["bookings"] // max(1, opts["threads"]))
+        results = Counter()
+        lock = threading.Lock()
+        barrier = threading.Barrier(opts["threads"])
+
+        def worker(seed):
+            rng = random.Random(seed)
+            local = Counter()
+            barrier.wait()
+            try:
+                for _ in range(per_thread):
+                    try:
+                        local[self._book(customer, branch.pk, day, rng.choice(SLOT_TIMES), service, duration)] += 1
+                    except OperationalError:
+                        # SQLite: "database is locked"
+                        local["db_locked"] += 1
+            finally:
+                connection.close()
+                with lock:
+                    results.update(local)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(opts["threads"])]
+        t0 = perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = perf_counter() - t0
+
+        overlaps = self._count_overlaps(day)
+        attempts = sum(results.values())
+        self.stdout.write(f"{connection.vendor}: {opts['threads']} thread(s), {attempts} attempt(s) in {elapsed:.2f}s "
+                          f"({attempts / elapsed:.0f} req/s)")
+        for k in ("booked", "fallthrough", "conflict", "full", "db_locked"):
+            self.stdout.write(f"  {k:<12} {results[k]}")
+
+        if not opts["keep"]:
+            Appointment.objects.filter(note=BENCH_NOTE, appointment_date=day).delete()
+
+        if overlaps:
+            raise CommandError(f"{overlaps} overlapping booking pair(s) found!")
+        self.stdout.write(self.style.SUCCESS("✓ No technician was double-booked."))
+
+    def _count_overlaps(self, day):
+        """Đếm cặp lịch bận chồng giờ của cùng 1 KTV trong ngày (tính trên bảng Appointment, không dựa vào sổ)."""
+        rows = (
+            AppointmentStaff.objects
+            .filter(appointment__appointment_date=day, appointment__status__in=BUSY_STATUSES)
+            .values_list("staff_id", "appointment__appointment_time", "appointment__duration_minutes")
+        )
+        by_staff = {}
+        for sid, t, dur in rows:
+            start = to_minute(t)
+            by_staff.setdefault(sid, []).append((start, start + dur))
+        overlaps = 0
+        for intervals in by_staff.values():
+            intervals.sort()
+            max_end = -1
+            for start, end in intervals:
+                if start < max_end:
+                    overlaps += 1
+                max_end = max(max_end, end)
+        return overlaps
@@ -0,0 +1,114 @@
+# main/management/commands/bench_dashboard.py
+from datetime import date
+from decimal import Decimal
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.db.models import Count, Max, Min, Sum
+
+from main.models import Appointment, AppointmentService, DailyBranchServiceStats, Payment
+from main.stats import service_lines
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the admin dashboard revenue/popular-service rankings on the current database: "
+        "old Python loop vs grouped SQL vs DailyBranchServiceStats rollup."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", help="First day (YYYY-MM-DD). Default: earliest appointment.")
+        parser.add_argument("--to", dest="date_to", help="Last day (YYYY-MM-DD). Default: latest appointment.")
+        parser.add_argument("--branch", type=int, help="Only the given branch id.")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per variant, best time is reported.")
+        parser.add_argument("--skip-legacy", action="store_true", help="Skip the old Python loop (slow on big data).")
+
+    # ---- các cách tính ------------------------------------------------------
+    def _legacy(self, date_from, date_to, branch_id):
+        """Cách cũ: load toàn bộ line của lịch PAID rồi cộng dồn trong Python."""
+        appt_qs = Appointment.objects.filter(appointment_date__range=(date_from, date_to))
+        if branch_id:
+            appt_qs = appt_qs.filter(branch_id=branch_id)
+        appt_qs = appt_qs.exclude(status=Appointment.Status.CANCELED)
+        paid_ids = (
+            Payment.objects.filter(appointment__in=appt_qs, status=Payment.Status.PAID)
+            .values_list("appointment_id", flat=True).distinct()
+        )
+        rev_map, pop_map = {}, {}
+        for line in AppointmentService.objects.filter(appointment_id__in=paid_ids).select_related("service"):
+            name = line.service.service_name
+            rev_map[name] = rev_map.get(name, Decimal("0")) + line.line_total
+            pop_map[name] = pop_map.get(name, 0) + 1
+        top = lambda m: sorted(m.items(), key=lambda x: x[1], reverse=True)[:6]
+        return top(rev_map), top(pop_map)
+
+    def _sql(self, date_from, date_to, branch_id):
+        """Tính thẳng trên bảng giao dịch: 1 câu GROUP BY ... LIMIT cho mỗi bảng xếp hạng."""
+        paid = (
+            service_lines(date_from, date_to, branch_id)
+            .filter(is_paid=True)
+            .values("service__service_name")
+            .annotate(revenue=Sum("line_total"), lines=Count("id"))
+        )
+        return (
+            [(r["service__service_name"], r["revenue"]) for r in paid.order_by("-revenue")[:6]],
+            [(r["service__service_name"], r["lines"]) for r in paid.order_by("-lines")[:6]],
+        )
+
+    def _rollup(self, date_from, date_to, branch_id):
+        qs = DailyBranchServiceStats.objects.filter(
+            date__range=(date_from, date_to), service__isnull=False, paid_lines__gt=0
+        )
+        if branch_id:
+            qs = qs.filter(branch_id=branch_id)
+        qs = qs.values("service__service_name")
+        rev = qs.annotate(v=Sum("paid_revenue")).order_by("-v")[:6]
+        pop = qs.annotate(v=Sum("paid_lines")).order_by("-v")[:6]
+        return (
+            [(r["service__service_name"], r["v"]) for r in rev],
+            [(r["service__service_name"], r["v"]) for r in pop],
+        )
+
+    def _time(self, fn, args, repeat):
+        best, result = None, None
+        for _ in range(max(1, repeat)):
+            reset_queries()
+            t0 = perf_counter()
+            result = fn(*args)
+            elapsed = perf_counter() - t0
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def handle(self, *args, **options):
+        bounds = Appointment.objects.aggregate(first=Min("appointment_date"), last=Max("appointment_date"))
+        try:
+            date_from = date.fromisoformat(options["date_from"]) if options["date_from"] else bounds["first"]
+            date_to = date.fromisoformat(options["date_to"]) if options["date_to"] else bounds["last"]
+        except ValueError as e:
+            raise CommandError(f"Invalid date: {e}")
+        if not date_from or not date_to:
+            raise CommandError("No appointments to benchmark (seed data first).")
+
+        scope = (date_from, date_to, options.get("branch"))
+        lines = AppointmentService.objects.filter(
+            appointment__appointment_date__range=(date_from, date_to)
+        ).count()
+        self.stdout.write(f"{connection.vendor}: {lines} service line(s), {date_from} → {date_to}")
+
+        variants = [("grouped SQL", self._sql), ("rollup", self._rollup)]
+        if not options["skip_legacy"]:
+            variants.insert(0, ("python loop", self._legacy))
+
+        results = {}
+        for label, fn in variants:
+            elapsed, results[label] = self._time(fn, scope, options["repeat"])
+            self.stdout.write(f"  {label:<12} {elapsed * 1000:10.1f} ms")
+
+        # so sánh kết quả giữa các cách (rollup có thể lệch nếu chưa rebuild_daily_stats)
+        same = lambda a, b: all(dict(x) == dict(y) for x, y in zip(a, b))
+        ref = results.get("python loop")
+        if ref is not None and not same(results["grouped SQL"], ref):
+            self.stdout.write(self.style.WARNING("  ! grouped SQL ranking differs from python loop"))
+        if not same(results["rollup"], results["grouped SQL"]):
+            self.stdout.write(self.style.WARNING("  ! rollup differs from raw tables — run rebuild_daily_stats"))
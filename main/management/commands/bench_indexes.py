@@ -0,0 +1,215 @@
+# main/management/commands/bench_indexes.py
+from datetime import timedelta
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from main.models import (
+    Appointment, ContactMessage, LoyaltyTransaction, Payment, Review, StaffSchedule, User,
+)
+
+# các index của migration 0021_query_index_pack (tên trong Meta.indexes)
+INDEX_PACK = [
+    (Appointment, "appt_customer_status_date"),
+    (StaffSchedule, "sched_date_shift_status_br"),
+    (Review, "review_service_status_date"),
+    (Payment, "payment_appt_status"),
+    (LoyaltyTransaction, "loyaltytx_customer_created"),
+    (ContactMessage, "contact_status_created"),
+    (User, "user_email_upper"),
+]
+
+# Meta.ordering đã bỏ ở 0021 -> "before" thêm lại order_by cũ cho các câu không tự sắp xếp
+OLD_SCHEDULE_ORDER = ("-work_date",)
+
+
+def _has_table(model):
+    return model._meta.db_table in connection.introspection.table_names()
+
+
+def _index(model, name):
+    for index in model._meta.indexes:
+        if index.name == name:
+            return index
+    raise CommandError(f"{model.__name__} has no index {name!r} (run migrate first).")
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the query shapes behind the hot views (my_appointments, login, service_detail, staff_inbox, ...) "
+        "with the composite index pack and again with those indexes dropped. Run it on a benchmark copy: "
+        "the indexes are dropped and re-created."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5, help="Runs per query shape, best time is reported.")
+        parser.add_argument("--skip-before", action="store_true", help="Only time the current schema (no DDL).")
+
+    # ---- tham số mẫu ------------------------------------------------------
+    def _sample(self):
+        """Khách có nhiều lịch nhất + 1 lịch / dịch vụ / ca có dữ liệu (đọc theo pk, không ORDER BY RANDOM)."""
+        last_id = Appointment.objects.aggregate(m=Max("pk"))["m"]
+        if not last_id:
+            raise CommandError("No appointments to benchmark (seed data first).")
+        appt = Appointment.objects.filter(pk__gte=last_id // 2).order_by("pk").first()
+        busiest = (
+            Appointment.objects.values("customer_id").annotate(n=Count("pk")).order_by("-n")
+            .values_list("customer_id", flat=True).first()
+        )
+        sched = StaffSchedule.objects.filter(status=StaffSchedule.Status.APPROVED).order_by("pk").first()
+        review = Review.objects.order_by("pk").first()
+        customer = User.objects.filter(pk=busiest).first()
+        return {
+            "customer_id": busiest,
+            "email": (customer.email if customer and customer.email else "nobody@example.com").upper(),
+            "appointment_id": appt.pk,
+            "service_id": review.service_id if review else None,
+            "work_date": sched.work_date if sched else appt.appointment_date,
+            "shift": sched.shift if sched else StaffSchedule.Shift.MORNING,
+            "branch_id": sched.branch_id if sched else appt.branch_id,
+            "today": timezone.localdate(),
+        }
+
+    # ---- các câu query giống view (before=True: thêm lại ordering mặc định cũ) ----
+    def _shapes(self, p):
+        def my_appointments(before):
+            return list(
+                Appointment.objects
+                .filter(
+                    customer_id=p["customer_id"],
+                    status__in=[Appointment.Status.CONFIRMED, Appointment.Status.IN_PROGRESS],
+                    appointment_date__gte=p["today"],
+                )
+                .order_by("appointment_date", "appointment_time")
+                .values_list("pk", flat=True)
+            )
+
+        def customer_history(before):
+            return list(
+                Appointment.objects
+                .filter(customer_id=p["customer_id"], status=Appointment.Status.DONE)
+                .order_by("-appointment_date", "-appointment_time")
+                .values_list("pk", flat=True)[:20]
+            )
+
+        def login_email(before):
+            return User.objects.filter(email__iexact=p["email"]).values_list("pk", flat=True).first()
+
+        def shift_staff(before):
+            qs = StaffSchedule.objects.filter(
+                work_date=p["work_date"], shift=p["shift"],
+                status=StaffSchedule.Status.APPROVED, branch_id=p["branch_id"],
+            )
+            if before:
+                qs = qs.order_by(*OLD_SCHEDULE_ORDER)
+            return list(qs.values_list("staff_id", flat=True))
+
+        def week_schedule(before):
+            qs = StaffSchedule.objects.filter(
+                work_date__range=(p["work_date"], p["work_date"] + timedelta(days=6)),
+                status=StaffSchedule.Status.APPROVED,
+            )
+            if before:
+                qs = qs.order_by(*OLD_SCHEDULE_ORDER)
+            return list(qs.values_list("staff_id", "work_date", "shift"))
+
+        def service_reviews(before):
+            return list(
+                Review.objects
+                .filter(service_id=p["service_id"], status=Review.Status.PUBLISHED)
+                .order_by("-review_date")
+                .values_list("pk", flat=True)[:10]
+            )
+
+        def payment_paid(before):
+            return Payment.objects.filter(appointment_id=p["appointment_id"], status=Payment.Status.PAID).exists()
+
+        def loyalty_history(before):
+            return list(
+                LoyaltyTransaction.objects
+                .filter(customer_id=p["customer_id"])
+                .order_by("-created_at")
+                .values_list("pk", flat=True)[:50]
+            )
+
+        def staff_inbox(before):
+            return list(
+                ContactMessage.objects
+                .filter(status=ContactMessage.Status.NEW)
+                .order_by("-created_at")
+                .values_list("pk", flat=True)[:50]
+            )
+
+        shapes = [
+            ("my_appointments", my_appointments),
+            ("customer history", customer_history),
+            ("login (email)", login_email),
+            ("shift staff", shift_staff),
+            ("week schedule", week_schedule),
+            ("payment_paid", payment_paid),
+            ("loyalty_history", loyalty_history),
+        ]
+        if _has_table(ContactMessage):
+            shapes.append(("staff_inbox", staff_inbox))
+        if p["service_id"]:
+            shapes.insert(5, ("service_detail", service_reviews))
+        return shapes
+
+    def _time(self, fn, before, repeat):
+        best = None
+        for _ in range(max(1, repeat)):
+            t0 = perf_counter()
+            fn(before)
+            elapsed = perf_counter() - t0
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def _run_all(self, shapes, before, repeat):
+        return {label: self._time(fn, before, repeat) for label, fn in shapes}
+
+    def _drop_pack(self):
+        """DROP các index trong pack (ngoài transaction; bảng chưa có thì bỏ qua)."""
+        dropped = []
+        with connection.schema_editor(atomic=False) as editor:
+            for model, name in INDEX_PACK:
+                if not _has_table(model):
+                    continue
+                index = _index(model, name)
+                editor.remove_index(model, index)
+                dropped.append((model, index))
+        return dropped
+
+    def _restore(self, dropped):
+        with connection.schema_editor(atomic=False) as editor:
+            for model, index in dropped:
+                editor.add_index(model, index)
+
+    def handle(self, *args, **options):
+        p = self._sample()
+        shapes = self._shapes(p)
+        repeat = options["repeat"]
+        self.stdout.write(
+            f"{connection.vendor}: {Appointment.objects.count()} appointment(s), "
+            f"customer #{p['customer_id']}, branch #{p['branch_id']} {p['work_date']} {p['shift']}"
+        )
+
+        after = self._run_all(shapes, False, repeat)
+        before = None
+        if not options["skip_before"]:
+            dropped = self._drop_pack()
+            try:
+                before = self._run_all(shapes, True, repeat)
+            finally:
+                self._restore(dropped)
+
+        self.stdout.write(f"  {'query':<18} {'before':>10} {'after':>10} {'speedup':>8}")
+        for label, _ in shapes:
+            a = after[label] * 1000
+            if before is None:
+                self.stdout.write(f"  {label:<18} {'-':>10} {a:8.2f}ms {'-':>8}")
+                continue
+            b = before[label] * 1000
+            self.stdout.write(f"  {label:<18} {b:8.2f}ms {a:8.2f}ms {b / a if a else 0:7.1f}x")
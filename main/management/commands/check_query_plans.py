@@ -0,0 +1,278 @@
+# main/management/commands/check_query_plans.py
+import json
+import re
+from datetime import time as dtime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from main import loyalty
+from main.models import (
+    Appointment, AppointmentService, AppointmentStaff, Branch, LoyaltyTransaction, Payment, Review, Service,
+    StaffSchedule, User,
+)
+from main.stats import rebuild_daily_stats
+
+SNAPSHOT_DIR = Path(__file__).resolve().parents[2] / "query_plans"
+
+# SCAN mới trên các bảng này = lỗi (lookup có index bị biến thành quét cả bảng)
+GUARDED_TABLES = {
+    m._meta.db_table for m in (Appointment, AppointmentService, AppointmentStaff, Review, Payment)
+}
+
+EXPLAINED = ("SELECT", "WITH", "UPDATE", "DELETE")
+# alias Django đặt cho bảng trong subquery / join: "main_payment" U0, "main_user" T3 ...
+ALIAS_RE = re.compile(r'(?:FROM|JOIN)\s+"(\w+)"\s+(?:AS\s+)?"?([A-Z]\d+)"?')
+SUBQUERY_NO_RE = re.compile(r"\b(SUBQUERY|CO-ROUTINE|MATERIALIZE) \d+")
+
+
+# ---- EXPLAIN theo từng DB -------------------------------------------------------
+def _sqlite_index_tables(cursor):
+    cursor.execute("SELECT name, tbl_name FROM sqlite_master WHERE type = 'index'")
+    return dict(cursor.fetchall())
+
+
+def _sqlite_plan(cursor, sql):
+    # nhiều subquery cùng dùng alias U0 -> đoán bảng theo index trong dòng plan, không được thì ghi "a|b"
+    aliases = {}
+    for table, alias in ALIAS_RE.findall(sql):
+        aliases.setdefault(alias, set()).add(table)
+    index_tables = _sqlite_index_tables(cursor)
+    cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+    lines = []
+    for row in cursor.fetchall():
+        detail = row[-1].replace("SCAN TABLE ", "SCAN ").replace("SEARCH TABLE ", "SEARCH ")
+        detail = SUBQUERY_NO_RE.sub(r"\1", detail)
+        m = re.search(r"INDEX (\w+)", detail)
+        via_index = index_tables.get(m.group(1)) if m else None
+
+        def table_of(match):
+            tables = aliases.get(match.group(0))
+            if not tables:
+                return match.group(0)
+            if via_index in tables:
+                return via_index
+            return "|".join(sorted(tables))
+
+        lines.append(re.sub(r"\b[A-Z]\d+\b", table_of, detail))
+    return lines
+
+
+def _sqlite_is_scan(line):
+    m = re.match(r"SCAN ([\w|]+)", line)
+    return bool(m) and bool(GUARDED_TABLES & set(m.group(1).split("|")))
+
+
+def _postgres_plan(cursor, sql):
+    cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+    data = cursor.fetchone()[0]
+    if isinstance(data, str):
+        data = json.loads(data)
+    lines = []
+
+    def walk(node):
+        if node.get("Relation Name"):
+            line = f"{node['Node Type']} on {node['Relation Name']}"
+            if node.get("Index Name"):
+                line += f" using {node['Index Name']}"
+            lines.append(line)
+        for child in node.get("Plans", ()):
+            walk(child)
+
+    walk(data[0]["Plan"])
+    return lines
+
+
+def _postgres_is_scan(line):
+    m = re.match(r"Seq Scan on (\w+)", line)
+    return bool(m) and m.group(1) in GUARDED_TABLES
+
+
+BACKENDS = {
+    "sqlite": (_sqlite_plan, _sqlite_is_scan),
+    "postgresql": (_postgres_plan, _postgres_is_scan),
+}
+
+
+# ---- dữ liệu mẫu (rollback khi xong) --------------------------------------------------
+def _fixture():
+    today = timezone.localdate()
+    day = today + timedelta(days=2)
+    branch = Branch.objects.create(name="Query plan branch", address="-")
+    svc = Service.objects.create(service_name="Query plan manicure", price=Decimal("150000"), duration=60)
+    Service.objects.create(service_name="Query plan pedicure", price=Decimal("200000"), duration=90)
+
+    techs = []
+    for i in range(3):
+        tech = User.objects.create_user(f"qp_tech{i}", password="x", role=User.Role.STAFF)
+        for shift in (StaffSchedule.Shift.MORNING, StaffSchedule.Shift.AFTERNOON):
+            for d in (today, day):
+                StaffSchedule.objects.create(
+                    staff=tech, work_date=d, shift=shift, status=StaffSchedule.Status.APPROVED, branch=branch,
+                )
+        techs.append(tech)
+    customer = User.objects.create_user("qp_customer", password="x", email="qp@example.com")
+    receptionist = User.objects.create_user("qp_receptionist", password="x", role=User.Role.STAFF)
+    receptionist.groups.add(Group.objects.get_or_create(name="Receptionist")[0])
+    admin = User.objects.create_superuser("qp_admin", "qp_admin@example.com", "x")
+
+    def appt(d, t, status, paid):
+        a = Appointment.objects.create(
+            customer=customer, branch=branch, appointment_date=d, appointment_time=t,
+            duration_minutes=60, status=status, total_price=svc.price,
+        )
+        AppointmentService.objects.create(appointment=a, service=svc, quantity=1, unit_price=svc.price)
+        AppointmentStaff.objects.create(appointment=a, staff=techs[0])
+        Payment.objects.create(
+            appointment=a, amount=svc.price, method=Payment.Method.CASH,
+            status=Payment.Status.PAID if paid else Payment.Status.UNPAID,
+        )
+        return a
+
+    appt(today, dtime(17, 0), Appointment.Status.CONFIRMED, False)
+    appt(day, dtime(9, 0), Appointment.Status.CONFIRMED, False)
+    done = appt(today - timedelta(days=3), dtime(10, 0), Appointment.Status.DONE, True)
+    Review.objects.create(
+        appointment=done, customer=customer, service=svc, rating=5, comment="-", status=Review.Status.PUBLISHED,
+    )
+    loyalty.apply(customer, 200, LoyaltyTransaction.Type.EARN, appointment=done)
+    # bảng gộp dashboard đã được worker tính sẵn (trạng thái bình thường)
+    rebuild_daily_stats(today - timedelta(days=31), day)
+    return {
+        "branch": branch, "service": svc, "day": day,
+        "customer": customer, "receptionist": receptionist, "admin": admin,
+    }
+
+
+def _cases(fx):
+    book = {
+        "service_id": fx["service"].id, "branch_id": fx["branch"].id, "date": fx["day"].isoformat(),
+        "time_slot": "10:00", "payment_method": "CASH",
+    }
+    return [
+        ("book_now GET", fx["customer"], "get", f"{reverse('main:book')}?service={fx['service'].slug}", None),
+        ("book_now POST", fx["customer"], "post", reverse("main:book"), book),
+        ("my_appointments", fx["customer"], "get", reverse("main:my_appointments"), None),
+        ("receptionist_dashboard", fx["receptionist"], "get", reverse("main:receptionist_dashboard"), None),
+        ("admin_dashboard", fx["admin"], "get", reverse("main:admin_dashboard"), None),
+    ]
+
+
+# ---- chạy / so sánh -----------------------------------------------------------------
+def capture_plans(explain):
+    """{nhãn view: [dòng plan đã sắp xếp]} (dữ liệu mẫu tạo trong transaction rồi rollback)."""
+    plans = {}
+    with transaction.atomic():
+        fx = _fixture()
+        for label, user, method, url, data in _cases(fx):
+            client = Client()
+            client.force_login(user)
+            with CaptureQueriesContext(connection) as ctx:
+                response = getattr(client, method)(url, data) if data else getattr(client, method)(url)
+            if response.status_code >= 400:
+                raise CommandError(f"{label}: HTTP {response.status_code}")
+            lines = set()
+            with connection.cursor() as cursor:
+                for q in ctx.captured_queries:
+                    sql = q["sql"].strip()
+                    if sql.upper().startswith(EXPLAINED):
+                        lines.update(explain(cursor, sql))
+            plans[label] = sorted(lines)
+        transaction.set_rollback(True)
+    return plans
+
+
+def compare_plans(plans, snapshot, is_scan):
+    """
+    So với snapshot. Trả về [(nhãn, dòng mới, dòng mất), ...] cho các view đổi plan
+    và [(nhãn, dòng), ...] các full scan mới trên GUARDED_TABLES.
+    """
+    changes, scans = [], []
+    for label, lines in plans.items():
+        known = set(snapshot.get(label, []))
+        added = [line for line in lines if line not in known]
+        removed = sorted(known - set(lines))
+        if added or removed:
+            changes.append((label, added, removed))
+            scans.extend((label, line) for line in added if is_scan(line))
+    return changes, scans
+
+
+def snapshot_path(vendor):
+    return SNAPSHOT_DIR / f"{vendor}.json"
+
+
+class Command(BaseCommand):
+    help = (
+        "Capture the ORM queries of the hot views (book_now, my_appointments, receptionist_dashboard, "
+        "admin_dashboard), EXPLAIN each one and compare the plans with the committed snapshot in "
+        "main/query_plans/<vendor>.json. A new full scan of an appointment / review / payment table fails. "
+        "The fixture data is created inside a transaction and rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--update", action="store_true", help="Rewrite the snapshot with the current plans.")
+        parser.add_argument("--strict", action="store_true", help="Fail on any plan change, not only new scans.")
+        parser.add_argument("--show", action="store_true", help="Print every plan line per view.")
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        if vendor not in BACKENDS:
+            raise CommandError(f"EXPLAIN snapshots are not supported on {vendor}.")
+        explain, is_scan = BACKENDS[vendor]
+        path = snapshot_path(vendor)
+
+        setup_test_environment()
+        try:
+            # cache giả: view luôn chạy query thật, không phụ thuộc cache đang có
+            with override_settings(
+                CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+                GLAMUP_CATALOG_CACHE="default",
+            ):
+                plans = capture_plans(explain)
+        finally:
+            teardown_test_environment()
+
+        if options["show"]:
+            for label, lines in plans.items():
+                self.stdout.write(label)
+                for line in lines:
+                    self.stdout.write(f"    {line}")
+
+        if options["update"]:
+            SNAPSHOT_DIR.mkdir(exist_ok=True)
+            path.write_text(json.dumps(plans, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+            self.stdout.write(self.style.SUCCESS(f"Wrote {path}"))
+            return
+
+        if not path.exists():
+            raise CommandError(f"No snapshot at {path} (run with --update first).")
+        snapshot = json.loads(path.read_text(encoding="utf-8"))
+
+        changes, scans = compare_plans(plans, snapshot, is_scan)
+        changed = {label: (added, removed) for label, added, removed in changes}
+        for label in plans:
+            if label not in changed:
+                self.stdout.write(f"  ok       {label}")
+                continue
+            added, removed = changed[label]
+            self.stdout.write(self.style.WARNING(f"  changed  {label}"))
+            for line in added:
+                self.stdout.write(f"    {'!' if is_scan(line) else '+'} {line}")
+            for line in removed:
+                self.stdout.write(f"    - {line}")
+
+        if scans:
+            raise CommandError(
+                "New full scan(s): " + "; ".join(f"{label}: {line}" for label, line in scans)
+            )
+        if changed and options["strict"]:
+            raise CommandError(f"{len(changed)} view(s) changed plan (run with --update if intended).")
+        self.stdout.write(self.style.SUCCESS(f"{len(plans)} view(s) checked, {len(changed)} changed, no new scans."))
@@ -0,0 +1,57 @@
+# main/management/commands/optimize_assignments.py
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from main.assignment import optimize_day
+from main.availability import DEFAULT_DURATION
+from main.models import Branch
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-pack technician assignments of not-yet-started appointments per branch/day to free up "
+        "contiguous time, respecting APPROVED shifts. Dry run unless --apply is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", help="First day (YYYY-MM-DD). Default: today.")
+        parser.add_argument("--days", type=int, default=1, help="Number of days from --date (default 1).")
+        parser.add_argument("--branch", type=int, help="Only the given branch id.")
+        parser.add_argument("--probe", type=int, default=DEFAULT_DURATION,
+                            help="Booking length (minutes) used to measure capacity (default 60).")
+        parser.add_argument("--apply", action="store_true", help="Write the new assignments.")
+
+    def handle(self, *args, **options):
+        try:
+            first = date.fromisoformat(options["date"]) if options["date"] else timezone.localdate()
+        except ValueError as e:
+            raise CommandError(f"Invalid date: {e}")
+        branches = Branch.objects.order_by("pk")
+        if options["branch"]:
+            branches = branches.filter(pk=options["branch"])
+            if not branches:
+                raise CommandError("Branch not found.")
+
+        gained = 0
+        for i in range(max(1, options["days"])):
+            day = first + timedelta(days=i)
+            for branch in branches:
+                r = optimize_day(branch.pk, day, apply=options["apply"], probe_minutes=options["probe"])
+                if not r["appointments"]:
+                    continue
+                delta = r["capacity_after"] - r["capacity_before"]
+                status = "applied" if r["applied"] else ("not applied" if options["apply"] and r["moved"] else "dry run")
+                self.stdout.write(
+                    f"{day} {branch.name}: {r['appointments']} appt(s), {r['moved']} reassigned, "
+                    f"capacity {r['capacity_before']} → {r['capacity_after']} ({delta:+d}), "
+                    f"open times {r['open_times_before']} → {r['open_times_after']} [{status}]"
+                )
+                if r["applied"] or not options["apply"]:
+                    gained += max(0, delta)
+
+        verb = "Recovered" if options["apply"] else "Could recover"
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {verb} {gained} bookable {options['probe']}-minute (time, technician) slot(s)."
+        ))
@@ -0,0 +1,44 @@
+# main/management/commands/rebuild_daily_stats.py
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from main.models import Appointment
+from main.stats import rebuild_daily_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the DailyBranchServiceStats rollup used by the admin dashboard."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", help="First day (YYYY-MM-DD). Default: earliest appointment.")
+        parser.add_argument("--to", dest="date_to", help="Last day (YYYY-MM-DD). Default: latest appointment.")
+        parser.add_argument("--branch", type=int, help="Only rebuild the given branch id.")
+        parser.add_argument("--days", type=int, default=31, help="Days per transaction (default 31).")
+
+    def handle(self, *args, **options):
+        bounds = Appointment.objects.aggregate(first=Min("appointment_date"), last=Max("appointment_date"))
+        try:
+            date_from = date.fromisoformat(options["date_from"]) if options["date_from"] else bounds["first"]
+            date_to = date.fromisoformat(options["date_to"]) if options["date_to"] else bounds["last"]
+        except ValueError as e:
+            raise CommandError(f"Invalid date: {e}")
+
+        if not date_from or not date_to:
+            date_from = date_to = timezone.localdate()
+        if date_from > date_to:
+            raise CommandError("--from must not be after --to")
+
+        step = max(1, options["days"])
+        written = 0
+        cur = date_from
+        while cur <= date_to:
+            end = min(date_to, cur + timedelta(days=step - 1))
+            written += rebuild_daily_stats(cur, end, options.get("branch"))
+            cur = end + timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Rebuilt {written} daily stats row(s) for {date_from} → {date_to}."
+        ))
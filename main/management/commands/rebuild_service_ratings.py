@@ -0,0 +1,23 @@
+# main/management/commands/rebuild_service_ratings.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main.ratings import rebuild_service_ratings
+
+
+class Command(BaseCommand):
+    help = "Recompute stored rating aggregates (count, sum, average, star histogram) for services from published reviews."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--service",
+            type=int,
+            action="append",
+            dest="service_ids",
+            help="Only rebuild the given service id (can be repeated).",
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        updated = rebuild_service_ratings(options.get("service_ids"))
+        self.stdout.write(self.style.SUCCESS(f"✓ Rebuilt rating aggregates for {updated} service(s)."))
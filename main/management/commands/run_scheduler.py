@@ -0,0 +1,27 @@
+# main/management/commands/run_scheduler.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.scheduler import tick
+
+
+class Command(BaseCommand):
+    help = (
+        "Time-based appointment housekeeping: day-before reminders, release of expired ONLINE slot holds "
+        "(GLAMUP_SLOT_HOLD_MINUTES), no-show flagging (GLAMUP_NO_SHOW_GRACE_MINUTES) and idempotency key purge. "
+        "Runs once, or every --interval seconds with --loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Keep running.")
+        parser.add_argument("--interval", type=float, default=60.0, help="Seconds between runs (--loop).")
+
+    def handle(self, *args, **opts):
+        while True:
+            result = tick()
+            if any(result.values()) or not opts["loop"]:
+                self.stdout.write(", ".join(f"{k}: {v}" for k, v in result.items()))
+            if not opts["loop"]:
+                break
+            time.sleep(opts["interval"])
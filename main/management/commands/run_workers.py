@@ -0,0 +1,59 @@
+# main/management/commands/run_workers.py
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from main.jobs import registered, run_pending, worker_id
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background jobs from the Job table with N worker threads. "
+        "Start several copies of this command for more processes; claims are atomic across all of them. "
+        "On SQLite keep --workers 1 (writers are serialised; failed jobs are retried anyway)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2, help="Worker threads in this process.")
+        parser.add_argument("--poll", type=float, default=2.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument("--once", action="store_true", help="Drain due jobs once and exit.")
+        parser.add_argument("--only", action="append", dest="names", help="Only run jobs with this name (repeatable).")
+
+    def handle(self, *args, **opts):
+        stop = threading.Event()
+        totals = {"ok": 0, "failed": 0}
+        lock = threading.Lock()
+
+        def loop():
+            me = worker_id()
+            try:
+                while not stop.is_set():
+                    ok, failed = run_pending(me, opts.get("names"))
+                    if ok or failed:
+                        with lock:
+                            totals["ok"] += ok
+                            totals["failed"] += failed
+                    if opts["once"]:
+                        break
+                    if not (ok or failed):
+                        stop.wait(opts["poll"])
+            finally:
+                connection.close()
+
+        if not opts["once"]:
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(sig, lambda *_: stop.set())
+            self.stdout.write(
+                f"Running {opts['workers']} worker(s) for: {', '.join(sorted(opts.get('names') or registered()))}"
+            )
+
+        threads = [threading.Thread(target=loop, daemon=True) for _ in range(max(1, opts["workers"]))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            while t.is_alive():
+                t.join(0.5)
+
+        self.stdout.write(self.style.SUCCESS(f"✓ Jobs finished: {totals['ok']} ok, {totals['failed']} failed."))
@@ -0,0 +1,451 @@
+# main/management/commands/seed_bulk.py
+import random
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import accumulate
+from time import perf_counter
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from main.availability import BUSY_STATUSES, SLOT_TIMES, shift_of, slot_range
+from main.models import (
+    Appointment, AppointmentService, AppointmentStaff, Branch, LoyaltyPoints, LoyaltyTransaction, Payment, Review,
+    Service, StaffSchedule, StaffSlot, User,
+)
+
+# (tên, nhóm, giá, phút, độ phổ biến)
+SERVICE_CATALOG = [
+    ("Manicure Basic", Service.Category.MANICURE, 120000, 45, 18),
+    ("Gel Polish", Service.Category.MANICURE, 180000, 60, 22),
+    ("Gel Extension", Service.Category.MANICURE, 350000, 90, 8),
+    ("Acrylic Full Set", Service.Category.MANICURE, 420000, 120, 5),
+    ("Nail Art Mini", Service.Category.MANICURE, 100000, 30, 9),
+    ("French Tip", Service.Category.MANICURE, 200000, 60, 6),
+    ("Pedicure Spa", Service.Category.PEDICURE, 180000, 60, 12),
+    ("Pedicure Gel", Service.Category.PEDICURE, 220000, 75, 7),
+    ("Foot Scrub", Service.Category.PEDICURE, 150000, 45, 3),
+    ("Nail Removal", Service.Category.MORE, 50000, 30, 6),
+    ("Hand Massage", Service.Category.MORE, 90000, 30, 2),
+    ("Paraffin Treatment", Service.Category.MORE, 130000, 30, 2),
+]
+# dịch vụ đi kèm hay gặp (lịch 2 dịch vụ)
+ADDON_NAMES = ["Nail Removal", "Nail Art Mini", "Hand Massage", "Paraffin Treatment"]
+
+DISTRICTS = [
+    "Quận 1", "Quận 3", "Phú Nhuận", "Bình Thạnh", "Thủ Đức", "Quận 7", "Tân Bình", "Gò Vấp",
+    "Hải Châu", "Sơn Trà", "Ngũ Hành Sơn", "Hoàn Kiếm", "Ba Đình", "Cầu Giấy", "Tây Hồ", "Đống Đa",
+    "Ninh Kiều", "Nha Trang", "Đà Lạt", "Vũng Tàu",
+]
+FAMILY = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Huỳnh", "Phan", "Vũ", "Võ", "Đặng", "Bùi", "Đỗ", "Hồ", "Ngô"]
+MIDDLE = ["Thị", "Ngọc", "Thu", "Minh", "Bảo", "Khánh", "Gia", "Hoàng", "Văn", "Thanh"]
+GIVEN = [
+    "Anh", "Linh", "Trang", "Hương", "Mai", "Lan", "Vy", "Ngân", "Thảo", "Nhi", "Hà", "Yến", "Phương",
+    "Quỳnh", "My", "Hạnh", "Trâm", "Tú", "Nam", "Huy", "Long", "Dung", "Chi", "Giang",
+]
+COMMENTS = {
+    5: ["Rất đẹp, sẽ quay lại!", "Thợ làm kỹ và nhẹ tay.", "Perfect as always.", "Màu gel bền, rất hài lòng."],
+    4: ["Đẹp, chờ hơi lâu một chút.", "Good service, nice staff.", "Ổn, giá hợp lý."],
+    3: ["Bình thường.", "Okay but a bit rushed.", "Màu không giống mẫu lắm."],
+    2: ["Gel bong sau vài ngày.", "Phải chờ 30 phút dù đã đặt lịch."],
+    1: ["Không hài lòng.", "Very disappointed."],
+}
+
+# nhịp khách theo thứ (Mon..Sun), theo tháng (Tết, lễ cuối năm đông) và theo giờ bắt đầu
+WEEKDAY_WEIGHT = [0.75, 0.7, 0.8, 0.9, 1.15, 1.6, 1.35]
+MONTH_WEIGHT = [1.3, 1.25, 0.95, 0.9, 0.95, 0.9, 0.85, 0.85, 0.9, 1.0, 1.05, 1.35]
+HOUR_WEIGHT = {8: 2, 9: 5, 10: 7, 11: 6, 12: 3, 13: 4, 14: 6, 15: 6, 16: 7, 17: 8, 18: 5}
+SLOT_CUM = list(accumulate(HOUR_WEIGHT.get(t.hour, 1) for t in SLOT_TIMES))
+
+PAST_STATUS = [(Appointment.Status.DONE, 86), (Appointment.Status.CANCELED, 10), (Appointment.Status.NO_SHOW, 4)]
+TODAY_STATUS = [
+    (Appointment.Status.CONFIRMED, 60), (Appointment.Status.IN_PROGRESS, 10),
+    (Appointment.Status.DONE, 25), (Appointment.Status.CANCELED, 5),
+]
+FUTURE_STATUS = [(Appointment.Status.CONFIRMED, 90), (Appointment.Status.CANCELED, 10)]
+STORE_METHODS = [(Payment.Method.CASH, 55), (Payment.Method.CARD, 45)]
+RATING_WEIGHT = [(5, 55), (4, 28), (3, 10), (2, 4), (1, 3)]
+REVIEW_STATUS = [(Review.Status.PUBLISHED, 90), (Review.Status.PENDING, 5), (Review.Status.HIDDEN, 5)]
+# mẫu ca của KTV: (tỉ lệ, các ca)
+SHIFT_PATTERNS = [
+    (70, (StaffSchedule.Shift.MORNING, StaffSchedule.Shift.AFTERNOON)),
+    (15, (StaffSchedule.Shift.MORNING,)),
+    (15, (StaffSchedule.Shift.AFTERNOON, StaffSchedule.Shift.EVENING)),
+]
+APPROVED_AHEAD_DAYS = 14   # ca xa hơn 14 ngày tới phần lớn còn PENDING
+CUSTOMER_SKEW = 2.2        # khách quen chiếm phần lớn lịch (phân phối lệch về id nhỏ)
+HOME_BRANCH_SHARE = 0.9
+REVIEW_RATE = 0.22
+ONLINE_RATE = 0.3
+REDEEM_RATE = 0.15
+
+
+def _pick(rng, weighted):
+    values, weights = zip(*weighted)
+    return rng.choices(values, weights)[0]
+
+
+@contextmanager
+def _keep_dates(*fields):
+    """bulk_create vẫn gọi pre_save -> auto_now_add ghi đè ngày đã sinh. Tắt tạm trong lúc seed."""
+    saved = [(f, f.auto_now_add) for f in fields]
+    for f, _ in saved:
+        f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, value in saved:
+            f.auto_now_add = value
+
+
+class _Writer:
+    """Gom dòng theo model, ghi bằng bulk_create theo đúng thứ tự khoá ngoại, đếm số dòng / thời gian."""
+
+    ORDER = [
+        User, User.groups.through, Appointment, AppointmentService, AppointmentStaff, StaffSlot, Payment,
+        Review, LoyaltyTransaction, StaffSchedule, LoyaltyPoints,
+    ]
+
+    def __init__(self, batch):
+        self.batch = batch
+        self.rows = {m: [] for m in self.ORDER}
+        self.counts = {m: 0 for m in self.ORDER}
+        self.pending = 0
+
+    def add(self, obj):
+        self.rows[type(obj)].append(obj)
+        self.pending += 1
+        if self.pending >= self.batch * 4:
+            self.flush()
+
+    def flush(self):
+        with transaction.atomic():
+            for model in self.ORDER:
+                objs = self.rows[model]
+                if objs:
+                    model.objects.bulk_create(objs, batch_size=self.batch)
+                    self.counts[model] += len(objs)
+                    self.rows[model] = []
+        self.pending = 0
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a large synthetic salon chain with bulk_create: branches, technicians with shifts, customers, "
+        "appointments with service lines, payments, reviews and loyalty transactions. Output is deterministic "
+        "for a given --seed and --today. Reports insert throughput."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--branches", type=int, default=20)
+        parser.add_argument("--staff", type=int, default=600, help="Technicians across all branches.")
+        parser.add_argument("--customers", type=int, default=200_000)
+        parser.add_argument("--appointments", type=int, default=1_000_000, help="Target number of appointments.")
+        parser.add_argument("--days-back", type=int, default=365)
+        parser.add_argument("--days-ahead", type=int, default=30)
+        parser.add_argument("--today", help="Anchor day (YYYY-MM-DD). Default: today.")
+        parser.add_argument("--batch", type=int, default=5000, help="Rows per INSERT.")
+        parser.add_argument("--prefix", default="bulk", help="Username prefix (must not exist yet).")
+        parser.add_argument("--skip-rollups", action="store_true", help="Skip rebuild_daily_stats / service ratings.")
+
+    # ---- danh mục / người dùng ---------------------------------------------------------
+    def _services(self):
+        services = []
+        for name, category, price, duration, weight in SERVICE_CATALOG:
+            svc, _ = Service.objects.get_or_create(
+                service_name=name,
+                defaults={"category": category, "price": Decimal(price), "duration": duration, "is_active": True},
+            )
+            services.append((svc, weight))
+        return services
+
+    def _district(self, i):
+        """Quận 1, ..., Vũng Tàu, Quận 1 2, ... (hết danh sách thì đánh số)."""
+        name = DISTRICTS[i % len(DISTRICTS)]
+        return name if i < len(DISTRICTS) else f"{name} {i // len(DISTRICTS) + 1}"
+
+    def _name(self, rng):
+        return f"{rng.choice(FAMILY)} {rng.choice(MIDDLE)} {rng.choice(GIVEN)}"
+
+    def _users(self, rng, writer, opts, today):
+        prefix = opts["prefix"]
+        next_id = (User.objects.aggregate(m=Max("pk"))["m"] or 0) + 1
+        password = make_password("12345678")
+        tech_group = Group.objects.get_or_create(name="Technician")[0]
+        rx_group = Group.objects.get_or_create(name="Receptionist")[0]
+        joined_from = today - timedelta(days=opts["days_back"] + 365)
+        tz = timezone.get_current_timezone()
+
+        def user(username, role, joined_day, **extra):
+            nonlocal next_id
+            u = User(
+                id=next_id, username=username, password=password, role=role, full_name=self._name(rng),
+                phone_number=f"09{rng.randrange(10 ** 8):08d}",
+                date_joined=timezone.make_aware(datetime.combine(joined_day, datetime.min.time()), tz),
+                **extra,
+            )
+            next_id += 1
+            writer.add(u)
+            return u.id
+
+        branches = list(
+            Branch.objects.bulk_create([
+                Branch(
+                    name=f"GlamUp {self._district(i)}",
+                    address=f"{rng.randint(1, 300)} {DISTRICTS[i % len(DISTRICTS)]}",
+                    phone=f"028{rng.randrange(10 ** 7):07d}",
+                )
+                for i in range(opts["branches"])
+            ])
+        )
+        if branches[0].pk is None:  # DB không trả id sau bulk_create
+            branches = list(Branch.objects.order_by("-pk")[:len(branches)])[::-1]
+        # chi nhánh đông / vắng khác nhau (Zipf nhẹ)
+        branch_weight = [1 / (i + 1) ** 0.5 for i in range(len(branches))]
+
+        # số KTV mỗi chi nhánh theo độ đông của chi nhánh
+        staff_by_branch = {b.pk: [] for b in branches}
+        staff_cum = list(accumulate(branch_weight))
+        for i in range(opts["staff"]):
+            b = branches[min(bisect_left(staff_cum, (i + 0.5) / opts["staff"] * staff_cum[-1]), len(branches) - 1)]
+            sid = user(f"{prefix}_t{i:05d}", User.Role.STAFF, joined_from)
+            writer.add(User.groups.through(user_id=sid, group_id=tech_group.pk))
+            staff_by_branch[b.pk].append((sid, i))
+        for b in branches:
+            rid = user(f"{prefix}_r{b.pk}", User.Role.STAFF, joined_from)
+            writer.add(User.groups.through(user_id=rid, group_id=rx_group.pk))
+
+        first_customer = next_id
+        span = (today - joined_from).days
+        for i in range(opts["customers"]):
+            user(
+                f"{prefix}_c{i:07d}", User.Role.CUSTOMER, joined_from + timedelta(days=rng.randrange(span)),
+                email=f"{prefix}.c{i}@example.com",
+            )
+        writer.flush()
+        return branches, branch_weight, staff_by_branch, first_customer
+
+    # ---- lịch theo ngày ----------------------------------------------------------------
+    def _shifts(self, rng, writer, day, today, branch_id, staff):
+        """Ca của các KTV 1 chi nhánh trong ngày. Trả về {shift: [staff_id]} (chỉ ca APPROVED)."""
+        on_shift = {}
+        for sid, idx in staff:
+            if day.weekday() == idx % 7 or rng.random() < 0.05:  # ngày nghỉ cố định + nghỉ phép
+                continue
+            shifts = _pick(rng, [(p, w) for w, p in SHIFT_PATTERNS])
+            approved = (day - today).days <= APPROVED_AHEAD_DAYS or rng.random() < 0.6
+            status = StaffSchedule.Status.APPROVED if approved else StaffSchedule.Status.PENDING
+            for shift in shifts:
+                writer.add(StaffSchedule(staff_id=sid, work_date=day, shift=shift, status=status, branch_id=branch_id))
+                if approved:
+                    on_shift.setdefault(shift, []).append(sid)
+        return on_shift
+
+    def _customer(self, rng, n_customers, n_branches, branch_idx):
+        if rng.random() < HOME_BRANCH_SHARE:
+            per_branch = max(1, (n_customers - branch_idx + n_branches - 1) // n_branches)
+            k = int(per_branch * rng.random() ** CUSTOMER_SKEW)
+            return min(k * n_branches + branch_idx, n_customers - 1)
+        return int(n_customers * rng.random() ** CUSTOMER_SKEW)
+
+    def _status(self, rng, day, today):
+        if day < today:
+            return _pick(rng, PAST_STATUS)
+        if day == today:
+            return _pick(rng, TODAY_STATUS)
+        return _pick(rng, FUTURE_STATUS)
+
+    def _appointment(self, rng, writer, ctx, day, branch_id, branch_idx, on_shift, masks):
+        start = rng.choices(SLOT_TIMES, cum_weights=SLOT_CUM)[0]
+        svc, _ = rng.choices(ctx["services"], cum_weights=ctx["service_cum"])[0]
+        lines = [svc]
+        if rng.random() < 0.15:
+            addon = rng.choice(ctx["addons"])
+            if addon.pk != svc.pk:
+                lines.append(addon)
+        duration = sum(s.duration for s in lines)
+        status = self._status(rng, day, ctx["today"])
+
+        # KTV có ca lúc bắt đầu và rảnh cả khoảng [start, start + duration)
+        slots = slot_range(start, duration)
+        mask = ((1 << len(slots)) - 1) << slots.start
+        free = [sid for sid in on_shift.get(shift_of(start), ()) if not masks.get(sid, 0) & mask]
+        if not free:
+            return None
+        staff_id = rng.choice(free)
+        if status != Appointment.Status.CANCELED:
+            masks[staff_id] = masks.get(staff_id, 0) | mask
+
+        tz = ctx["tz"]
+        starts_at = timezone.make_aware(datetime.combine(day, start), tz)
+        booked_at = starts_at - timedelta(days=rng.choice([0, 0, 1, 1, 2, 3, 5, 7, 14]), hours=rng.randint(1, 9))
+        customer_id = ctx["first_customer"] + self._customer(rng, ctx["n_customers"], ctx["n_branches"], branch_idx)
+        total = sum(s.price for s in lines)
+        appt_id = ctx["next_appt_id"]
+        ctx["next_appt_id"] += 1
+
+        awarded = status == Appointment.Status.DONE and total >= 10000
+        writer.add(Appointment(
+            id=appt_id, customer_id=customer_id, branch_id=branch_id, appointment_date=day,
+            appointment_time=start, duration_minutes=duration,
+            end_time=Appointment.compute_end_time(start, duration), status=status, total_price=total,
+            loyalty_awarded=awarded, created_at=booked_at,
+        ))
+        for s in lines:
+            writer.add(AppointmentService(appointment_id=appt_id, service_id=s.pk, quantity=1, unit_price=s.price))
+        writer.add(AppointmentStaff(appointment_id=appt_id, staff_id=staff_id))
+        if status in BUSY_STATUSES and day >= ctx["today"]:
+            for n in slots:
+                writer.add(StaffSlot(staff_id=staff_id, appointment_id=appt_id, date=day, slot=n))
+
+        online = rng.random() < ONLINE_RATE
+        method = Payment.Method.ONLINE if online else _pick(rng, STORE_METHODS)
+        if status == Appointment.Status.DONE or (online and status != Appointment.Status.NO_SHOW):
+            pay_status = Payment.Status.PAID
+        else:
+            pay_status = Payment.Status.UNPAID
+        if status == Appointment.Status.CANCELED and pay_status == Payment.Status.PAID:
+            pay_status = Payment.Status.REFUNDED
+        writer.add(Payment(
+            appointment_id=appt_id, payment_date=booked_at if online else starts_at, amount=total, method=method,
+            status=pay_status, amount_paid=total if pay_status == Payment.Status.PAID else 0,
+        ))
+
+        if status == Appointment.Status.DONE:
+            done_at = starts_at + timedelta(minutes=duration)
+            if rng.random() < REVIEW_RATE:
+                rating = _pick(rng, RATING_WEIGHT)
+                writer.add(Review(
+                    appointment_id=appt_id, customer_id=customer_id, service_id=svc.pk,
+                    review_date=min(day + timedelta(days=rng.randint(0, 3)), ctx["today"]),
+                    comment=rng.choice(COMMENTS[rating]), rating=Decimal(rating), service_rating=rating,
+                    status=_pick(rng, REVIEW_STATUS),
+                ))
+            if awarded:
+                self._loyalty(rng, writer, ctx, customer_id, appt_id, int(total) // 10000, done_at)
+        return appt_id
+
+    def _loyalty(self, rng, writer, ctx, customer_id, appt_id, points, at):
+        """Cùng quy tắc loyalty.py: 1 điểm / 10.000đ, dùng điểm theo bội số 10, tối thiểu 100."""
+        bal = ctx["balances"].setdefault(customer_id, [0, 0, 0])  # current, earned, used
+        if bal[0] >= 100 and rng.random() < REDEEM_RATE:
+            used = bal[0] // 10 * 10
+            bal[0] -= used
+            bal[2] += used
+            writer.add(LoyaltyTransaction(
+                customer_id=customer_id, appointment_id=appt_id, type=LoyaltyTransaction.Type.USE,
+                points=-used, balance_after=bal[0], created_at=at - timedelta(minutes=1),
+                description=f"Redeemed {used} points for booking BK{appt_id:06d}",
+            ))
+        bal[0] += points
+        bal[1] += points
+        writer.add(LoyaltyTransaction(
+            customer_id=customer_id, appointment_id=appt_id, type=LoyaltyTransaction.Type.EARN,
+            points=points, balance_after=bal[0], created_at=at,
+            description=f"Tích {points} điểm cho lịch BK{appt_id:06d}",
+        ))
+
+    # ---- main --------------------------------------------------------------------------
+    def handle(self, *args, **opts):
+        prefix = opts["prefix"]
+        if User.objects.filter(username__startswith=f"{prefix}_").exists():
+            raise CommandError(f"Users with prefix {prefix!r} already exist; pass another --prefix.")
+        if opts["branches"] < 1 or opts["staff"] < opts["branches"] or opts["customers"] < 1:
+            raise CommandError("Need at least 1 branch, 1 technician per branch and 1 customer.")
+        try:
+            today = datetime.strptime(opts["today"], "%Y-%m-%d").date() if opts["today"] else timezone.localdate()
+        except ValueError as e:
+            raise CommandError(f"Invalid date: {e}")
+
+        rng = random.Random(opts["seed"])
+        writer = _Writer(opts["batch"])
+        t0 = perf_counter()
+
+        services = self._services()
+        branches, branch_weight, staff_by_branch, first_customer = self._users(rng, writer, opts, today)
+        self.stdout.write(
+            f"{connection.vendor}: {len(branches)} branches, {opts['staff']} technicians, "
+            f"{opts['customers']} customers in {perf_counter() - t0:.1f}s"
+        )
+
+        days = [today + timedelta(days=d) for d in range(-opts["days_back"], opts["days_ahead"] + 1)]
+        total_weight = sum(WEEKDAY_WEIGHT[d.weekday()] * MONTH_WEIGHT[d.month - 1] for d in days) * sum(branch_weight)
+        per_weight = opts["appointments"] / total_weight
+        by_name = {s.service_name: s for s, _ in services}
+        ctx = {
+            "today": today,
+            "tz": timezone.get_current_timezone(),
+            "services": services,
+            "service_cum": list(accumulate(w for _, w in services)),
+            "addons": [by_name[n] for n in ADDON_NAMES],
+            "first_customer": first_customer,
+            "n_customers": opts["customers"],
+            "n_branches": len(branches),
+            "next_appt_id": (Appointment.objects.aggregate(m=Max("pk"))["m"] or 0) + 1,
+            "balances": {},
+        }
+
+        made = full = 0
+        t_appts = perf_counter()
+        with _keep_dates(*(m._meta.get_field(f) for m, f in [
+            (Appointment, "created_at"), (Payment, "payment_date"), (Review, "review_date"),
+            (LoyaltyTransaction, "created_at"),
+        ])):
+            for n, day in enumerate(days, 1):
+                day_weight = WEEKDAY_WEIGHT[day.weekday()] * MONTH_WEIGHT[day.month - 1]
+                for branch_idx, branch in enumerate(branches):
+                    on_shift = self._shifts(rng, writer, day, today, branch.pk, staff_by_branch[branch.pk])
+                    expected = per_weight * day_weight * branch_weight[branch_idx]
+                    wanted = max(0, round(rng.gauss(expected, expected ** 0.5)))
+                    masks = {}
+                    for _ in range(wanted):
+                        if self._appointment(rng, writer, ctx, day, branch.pk, branch_idx, on_shift, masks) is None:
+                            full += 1
+                        else:
+                            made += 1
+                if n % 30 == 0 or n == len(days):
+                    elapsed = perf_counter() - t_appts
+                    self.stdout.write(
+                        f"  {day}  {made:>9} appointments  {writer.total / max(perf_counter() - t0, 1e-9):>9.0f} rows/s"
+                        f"  ({elapsed:.0f}s)"
+                    )
+
+            now = timezone.now()
+            for customer_id, (current, earned, used) in ctx["balances"].items():
+                writer.add(LoyaltyPoints(
+                    customer_id=customer_id, current_points=current, points_earned=earned, points_used=used,
+                    last_updated=now,
+                ))
+            writer.flush()
+
+        # id gán tay -> đẩy sequence (PostgreSQL) qua id lớn nhất
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [User, Appointment]):
+                cursor.execute(sql)
+
+        elapsed = perf_counter() - t0
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {made} appointments ({full} turned away: no free technician) — "
+            f"{writer.total} rows in {elapsed:.1f}s = {writer.total / elapsed:.0f} rows/s"
+        ))
+        for model, count in writer.counts.items():
+            if count:
+                self.stdout.write(f"    {model._meta.db_table:<28} {count:>10}")
+
+        if not opts["skip_rollups"]:
+            # bulk_create không chạy signals -> dựng lại bảng gộp dashboard và điểm rating
+            call_command("rebuild_daily_stats", stdout=self.stdout)
+            call_command("rebuild_service_ratings", stdout=self.stdout)
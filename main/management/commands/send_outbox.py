@@ -0,0 +1,35 @@
+# main/management/commands/send_outbox.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.outbox import MAX_ATTEMPTS, send_queued
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver queued OutboxEmail rows in batches over one SMTP connection per batch, "
+        "retrying failures with exponential backoff. Use --loop to keep polling."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=50, help="Messages per batch / SMTP connection.")
+        parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+        parser.add_argument("--loop", action="store_true", help="Keep running and poll for new mail.")
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds between polls when idle (--loop).")
+        parser.add_argument("--backend", help="Override GLAMUP_OUTBOX_DELIVERY_BACKEND for this run.")
+
+    def handle(self, *args, **opts):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = send_queued(opts["batch"], opts["max_attempts"], opts.get("backend"))
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write(f"batch: {sent} sent, {failed} failed")
+                continue  # còn mail thì gửi tiếp lô sau ngay
+            if not opts["loop"]:
+                break
+            time.sleep(opts["interval"])
+
+        self.stdout.write(self.style.SUCCESS(f"✓ Outbox drained: {total_sent} sent, {total_failed} failed."))
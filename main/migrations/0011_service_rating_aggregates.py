@@ -0,0 +1,85 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:44
+
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations, models
+
+
+def backfill_ratings(apps, schema_editor):
+    Service = apps.get_model("main", "Service")
+    Review = apps.get_model("main", "Review")
+
+    stats = {}
+    for service_id, rating in (
+        Review.objects.filter(status="PUBLISHED", service__isnull=False)
+        .values_list("service_id", "rating").iterator()
+    ):
+        row = stats.setdefault(service_id, {"count": 0, "sum": Decimal("0"), "stars": [0] * 5})
+        rating = Decimal(str(rating or 0))
+        stars = min(5, max(1, int(rating.quantize(Decimal("1"), rounding=ROUND_HALF_UP))))
+        row["count"] += 1
+        row["sum"] += rating
+        row["stars"][stars - 1] += 1
+
+    services = []
+    for service_id, row in stats.items():
+        s = Service(pk=service_id, rating_count=row["count"], rating_sum=row["sum"])
+        s.rating_avg = (row["sum"] / row["count"]).quantize(Decimal("0.01"))
+        s.rating_1, s.rating_2, s.rating_3, s.rating_4, s.rating_5 = row["stars"]
+        services.append(s)
+    Service.objects.bulk_update(
+        services,
+        ["rating_count", "rating_sum", "rating_avg", "rating_1", "rating_2", "rating_3", "rating_4", "rating_5"],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_appointment_loyalty_awarded_loyaltytransaction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='rating_avg',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='rating_sum',
+            field=models.DecimalField(decimal_places=1, default=Decimal('0'), max_digits=10),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:49
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_service_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBranchServiceStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('lines', models.PositiveIntegerField(default=0)),
+                ('paid_lines', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('paid_revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='main.branch')),
+                ('service', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='main.service')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('service__isnull', False)), fields=('date', 'branch', 'service'), name='uniq_daily_stats_service'), models.UniqueConstraint(condition=models.Q(('service__isnull', True)), fields=('date', 'branch'), name='uniq_daily_stats_total')],
+            },
+        ),
+    ]
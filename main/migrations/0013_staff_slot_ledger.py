@@ -0,0 +1,59 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+SLOT_MINUTES = 15
+
+
+def backfill_slots(apps, schema_editor):
+    """Ghi sổ giữ chỗ cho các lịch còn bận từ hôm nay trở đi."""
+    Appointment = apps.get_model("main", "Appointment")
+    AppointmentStaff = apps.get_model("main", "AppointmentStaff")
+    StaffSlot = apps.get_model("main", "StaffSlot")
+
+    links = (
+        AppointmentStaff.objects
+        .filter(
+            appointment__appointment_date__gte=timezone.localdate(),
+            appointment__status__in=["PENDING", "CONFIRMED", "IN_PROGRESS"],
+        )
+        .values_list(
+            "staff_id", "appointment_id", "appointment__appointment_date",
+            "appointment__appointment_time", "appointment__duration_minutes",
+        )
+    )
+    rows = []
+    for staff_id, appt_id, day, t, duration in links.iterator():
+        start = t.hour * 60 + t.minute
+        end = start + (duration or 60)
+        for slot in range(start // SLOT_MINUTES, -(-end // SLOT_MINUTES)):
+            rows.append(StaffSlot(staff_id=staff_id, appointment_id=appt_id, date=day, slot=slot))
+    # dữ liệu cũ có thể đã bị đặt trùng -> giữ dòng đầu tiên
+    StaffSlot.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_daily_branch_service_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaffSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('slot', models.PositiveSmallIntegerField()),
+                ('appointment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_reservations', to='main.appointment')),
+                ('staff', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_reservations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('staff', 'date', 'slot'), name='uniq_staff_slot')],
+            },
+        ),
+        migrations.RunPython(backfill_slots, migrations.RunPython.noop),
+    ]
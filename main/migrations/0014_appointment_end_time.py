@@ -0,0 +1,49 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:55
+
+import datetime
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_end_time(apps, schema_editor):
+    """duration_minutes = tổng duration dịch vụ (nếu có line), end_time = giờ bắt đầu + duration."""
+    Appointment = apps.get_model("main", "Appointment")
+
+    batch = []
+    qs = Appointment.objects.annotate(line_minutes=Sum("service_lines__service__duration")).order_by("pk")
+    for appt in qs.iterator(chunk_size=1000):
+        if appt.line_minutes:
+            appt.duration_minutes = appt.line_minutes
+        end = appt.appointment_time.hour * 60 + appt.appointment_time.minute + (appt.duration_minutes or 60)
+        appt.end_time = datetime.time(23, 59) if end >= 24 * 60 else datetime.time(end // 60, end % 60)
+        batch.append(appt)
+        if len(batch) >= 1000:
+            Appointment.objects.bulk_update(batch, ["duration_minutes", "end_time"])
+            batch = []
+    if batch:
+        Appointment.objects.bulk_update(batch, ["duration_minutes", "end_time"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_staff_slot_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='end_time',
+            field=models.TimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['branch', 'appointment_date', 'status'], name='appt_branch_date_status'),
+        ),
+        migrations.AddIndex(
+            model_name='appointmentstaff',
+            index=models.Index(fields=['staff', 'appointment'], name='apptstaff_staff_appt'),
+        ),
+        migrations.RunPython(backfill_end_time, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_job_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='reminder_sent_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('CONFIRMED', 'Confirmed'), ('IN_PROGRESS', 'In progress'), ('DONE', 'Done'), ('CANCELED', 'Canceled'), ('ARRIVED', 'Đã đến'), ('ONGOING', 'Đang thực hiện'), ('NO_SHOW', 'No-show')], default='PENDING', max_length=20),
+        ),
+    ]
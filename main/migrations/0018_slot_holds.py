@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_appointment_reminder_no_show'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='hold_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='staffslot',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='staffslot',
+            index=models.Index(fields=['expires_at'], name='staffslot_expires_at'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0018_slot_holds'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_from', models.DateField()),
+                ('date_to', models.DateField()),
+                ('preferred_from', models.TimeField(blank=True, null=True)),
+                ('preferred_to', models.TimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('WAITING', 'Waiting'), ('OFFERED', 'Offered'), ('BOOKED', 'Booked'), ('EXPIRED', 'Expired'), ('CANCELED', 'Canceled')], default='WAITING', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='main.branch')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to=settings.AUTH_USER_MODEL)),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='main.service')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['branch', 'status', 'date_from'], name='waitlist_branch_status_from')],
+            },
+        ),
+        migrations.CreateModel(
+            name='WaitlistOffer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('OFFERED', 'Offered'), ('ACCEPTED', 'Accepted'), ('EXPIRED', 'Expired')], default='OFFERED', max_length=10)),
+                ('offered_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField()),
+                ('responded_at', models.DateTimeField(blank=True, null=True)),
+                ('appointment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='waitlist_offers', to='main.appointment')),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='offers', to='main.waitlistentry')),
+            ],
+        ),
+    ]
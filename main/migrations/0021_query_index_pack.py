@@ -0,0 +1,80 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:00
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+CONTACT_INDEX = models.Index(fields=['status', 'created_at'], name='contact_status_created')
+
+
+def add_contact_index(apps, schema_editor):
+    model = apps.get_model('main', 'ContactMessage')
+    if model._meta.db_table in schema_editor.connection.introspection.table_names():
+        schema_editor.add_index(model, CONTACT_INDEX)
+
+
+def remove_contact_index(apps, schema_editor):
+    model = apps.get_model('main', 'ContactMessage')
+    if model._meta.db_table in schema_editor.connection.introspection.table_names():
+        schema_editor.remove_index(model, CONTACT_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0020_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='appointment',
+            options={},
+        ),
+        migrations.AlterModelOptions(
+            name='loyaltytransaction',
+            options={},
+        ),
+        migrations.AlterModelOptions(
+            name='payment',
+            options={},
+        ),
+        migrations.AlterModelOptions(
+            name='staffschedule',
+            options={},
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['customer', 'status', 'appointment_date', 'appointment_time'], name='appt_customer_status_date'),
+        ),
+        # ----- ContactMessage: bảng chỉ có sẵn ở DB cũ (0008 chỉ tạo STATE) -> tạo index nếu có bảng -----
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(add_contact_index, remove_contact_index),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='contactmessage',
+                    index=CONTACT_INDEX,
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='loyaltytransaction',
+            index=models.Index(fields=['customer', 'created_at'], name='loyaltytx_customer_created'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['appointment', 'status'], name='payment_appt_status'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['service', 'status', 'review_date'], name='review_service_status_date'),
+        ),
+        migrations.AddIndex(
+            model_name='staffschedule',
+            index=models.Index(fields=['work_date', 'shift', 'status', 'branch'], name='sched_date_shift_status_br'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(django.db.models.functions.text.Upper('email'), name='user_email_upper'),
+        ),
+    ]
@@ -2,8 +2,11 @@
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Upper
+from django.utils import timezone
 from django.utils.text import slugify
+from datetime import time as dtime
 from decimal import Decimal
 
 
@@ -32,6 +35,12 @@ class User(AbstractUser):
     def __str__(self):
         return self.full_name or self.username
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # LoginForm / RegisterForm tra email__iexact (PostgreSQL: UPPER(email) = UPPER(%s))
+            models.Index(Upper("email"), name="user_email_upper"),
+        ]
+
 
 # ========= Catalog =========
 
@@ -60,6 +69,17 @@ class Service(models.Model):
     is_active = models.BooleanField(default=True)
     category = models.CharField(max_length=20, choices=Category.choices, default=Category.MANICURE)
     duration = models.PositiveIntegerField(default=60, help_text="minutes")
+
+    # Rating tổng hợp từ Review PUBLISHED (cập nhật trong Review.save / khi xoá, xem main/ratings.py)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum   = models.DecimalField(max_digits=10, decimal_places=1, default=Decimal("0"))
+    rating_avg   = models.DecimalField(max_digits=3, decimal_places=2, default=Decimal("0"))
+    rating_1     = models.PositiveIntegerField(default=0)
+    rating_2     = models.PositiveIntegerField(default=0)
+    rating_3     = models.PositiveIntegerField(default=0)
+    rating_4     = models.PositiveIntegerField(default=0)
+    rating_5     = models.PositiveIntegerField(default=0)
+
     class Meta:
         ordering = ["service_name"]
         indexes = [
@@ -73,13 +93,15 @@ class Service(models.Model):
         Điểm rating trung bình (0–5) từ các Review đã publish.
         Dùng cho trang list & trang chi tiết dịch vụ.
         """
-        from django.db.models import Avg
-        from .models import Review  # cùng file nên OK, không bị vòng lặp
+        return self.rating_avg or Decimal("0")
 
-        data = self.reviews.filter(
-            status=Review.Status.PUBLISHED
-        ).aggregate(avg=Avg("rating"))
-        return data["avg"] or Decimal("0")
+    @property
+    def rating_histogram(self):
+        """{số sao: số review} cho 1..5 sao."""
+        return {
+            1: self.rating_1, 2: self.rating_2, 3: self.rating_3,
+            4: self.rating_4, 5: self.rating_5,
+        }
 
     @property
     def avg_rating_int(self):
@@ -117,6 +139,7 @@ class Appointment(models.Model):
         CANCELED  = "CANCELED", "Canceled"
         ARRIVED = "ARRIVED", "Đã đến"
         ONGOING = "ONGOING", "Đang thực hiện"
+        NO_SHOW = "NO_SHOW", "No-show"
 
     customer          = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="appointments",
@@ -126,9 +149,14 @@ class Appointment(models.Model):
     appointment_date  = models.DateField()
     appointment_time  = models.TimeField()
     duration_minutes  = models.PositiveIntegerField(default=60, validators=[MinValueValidator(1)])
+    # = appointment_time + duration_minutes (tự tính trong save()), để check trùng giờ bằng 1 điều kiện SQL
+    end_time          = models.TimeField(null=True, blank=True, editable=False)
     status            = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
     total_price       = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
     loyalty_awarded = models.BooleanField(default=False, help_text="Đã cộng điểm loyalty cho lịch này chưa?")
+    reminder_sent_at = models.DateTimeField(null=True, blank=True)  # main/scheduler.py
+    # lịch ONLINE chưa trả tiền chỉ "giữ chỗ" tới mốc này; None = đã chốt (xem availability.confirm_hold)
+    hold_expires_at  = models.DateTimeField(null=True, blank=True)
     # Services & Staff (many-to-many qua bảng trung gian)
     services = models.ManyToManyField("Service", through="AppointmentService", related_name="appointment_items")
     staff    = models.ManyToManyField(
@@ -143,12 +171,44 @@ class Appointment(models.Model):
         indexes = [
             models.Index(fields=["appointment_date"]),
             models.Index(fields=["status"]),
+            models.Index(fields=["branch", "appointment_date", "status"], name="appt_branch_date_status"),
+            # lịch của 1 khách theo trạng thái (my_appointments, customer_account, lịch sắp tới)
+            models.Index(
+                fields=["customer", "status", "appointment_date", "appointment_time"],
+                name="appt_customer_status_date",
+            ),
         ]
-        ordering = ["-appointment_date", "-appointment_time"]
+        # không đặt ordering mặc định: các view đều order_by riêng, còn các câu đếm / map / GROUP BY
+        # không phải sort thừa. Admin sắp xếp qua AppointmentAdmin.ordering.
 
     def __str__(self):
         return f"Appt#{self.pk} - {self.customer} @ {self.branch} {self.appointment_date} {self.appointment_time}"
 
+    @staticmethod
+    def compute_end_time(start, minutes):
+        """Giờ kết thúc trong ngày (chặn ở 23:59 nếu vượt qua nửa đêm)."""
+        end = start.hour * 60 + start.minute + int(minutes or 60)
+        if end >= 24 * 60:
+            return dtime(23, 59)
+        return dtime(end // 60, end % 60)
+
+    def save(self, *args, **kwargs):
+        if self.appointment_time:
+            self.end_time = self.compute_end_time(self.appointment_time, self.duration_minutes)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"appointment_time", "duration_minutes"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "end_time"}
+        super().save(*args, **kwargs)
+
+    # Tính lại thời lượng từ các service_lines (giống cách tính cũ: tổng duration của dịch vụ)
+    def recalc_duration(self, save=True):
+        total = self.service_lines.aggregate(total=models.Sum("service__duration"))["total"]
+        if total and total != self.duration_minutes:
+            self.duration_minutes = total
+            if save:
+                self.save(update_fields=["duration_minutes"])
+        return self.duration_minutes
+
     # Helper: hợp nhất date+time
     def get_start_datetime(self):
         from datetime import datetime
@@ -195,11 +255,42 @@ class AppointmentStaff(models.Model):
 
     class Meta:
         unique_together = ("appointment", "staff")
+        indexes = [
+            # tra lịch của 1 KTV (check trùng giờ / lịch làm việc) đi từ staff trước
+            models.Index(fields=["staff", "appointment"], name="apptstaff_staff_appt"),
+        ]
 
     def __str__(self):
         return f"{self.staff} on Appt {self.appointment_id}"
 
 
+class StaffSlot(models.Model):
+    """
+    Sổ giữ chỗ: 1 dòng = 1 KTV bận 1 ô MINUTES phút trong ngày (slot = số thứ tự ô tính từ 00:00).
+    Unique (staff, date, slot) -> 2 request đặt trùng KTV/giờ thì DB chặn 1 cái (xem availability.reserve_staff).
+    Dòng bị xoá khi lịch rời trạng thái bận (signals.py).
+    expires_at != None: chỗ đang giữ tạm chờ thanh toán; quá hạn thì lịch khác được phép chiếm.
+    """
+    MINUTES = 15
+
+    staff       = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="slot_reservations")
+    appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, related_name="slot_reservations")
+    date        = models.DateField()
+    slot        = models.PositiveSmallIntegerField()
+    expires_at  = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["staff", "date", "slot"], name="uniq_staff_slot"),
+        ]
+        indexes = [
+            models.Index(fields=["expires_at"], name="staffslot_expires_at"),
+        ]
+
+    def __str__(self):
+        return f"{self.staff_id} {self.date} #{self.slot} (Appt {self.appointment_id})"
+
+
 class StaffSchedule(models.Model):
     class Shift(models.TextChoices):
         MORNING   = "MORNING", "Morning"
@@ -226,14 +317,224 @@ class StaffSchedule(models.Model):
 
     class Meta:
         unique_together = ("staff", "work_date", "shift")
-        ordering = ["-work_date"]
+        indexes = [
+            # ca đã duyệt theo ngày / ca / chi nhánh (availability, heatmap, lịch tuần của admin)
+            models.Index(fields=["work_date", "shift", "status", "branch"], name="sched_date_shift_status_br"),
+        ]
 
     def __str__(self):
         return f"{self.staff} {self.work_date} {self.shift} ({self.status})"
 
+    def save(self, *args, **kwargs):
+        """Chuyển ca sang chi nhánh / ngày khác (hoặc bỏ chi nhánh): signal chỉ thấy giá trị mới -> xoá heatmap chỗ cũ."""
+        from .heatmap import invalidate
+
+        update_fields = kwargs.get("update_fields")
+        tracked = update_fields is None or {"branch", "branch_id", "work_date"} & set(update_fields)
 
+        old = None
+        if self.pk and tracked:
+            old = StaffSchedule.objects.filter(pk=self.pk).values_list("branch_id", "work_date").first()
+        super().save(*args, **kwargs)
+        if old and old != (self.branch_id, self.work_date):
+            invalidate(*old)
+
+
+# ========= Waitlist =========
+
+class WaitlistEntry(models.Model):
+    """Khách chờ 1 chỗ trống (main/waitlist.py): chi nhánh + dịch vụ + khoảng ngày + khung giờ muốn (tuỳ chọn)."""
+    class Status(models.TextChoices):
+        WAITING  = "WAITING", "Waiting"
+        OFFERED  = "OFFERED", "Offered"
+        BOOKED   = "BOOKED", "Booked"
+        EXPIRED  = "EXPIRED", "Expired"
+        CANCELED = "CANCELED", "Canceled"
+
+    customer       = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="waitlist_entries")
+    branch         = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name="waitlist_entries")
+    service        = models.ForeignKey(Service, on_delete=models.CASCADE, related_name="waitlist_entries")
+    date_from      = models.DateField()
+    date_to        = models.DateField()
+    preferred_from = models.TimeField(null=True, blank=True)
+    preferred_to   = models.TimeField(null=True, blank=True)
+    status         = models.CharField(max_length=10, choices=Status.choices, default=Status.WAITING)
+    created_at     = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # matcher: WHERE branch = ? AND status = 'WAITING' AND date_from <= :day AND date_to >= :day
+            models.Index(fields=["branch", "status", "date_from"], name="waitlist_branch_status_from"),
+        ]
+
+    def __str__(self):
+        return f"Waitlist#{self.pk} {self.customer} @ {self.branch} {self.date_from}..{self.date_to} ({self.status})"
+
+
+class WaitlistOffer(models.Model):
+    """1 lần mời khách trong waitlist: lịch giữ chỗ tạm được tạo sẵn, khách thanh toán trước expires_at là nhận."""
+    class Status(models.TextChoices):
+        OFFERED  = "OFFERED", "Offered"
+        ACCEPTED = "ACCEPTED", "Accepted"
+        EXPIRED  = "EXPIRED", "Expired"
+
+    entry        = models.ForeignKey(WaitlistEntry, on_delete=models.CASCADE, related_name="offers")
+    appointment  = models.ForeignKey(
+        Appointment, on_delete=models.SET_NULL, null=True, blank=True, related_name="waitlist_offers"
+    )
+    status       = models.CharField(max_length=10, choices=Status.choices, default=Status.OFFERED)
+    offered_at   = models.DateTimeField(auto_now_add=True)
+    expires_at   = models.DateTimeField()
+    responded_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Offer#{self.pk} entry {self.entry_id} -> Appt {self.appointment_id} ({self.status})"
+
+
+# ========= Email outbox =========
+
+class OutboxEmail(models.Model):
+    """
+    Email chờ gửi. Request chỉ INSERT 1 dòng (main/outbox.py),
+    worker `manage.py send_outbox` gửi theo lô qua 1 kết nối SMTP, lỗi thì thử lại có giãn cách.
+    """
+    class Status(models.TextChoices):
+        QUEUED  = "QUEUED", "Queued"
+        SENDING = "SENDING", "Sending"
+        SENT    = "SENT", "Sent"
+        FAILED  = "FAILED", "Failed"
+
+    subject     = models.CharField(max_length=255)
+    body        = models.TextField(blank=True)
+    html_body   = models.TextField(blank=True)
+    from_email  = models.CharField(max_length=255, blank=True)
+    to          = models.JSONField(default=list)
+    cc          = models.JSONField(default=list, blank=True)
+    bcc         = models.JSONField(default=list, blank=True)
+    reply_to    = models.JSONField(default=list, blank=True)
+    # vd: "review-invite:123" -> cùng 1 lịch chỉ xếp hàng 1 email mời review
+    dedupe_key  = models.CharField(max_length=100, null=True, blank=True, unique=True)
+
+    status          = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    attempts        = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at      = models.DateTimeField(null=True, blank=True)
+    last_error      = models.TextField(blank=True)
+    created_at      = models.DateTimeField(auto_now_add=True)
+    sent_at         = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_status_next"),
+        ]
+
+    def __str__(self):
+        return f"Email#{self.pk} {self.status} → {', '.join(self.to)}: {self.subject}"
+
+
+# ========= Background jobs =========
+
+class Job(models.Model):
+    """
+    Việc chạy nền (xem main/jobs.py, worker: manage.py run_workers).
+    QUEUED -> RUNNING -> DONE; lỗi thì quay lại QUEUED với run_at lùi dần, quá max_attempts -> DEAD.
+    """
+    class Status(models.TextChoices):
+        QUEUED  = "QUEUED", "Queued"
+        RUNNING = "RUNNING", "Running"
+        DONE    = "DONE", "Done"
+        DEAD    = "DEAD", "Dead"
+
+    name         = models.CharField(max_length=100)
+    payload      = models.JSONField(default=dict, blank=True)
+    status       = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    run_at       = models.DateTimeField(default=timezone.now)
+    attempts     = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    locked_by    = models.CharField(max_length=100, blank=True)
+    locked_at    = models.DateTimeField(null=True, blank=True)
+    last_error   = models.TextField(blank=True)
+    created_at   = models.DateTimeField(auto_now_add=True)
+    finished_at  = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_at"], name="job_status_run_at"),
+        ]
+
+    def __str__(self):
+        return f"Job#{self.pk} {self.name} [{self.status}]"
+
+
+# ========= Idempotency =========
+
+class IdempotencyKey(models.Model):
+    """
+    1 lần submit form thay đổi dữ liệu (xem main/idempotency.py): khoá do form sinh ra,
+    dấu vân tay của request và response đã trả -> gửi lại cùng khoá thì trả đúng response cũ.
+    """
+    class State(models.TextChoices):
+        PROCESSING = "PROCESSING", "Processing"
+        DONE       = "DONE", "Done"
+
+    user         = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="idempotency_keys")
+    key          = models.CharField(max_length=64)
+    scope        = models.CharField(max_length=50)
+    fingerprint  = models.CharField(max_length=64)
+    state        = models.CharField(max_length=10, choices=State.choices, default=State.PROCESSING)
+    status_code  = models.PositiveSmallIntegerField(null=True, blank=True)
+    location     = models.CharField(max_length=500, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    content      = models.TextField(blank=True)
+    created_at   = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="uniq_idempotency_user_key"),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key} [{self.state}]"
+
+
+# ========= Reporting =========
+
+class DailyBranchServiceStats(models.Model):
+    """
+    Số liệu dashboard gộp sẵn theo ngày × chi nhánh × dịch vụ (chỉ tính lịch chưa CANCELED).
+    Dòng service = NULL là tổng của cả ngày/chi nhánh:
+      - bookings: số lịch; revenue: tổng total_price; paid_revenue: tổng Payment PAID
+    Dòng có service:
+      - bookings: số lịch có dịch vụ này; lines / paid_lines: số dòng dịch vụ (của lịch đã trả tiền)
+      - revenue / paid_revenue: tổng unit_price × quantity
+    Cập nhật trong main/stats.py; tính lại toàn bộ: manage.py rebuild_daily_stats
+    """
+    date         = models.DateField()
+    branch       = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name="daily_stats")
+    service      = models.ForeignKey(Service, on_delete=models.CASCADE, null=True, blank=True, related_name="daily_stats")
+    bookings     = models.PositiveIntegerField(default=0)
+    lines        = models.PositiveIntegerField(default=0)
+    paid_lines   = models.PositiveIntegerField(default=0)
+    revenue      = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    paid_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "branch", "service"],
+                condition=models.Q(service__isnull=False),
+                name="uniq_daily_stats_service",
+            ),
+            models.UniqueConstraint(
+                fields=["date", "branch"],
+                condition=models.Q(service__isnull=True),
+                name="uniq_daily_stats_total",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.branch_id}/{self.service_id or 'ALL'}: {self.bookings} bookings"
 
-# ========= Reviews =========
 
 # ========= Reviews =========
 
@@ -314,6 +615,10 @@ class Review(models.Model):
             return 0
     class Meta:
         ordering = ["-review_date"]
+        indexes = [
+            # review đã duyệt của 1 dịch vụ, mới nhất trước (service_detail, rating)
+            models.Index(fields=["service", "status", "review_date"], name="review_service_status_date"),
+        ]
 
     def __str__(self):
         return f"Review#{self.pk} {self.rating}★ by {self.customer}"
@@ -329,7 +634,24 @@ class Review(models.Model):
             # ép về khoảng 0–5 và làm tròn 1 chữ số thập phân
             avg = max(0, min(5, avg))
             self.rating = Decimal(str(round(avg, 1)))
-        super().save(*args, **kwargs)
+
+        from .ratings import apply_review_change
+
+        # chỉ đọc lại bản cũ khi lần lưu này có thể đổi service/status/rating
+        update_fields = kwargs.get("update_fields")
+        tracked = update_fields is None or {"service", "status", "rating"} & set(update_fields)
+
+        old = None
+        if self.pk and tracked:
+            old = (
+                Review.objects.filter(pk=self.pk)
+                .values_list("service_id", "status", "rating")
+                .first()
+            )
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if tracked:
+                apply_review_change(old, (self.service_id, self.status, self.rating))
 
 
 
@@ -357,7 +679,10 @@ class Payment(models.Model):
     transaction_code = models.CharField(max_length=100, blank=True)
 
     class Meta:
-        ordering = ["-payment_date"]
+        indexes = [
+            # EXISTS(payment PAID của lịch) trong stats / dashboard / danh sách lịch
+            models.Index(fields=["appointment", "status"], name="payment_appt_status"),
+        ]
 
     def __str__(self):
         return f"Payment#{self.pk} {self.method} {self.amount} for Appt#{self.appointment_id}"
@@ -391,7 +716,9 @@ class LoyaltyTransaction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["customer", "created_at"], name="loyaltytx_customer_created"),
+        ]
 
     def __str__(self):
         sign = "+" if self.points > 0 else ""
@@ -458,6 +785,9 @@ class ContactMessage(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="contact_status_created"),
+        ]
 
     def __str__(self):
         return f"[{self.get_status_display()}] {self.full_name} - {self.phone}"
@@ -0,0 +1,149 @@
+# main/outbox.py
+"""
+Hàng đợi email (bảng OutboxEmail).
+
+  - queue_email(...)  : request chỉ INSERT 1 dòng, không chạm SMTP
+  - OutboxBackend     : EMAIL_BACKEND -> mọi send_mail / PasswordResetView cũng vào hàng đợi
+  - send_queued(...)  : worker (manage.py send_outbox) nhận 1 lô, gửi qua 1 kết nối SMTP dùng chung,
+                        lỗi thì hẹn lại theo backoff 1, 2, 4, ... phút, quá số lần thì FAILED
+
+Backend gửi thật: settings.GLAMUP_OUTBOX_DELIVERY_BACKEND (mặc định SMTP).
+Thử với SMTP giả ở máy local: EMAIL_HOST=localhost, EMAIL_PORT=1025, EMAIL_USE_TLS=False.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+DEFAULT_DELIVERY_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 60
+CLAIM_TIMEOUT = timedelta(minutes=10)  # worker chết giữa chừng -> lô SENDING được nhận lại sau 10'
+
+
+def queue_email(subject, body, to, *, html_body="", from_email=None, cc=None, bcc=None,
+                reply_to=None, dedupe_key=None):
+    """
+    Xếp 1 email vào hàng đợi. Có dedupe_key mà đã tồn tại thì không tạo thêm.
+    Trả về (OutboxEmail, created).
+    """
+    fields = dict(
+        subject=subject[:255],
+        body=body or "",
+        html_body=html_body or "",
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(to),
+        cc=list(cc or []),
+        bcc=list(bcc or []),
+        reply_to=list(reply_to or []),
+    )
+    if not dedupe_key:
+        return OutboxEmail.objects.create(**fields), True
+    try:
+        with transaction.atomic():
+            return OutboxEmail.objects.create(dedupe_key=dedupe_key, **fields), True
+    except IntegrityError:
+        return OutboxEmail.objects.get(dedupe_key=dedupe_key), False
+
+
+class OutboxBackend(BaseEmailBackend):
+    """EMAIL_BACKEND: ghi EmailMessage vào OutboxEmail thay vì gửi ngay."""
+
+    def send_messages(self, email_messages):
+        count = 0
+        for msg in email_messages:
+            html = ""
+            for content, mimetype in getattr(msg, "alternatives", []):
+                if mimetype == "text/html":
+                    html = content
+                    break
+            queue_email(
+                msg.subject, msg.body, msg.to, html_body=html, from_email=msg.from_email,
+                cc=msg.cc, bcc=msg.bcc, reply_to=msg.reply_to,
+            )
+            count += 1
+        return count
+
+
+def _to_message(row, connection):
+    msg = EmailMultiAlternatives(
+        subject=row.subject, body=row.body, from_email=row.from_email or None,
+        to=row.to, cc=row.cc, bcc=row.bcc, reply_to=row.reply_to, connection=connection,
+    )
+    if row.html_body:
+        msg.attach_alternative(row.html_body, "text/html")
+    return msg
+
+
+def _claim(batch_size):
+    """Nhận tối đa batch_size email tới hạn; UPDATE có điều kiện để 2 worker không lấy trùng."""
+    now = timezone.now()
+    due = (
+        Q(status=OutboxEmail.Status.QUEUED, next_attempt_at__lte=now)
+        | Q(status=OutboxEmail.Status.SENDING, claimed_at__lt=now - CLAIM_TIMEOUT)
+    )
+    ids = list(
+        OutboxEmail.objects.filter(due).order_by("next_attempt_at", "pk").values_list("pk", flat=True)[:batch_size]
+    )
+    if not ids:
+        return []
+    OutboxEmail.objects.filter(due, pk__in=ids).update(status=OutboxEmail.Status.SENDING, claimed_at=now)
+    return list(OutboxEmail.objects.filter(pk__in=ids, status=OutboxEmail.Status.SENDING, claimed_at=now))
+
+
+def _retry_later(row, error, max_attempts):
+    row.attempts += 1
+    row.last_error = f"{type(error).__name__}: {error}"[:2000]
+    if row.attempts >= max_attempts:
+        row.status = OutboxEmail.Status.FAILED
+    else:
+        row.status = OutboxEmail.Status.QUEUED
+        row.next_attempt_at = timezone.now() + timedelta(seconds=BACKOFF_SECONDS * 2 ** (row.attempts - 1))
+    row.save(update_fields=["attempts", "last_error", "status", "next_attempt_at"])
+
+
+def send_queued(batch_size=50, max_attempts=MAX_ATTEMPTS, backend=None):
+    """
+    Gửi 1 lô. Trả về (số đã gửi, số lỗi).
+    Gọi ngoài transaction (job outbox.send có atomic=False): claim và trạng thái từng email commit riêng.
+    """
+    rows = _claim(batch_size)
+    if not rows:
+        return 0, 0
+
+    backend = backend or getattr(settings, "GLAMUP_OUTBOX_DELIVERY_BACKEND", DEFAULT_DELIVERY_BACKEND)
+    connection = get_connection(backend, fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        # không mở được kết nối SMTP: cả lô về hàng đợi, tính 1 lần thử
+        for row in rows:
+            _retry_later(row, e, max_attempts)
+        return 0, len(rows)
+
+    sent = failed = 0
+    try:
+        for row in rows:
+            try:
+                connection.send_messages([_to_message(row, connection)])
+            except Exception as e:
+                failed += 1
+                _retry_later(row, e, max_attempts)
+            else:
+                sent += 1
+                row.attempts += 1
+                row.status = OutboxEmail.Status.SENT
+                row.sent_at = timezone.now()
+                row.save(update_fields=["attempts", "status", "sent_at"])
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            pass
+    return sent, failed
@@ -0,0 +1,113 @@
+# main/ratings.py
+"""
+Điểm rating tổng hợp lưu sẵn trên Service (count / sum / avg / số review theo sao).
+Chỉ tính các Review PUBLISHED.
+  - Review.save() / xoá Review  -> apply_review_change() cộng/trừ chênh lệch bằng F()
+  - manage.py rebuild_service_ratings -> rebuild_service_ratings() tính lại hàng loạt
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, FloatField, Q, Sum
+from django.db.models.functions import Cast
+
+from . import catalog
+
+STAR_FIELDS = ["rating_1", "rating_2", "rating_3", "rating_4", "rating_5"]
+
+
+def star_bucket(rating) -> int:
+    """Làm tròn rating (0–5) về số sao 1–5 để đếm histogram (0 tính là 1 sao)."""
+    stars = int(Decimal(str(rating or 0)).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+    return min(5, max(1, stars))
+
+
+def _contribution(service_id, status, rating):
+    """(service_id, rating, sao) nếu review đang được tính vào tổng, ngược lại None."""
+    from .models import Review
+
+    if service_id and status == Review.Status.PUBLISHED:
+        rating = Decimal(str(rating or 0))
+        return service_id, rating, star_bucket(rating)
+    return None
+
+
+def _apply(service_id, sign, rating, stars):
+    from .models import Service
+
+    Service.objects.filter(pk=service_id).update(**{
+        "rating_count": F("rating_count") + sign,
+        "rating_sum": F("rating_sum") + sign * rating,
+        STAR_FIELDS[stars - 1]: F(STAR_FIELDS[stars - 1]) + sign,
+    })
+
+
+def _refresh_avg(service_ids):
+    from .models import Service
+
+    qs = Service.objects.filter(pk__in=service_ids)
+    # ép float để SQLite không chia nguyên khi rating_sum đang là số tròn
+    avg = ExpressionWrapper(
+        Cast("rating_sum", FloatField()) / F("rating_count"),
+        output_field=DecimalField(max_digits=3, decimal_places=2),
+    )
+    qs.filter(rating_count__gt=0).update(rating_avg=avg)
+    qs.filter(rating_count__lte=0).update(rating_avg=Decimal("0"))
+
+
+def apply_review_change(old, new):
+    """
+    old/new: (service_id, status, rating) trước & sau khi lưu (None nếu tạo mới / đã xoá).
+    Không làm gì nếu phần đóng góp vào tổng không đổi (vd: admin chỉ sửa admin_reply).
+    """
+    before = _contribution(*old) if old else None
+    after = _contribution(*new) if new else None
+    if before == after:
+        return
+
+    with transaction.atomic():
+        if before:
+            _apply(before[0], -1, before[1], before[2])
+        if after:
+            _apply(after[0], 1, after[1], after[2])
+        _refresh_avg({c[0] for c in (before, after) if c})
+
+
+def rebuild_service_ratings(service_ids=None):
+    """Tính lại toàn bộ aggregate bằng 1 query GROUP BY + bulk_update. Trả về số service đã ghi."""
+    from .models import Review, Service
+
+    published = Q(reviews__status=Review.Status.PUBLISHED)
+    star_ranges = {
+        "rating_1": Q(reviews__rating__lt=Decimal("1.5")),
+        "rating_2": Q(reviews__rating__gte=Decimal("1.5"), reviews__rating__lt=Decimal("2.5")),
+        "rating_3": Q(reviews__rating__gte=Decimal("2.5"), reviews__rating__lt=Decimal("3.5")),
+        "rating_4": Q(reviews__rating__gte=Decimal("3.5"), reviews__rating__lt=Decimal("4.5")),
+        "rating_5": Q(reviews__rating__gte=Decimal("4.5")),
+    }
+
+    qs = Service.objects.all()
+    if service_ids is not None:
+        qs = qs.filter(pk__in=service_ids)
+    rows = qs.values("pk").annotate(
+        cnt=Count("reviews", filter=published),
+        total=Sum("reviews__rating", filter=published),
+        **{f: Count("reviews", filter=published & cond) for f, cond in star_ranges.items()},
+    ).order_by()
+
+    services = []
+    for row in rows:
+        cnt = row["cnt"] or 0
+        total = Decimal(str(row["total"] or 0))
+        s = Service(pk=row["pk"], rating_count=cnt, rating_sum=total)
+        s.rating_avg = (total / cnt).quantize(Decimal("0.01")) if cnt else Decimal("0")
+        for f in STAR_FIELDS:
+            setattr(s, f, row[f])
+        services.append(s)
+
+    Service.objects.bulk_update(
+        services, ["rating_count", "rating_sum", "rating_avg", *STAR_FIELDS], batch_size=500
+    )
+    # bulk_update không bắn post_save -> tự xoá cache catalog
+    transaction.on_commit(catalog.invalidate)
+    return len(services)
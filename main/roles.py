@@ -0,0 +1,83 @@
+# main/roles.py
+"""
+Phân quyền theo nhóm, load tên group của user đúng 1 lần / request.
+
+  - group_names(user): frozenset tên group, nhớ trên chính object user
+    (request.user sống hết 1 request -> is_admin / is_customer / ... gọi bao nhiêu lần cũng chỉ 1 query)
+  - RolesMiddleware: gắn request.roles (lazy, khách chưa đăng nhập không tốn query)
+  - roles_context: đưa `roles` vào template
+"""
+from django.utils.functional import SimpleLazyObject
+
+_CACHE_ATTR = "_group_names"
+
+
+def group_names(user) -> frozenset:
+    if not getattr(user, "is_authenticated", False):
+        return frozenset()
+    names = getattr(user, _CACHE_ATTR, None)
+    if names is None:
+        try:
+            names = frozenset(user.groups.values_list("name", flat=True))
+        except Exception:
+            names = frozenset()
+        setattr(user, _CACHE_ATTR, names)
+    return names
+
+
+def forget_group_names(user):
+    """Gọi khi group của user vừa đổi (signals.py)."""
+    user.__dict__.pop(_CACHE_ATTR, None)
+
+
+class Roles:
+    """Các cờ quyền của 1 user, cùng logic với is_admin / is_staff_user / ... trong views."""
+
+    def __init__(self, user):
+        self.user = user
+        self.groups = group_names(user)
+        authed = bool(getattr(user, "is_authenticated", False))
+        role = getattr(user, "role", "")
+
+        self.is_authenticated = authed
+        self.is_admin = authed and (
+            user.is_superuser or user.is_staff or role == "ADMIN" or "Admin" in self.groups
+        )
+        self.is_receptionist = authed and "Receptionist" in self.groups
+        self.is_technician = authed and "Technician" in self.groups
+        self.is_staff = authed and (
+            user.is_staff or role == "STAFF" or self.is_receptionist or self.is_technician
+            or "Staff" in self.groups
+        )
+        self.is_customer = authed and not self.is_admin and not self.is_staff
+
+    def __contains__(self, group_name):
+        return group_name in self.groups
+
+    def __repr__(self):
+        flags = [f for f in ("admin", "staff", "receptionist", "technician", "customer") if getattr(self, f"is_{f}")]
+        return f"<Roles {getattr(self.user, 'username', '')}: {', '.join(flags) or 'anonymous'}>"
+
+
+def roles_for(user) -> Roles:
+    roles = getattr(user, "_roles", None)
+    if roles is None or roles.groups is not group_names(user):
+        roles = Roles(user)
+        if getattr(user, "is_authenticated", False):
+            user._roles = roles
+    return roles
+
+
+class RolesMiddleware:
+    """Đặt sau AuthenticationMiddleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.roles = SimpleLazyObject(lambda: roles_for(request.user))
+        return self.get_response(request)
+
+
+def roles_context(request):
+    return {"roles": getattr(request, "roles", None) or roles_for(getattr(request, "user", None))}
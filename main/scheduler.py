@@ -0,0 +1,134 @@
+# main/scheduler.py
+"""
+Các việc theo giờ cho lịch hẹn, chạy bởi `manage.py run_scheduler` (mỗi phút 1 lượt):
+
+  - send_reminders()  : lịch ngày mai chưa nhắc -> xếp email nhắc vào outbox theo lô
+  - release_holds()   : lịch giữ chỗ tạm (PENDING, chờ thanh toán ONLINE) quá hạn -> CANCELED, trả chỗ KTV
+  - flag_no_shows()   : lịch đã quá giờ bắt đầu + grace mà khách chưa đến -> NO_SHOW, trả chỗ KTV
+  - idempotency.purge(): xoá khoá chống submit trùng quá GLAMUP_IDEMPOTENCY_TTL_HOURS
+
+Mỗi việc quét theo khoảng ngày (index appointment_date / (branch, date, status))
+và cập nhật bằng 1 câu UPDATE cho cả lô, không save() từng dòng.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .availability import BUSY_STATUSES
+from .heatmap import invalidate as invalidate_heatmap
+from .idempotency import purge as purge_idempotency_keys
+from .jobs import enqueue
+from .models import Appointment, OutboxEmail, StaffSlot
+from .waitlist import slots_freed
+
+REMINDER_BATCH = 500
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _finish(ids, status, from_statuses):
+    """
+    Đổi trạng thái cả lô + trả sổ giữ chỗ + hẹn tính lại số liệu dashboard / xoá cache heatmap
+    cho các ngày bị ảnh hưởng (huỷ thì hẹn thêm match danh sách chờ cho các ngày đó).
+    """
+    if not ids:
+        return 0
+    with transaction.atomic():
+        # chỉ đổi các lịch vẫn còn đúng trạng thái lúc quét (tránh ghi đè check-in vừa xảy ra)
+        rows = list(
+            Appointment.objects.select_for_update()
+            .filter(pk__in=ids, status__in=from_statuses)
+            .values_list("pk", "branch_id", "appointment_date")
+        )
+        ids = [pk for pk, _, _ in rows]
+        Appointment.objects.filter(pk__in=ids).update(status=status)
+        StaffSlot.objects.filter(appointment_id__in=ids).delete()
+        days = {(b, d) for _, b, d in rows}
+        for branch_id, day in days:
+            enqueue("stats.refresh_daily", branch_id=branch_id, day=day.isoformat())
+            invalidate_heatmap(branch_id, day)
+        if status == Appointment.Status.CANCELED:
+            slots_freed(ids, days)
+    return len(ids)
+
+
+def send_reminders(now=None):
+    """Nhắc lịch ngày mai (1 email / lịch, dedupe theo reminder:<id>). Trả về số lịch đã nhắc."""
+    now = now or timezone.now()
+    tomorrow = timezone.localdate(now) + timedelta(days=1)
+    total = 0
+    while True:
+        batch = list(
+            Appointment.objects
+            .filter(appointment_date=tomorrow, status__in=BUSY_STATUSES, reminder_sent_at__isnull=True)
+            .exclude(customer__email="")
+            .select_related("branch", "customer")
+            .order_by("pk")[:REMINDER_BATCH]
+        )
+        if not batch:
+            break
+        mails = []
+        for appt in batch:
+            name = appt.customer.full_name or appt.customer.username
+            mails.append(OutboxEmail(
+                subject=f"Reminder: your GlamUp Nails appointment tomorrow at {appt.appointment_time:%H:%M}",
+                body=(
+                    f"Dear {name},\n\n"
+                    f"This is a reminder of your appointment BK{appt.id:06d} on "
+                    f"{appt.appointment_date:%d/%m/%Y} at {appt.appointment_time:%H:%M}, "
+                    f"{appt.branch.name} ({appt.branch.address}).\n\n"
+                    "If you can no longer come, please cancel it from My Appointments.\n"
+                    "See you soon!\n"
+                ),
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=[appt.customer.email],
+                dedupe_key=f"reminder:{appt.id}",
+            ))
+        with transaction.atomic():
+            OutboxEmail.objects.bulk_create(mails, ignore_conflicts=True)
+            Appointment.objects.filter(pk__in=[a.pk for a in batch]).update(reminder_sent_at=now)
+        total += len(batch)
+    if total:
+        enqueue("outbox.send")
+    return total
+
+
+def release_holds(now=None):
+    """Giữ chỗ tạm đã quá hold_expires_at mà chưa thanh toán -> CANCELED (cả lô, 1 câu UPDATE)."""
+    now = now or timezone.now()
+    ids = list(
+        Appointment.objects
+        .filter(status=Appointment.Status.PENDING, hold_expires_at__lte=now)
+        .values_list("pk", flat=True)
+    )
+    return _finish(ids, Appointment.Status.CANCELED, [Appointment.Status.PENDING])
+
+
+def flag_no_shows(now=None, lookback_days=7):
+    """Lịch PENDING/CONFIRMED đã quá giờ bắt đầu + GLAMUP_NO_SHOW_GRACE_MINUTES mà chưa check-in -> NO_SHOW."""
+    now = now or timezone.now()
+    local_now = timezone.localtime(now) - timedelta(minutes=_setting("GLAMUP_NO_SHOW_GRACE_MINUTES", 30))
+    today = local_now.date()
+    past = (
+        Q(appointment_date__gte=today - timedelta(days=lookback_days), appointment_date__lt=today)
+        | Q(appointment_date=today, appointment_time__lt=local_now.time())
+    )
+    waiting = [Appointment.Status.PENDING, Appointment.Status.CONFIRMED]
+    ids = list(Appointment.objects.filter(past, status__in=waiting).values_list("pk", flat=True))
+    return _finish(ids, Appointment.Status.NO_SHOW, waiting)
+
+
+def tick(now=None):
+    """1 lượt của scheduler. Trả về dict số lịch đã xử lý."""
+    now = now or timezone.now()
+    return {
+        "holds_released": release_holds(now),
+        "no_show": flag_no_shows(now),
+        "reminded": send_reminders(now),
+        "idempotency_purged": purge_idempotency_keys(now),
+    }
@@ -0,0 +1,73 @@
+# main/signals.py
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import catalog, heatmap
+from .availability import BUSY_STATUSES, release_slots
+from .models import Appointment, AppointmentService, AppointmentStaff, Review, Service, StaffSchedule, User
+from .roles import forget_group_names
+from .ratings import apply_review_change
+from .waitlist import slots_freed
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    # bắt cả trường hợp xoá dây chuyền (xoá Appointment / customer) chứ không chỉ Review.delete()
+    apply_review_change((instance.service_id, instance.status, instance.rating), None)
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def catalog_changed(sender, **kwargs):
+    # xoá sau commit để request khác không cache lại dữ liệu cũ trong lúc transaction chưa xong
+    transaction.on_commit(catalog.invalidate)
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_status_changed(sender, instance, created, update_fields=None, **kwargs):
+    # lịch hết giữ KTV (huỷ / xong) -> trả các ô trong sổ giữ chỗ
+    if created or (update_fields is not None and "status" not in update_fields):
+        return
+    if instance.status not in BUSY_STATUSES:
+        release_slots(instance.pk)
+    if instance.status == Appointment.Status.CANCELED:
+        # giờ vừa trống -> mời khách trong danh sách chờ
+        slots_freed([instance.pk], {(instance.branch_id, instance.appointment_date)})
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+@receiver(post_save, sender=AppointmentStaff)
+@receiver(post_delete, sender=AppointmentStaff)
+@receiver(post_save, sender=StaffSchedule)
+@receiver(post_delete, sender=StaffSchedule)
+def month_availability_changed(sender, instance, origin=None, **kwargs):
+    # đặt / huỷ / đổi KTV / duyệt ca -> xoá cache heatmap của tháng đó
+    if sender is StaffSchedule:
+        heatmap.invalidate(instance.branch_id, instance.work_date)
+    elif sender is AppointmentStaff:
+        if isinstance(origin, Appointment):
+            return  # xoá cả lịch: receiver của Appointment lo
+        appt = instance.appointment
+        heatmap.invalidate(appt.branch_id, appt.appointment_date)
+    else:
+        heatmap.invalidate(instance.branch_id, instance.appointment_date)
+
+
+@receiver(post_save, sender=AppointmentService)
+@receiver(post_delete, sender=AppointmentService)
+def service_lines_changed(sender, instance, origin=None, **kwargs):
+    # thêm/bớt dịch vụ -> tính lại duration_minutes (và end_time trong Appointment.save)
+    if isinstance(origin, Appointment):
+        return  # cả lịch đang bị xoá
+    instance.appointment.recalc_duration()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, **kwargs):
+    # object user đang giữ trong request phải load lại danh sách group
+    if action in ("post_add", "post_remove", "post_clear") and isinstance(instance, User):
+        forget_group_names(instance)
@@ -0,0 +1,182 @@
+# main/stats.py
+"""
+Bảng gộp DailyBranchServiceStats cho admin dashboard.
+
+Mỗi khi 1 lịch hẹn đổi (đặt / thanh toán / check-out / huỷ) chỉ tính lại đúng
+ô (ngày, chi nhánh) của lịch đó -> vài query GROUP BY trên 1 ngày dữ liệu.
+Tính lại cả khoảng ngày: rebuild_daily_stats() / manage.py rebuild_daily_stats.
+Job tính lại chạy bằng manage.py run_workers; worker chưa chạy kịp thì dashboard tự tính
+các ô còn thiếu / còn job chờ (ensure_daily_stats) trước khi đọc.
+"""
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, Sum
+from django.utils import timezone
+
+from .jobs import enqueue
+from .models import Appointment, AppointmentService, DailyBranchServiceStats, Job, Payment
+
+
+def _appt_filter(date_from, date_to, branch_id=None, prefix=""):
+    q = Q(**{f"{prefix}appointment_date__range": (date_from, date_to)}) & ~Q(**{f"{prefix}status": Appointment.Status.CANCELED})
+    if branch_id:
+        q &= Q(**{f"{prefix}branch_id": branch_id})
+    return q
+
+
+def service_lines(date_from, date_to, branch_id=None):
+    """
+    AppointmentService của các lịch chưa huỷ trong khoảng ngày (JOIN thẳng Appointment,
+    không dùng IN (...)), kèm cờ is_paid = EXISTS(Payment PAID) và line_total = unit_price × quantity.
+    """
+    paid = Exists(Payment.objects.filter(
+        appointment_id=OuterRef("appointment_id"), status=Payment.Status.PAID
+    ))
+    return (
+        AppointmentService.objects
+        .filter(_appt_filter(date_from, date_to, branch_id, prefix="appointment__"))
+        .annotate(is_paid=paid, line_total=F("unit_price") * F("quantity"))
+    )
+
+
+def _compute(date_from, date_to, branch_id=None):
+    """Trả về list DailyBranchServiceStats (chưa lưu) cho khoảng ngày."""
+    appt_filter = _appt_filter(date_from, date_to, branch_id)
+
+    # ---- theo dịch vụ ----
+    service_rows = (
+        service_lines(date_from, date_to, branch_id)
+        .values("appointment__appointment_date", "appointment__branch_id", "service_id")
+        .annotate(
+            bookings=Count("appointment_id", distinct=True),
+            lines=Count("id"),
+            paid_lines=Count("id", filter=Q(is_paid=True)),
+            revenue=Sum("line_total"),
+            paid_revenue=Sum("line_total", filter=Q(is_paid=True)),
+        )
+        .order_by()
+    )
+
+    stats = []
+    line_totals = defaultdict(lambda: [0, 0])  # (date, branch) -> [lines, paid_lines]
+    for r in service_rows:
+        key = (r["appointment__appointment_date"], r["appointment__branch_id"])
+        line_totals[key][0] += r["lines"]
+        line_totals[key][1] += r["paid_lines"]
+        stats.append(DailyBranchServiceStats(
+            date=key[0], branch_id=key[1], service_id=r["service_id"],
+            bookings=r["bookings"], lines=r["lines"], paid_lines=r["paid_lines"],
+            revenue=r["revenue"] or Decimal("0"), paid_revenue=r["paid_revenue"] or Decimal("0"),
+        ))
+
+    # ---- dòng tổng (service = NULL) ----
+    paid_amounts = {
+        (r["appointment__appointment_date"], r["appointment__branch_id"]): r["total"]
+        for r in (
+            Payment.objects
+            .filter(_appt_filter(date_from, date_to, branch_id, prefix="appointment__"), status=Payment.Status.PAID)
+            .values("appointment__appointment_date", "appointment__branch_id")
+            .annotate(total=Sum("amount"))
+            .order_by()
+        )
+    }
+    totals = (
+        Appointment.objects.filter(appt_filter)
+        .values("appointment_date", "branch_id")
+        .annotate(bookings=Count("id"), revenue=Sum("total_price"))
+        .order_by()
+    )
+    for r in totals:
+        key = (r["appointment_date"], r["branch_id"])
+        lines, paid_lines = line_totals.get(key, (0, 0))
+        stats.append(DailyBranchServiceStats(
+            date=key[0], branch_id=key[1], service=None,
+            bookings=r["bookings"], lines=lines, paid_lines=paid_lines,
+            revenue=r["revenue"] or Decimal("0"), paid_revenue=paid_amounts.get(key) or Decimal("0"),
+        ))
+    return stats
+
+
+def rebuild_daily_stats(date_from, date_to, branch_id=None):
+    """Xoá & ghi lại các dòng gộp trong khoảng ngày. Trả về số dòng đã ghi."""
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                old = DailyBranchServiceStats.objects.filter(date__range=(date_from, date_to))
+                if branch_id:
+                    old = old.filter(branch_id=branch_id)
+                old.delete()
+                stats = _compute(date_from, date_to, branch_id)
+                DailyBranchServiceStats.objects.bulk_create(stats, batch_size=1000)
+                return len(stats)
+        except IntegrityError:
+            # 2 request cùng refresh 1 ô -> chạy lại 1 lần là đủ
+            if attempt:
+                raise
+
+
+def refresh_daily_stats(branch_id, day):
+    return rebuild_daily_stats(day, day, branch_id)
+
+
+def _pending_refresh_jobs(date_from, date_to, branch_id=None):
+    """Job stats.refresh_daily còn QUEUED của khoảng ngày (lọc trên payload bằng SQL)."""
+    qs = Job.objects.filter(
+        name="stats.refresh_daily", status=Job.Status.QUEUED,
+        payload__day__gte=date_from.isoformat(), payload__day__lte=date_to.isoformat(),
+    )
+    if branch_id:
+        qs = qs.filter(payload__branch_id=int(branch_id))
+    return qs
+
+
+def stale_cells(date_from, date_to, branch_id=None):
+    """
+    Các ô (ngày, chi nhánh) trong khoảng mà bảng gộp có thể đã cũ:
+    còn job stats.refresh_daily chưa worker nào nhận, hoặc có lịch mà chưa có dòng tổng.
+    Trả về ({(ngày, chi nhánh), ...}, [id job đang chờ]).
+    """
+    cells, job_ids = set(), []
+    for pk, payload in _pending_refresh_jobs(date_from, date_to, branch_id).values_list("pk", "payload"):
+        cells.add((date.fromisoformat(payload["day"]), payload["branch_id"]))
+        job_ids.append(pk)
+
+    booked = (
+        Appointment.objects.filter(_appt_filter(date_from, date_to, branch_id))
+        .values_list("appointment_date", "branch_id").distinct().order_by()
+    )
+    rolled = DailyBranchServiceStats.objects.filter(date__range=(date_from, date_to), service__isnull=True)
+    if branch_id:
+        rolled = rolled.filter(branch_id=branch_id)
+    cells |= set(booked) - set(rolled.values_list("date", "branch_id"))
+    return cells, job_ids
+
+
+def ensure_daily_stats(date_from, date_to, branch_id=None):
+    """
+    Dashboard gọi trước khi đọc bảng gộp: tính lại đúng các ô cũ và đánh dấu DONE các job của
+    các ô đó (cùng transaction) -> lần tải sau chỉ còn vài SELECT, không ghi lại. Trả về số ô đã tính.
+    """
+    cells, job_ids = stale_cells(date_from, date_to, branch_id)
+    if not cells:
+        return 0
+    with transaction.atomic():
+        # nhận job trước (giống worker claim): worker nào đã lấy job thì để worker chạy nốt
+        if job_ids:
+            Job.objects.filter(pk__in=job_ids, status=Job.Status.QUEUED).update(
+                status=Job.Status.DONE, finished_at=timezone.now(),
+            )
+        for day, cell_branch in sorted(cells):
+            refresh_daily_stats(cell_branch, day)
+    return len(cells)
+
+
+def schedule_daily_stats_refresh(appt):
+    """
+    Gọi từ view sau khi đổi lịch/thanh toán; worker tính lại sau khi transaction commit (job stats.refresh_daily).
+    Cả ngày chỉ cần 1 lần tính lại -> (chi nhánh, ngày) đã có job chờ thì không thêm.
+    """
+    enqueue("stats.refresh_daily", unique=True, branch_id=appt.branch_id, day=appt.appointment_date.isoformat())
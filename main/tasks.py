@@ -0,0 +1,38 @@
+# main/tasks.py
+"""Các job chạy nền (đăng ký vào main.jobs khi app load, xem apps.py)."""
+from datetime import date
+
+from .jobs import job
+from .models import Appointment
+
+
+@job("loyalty.award")
+def award_loyalty(appointment_id):
+    from .loyalty import award_for_appointment
+
+    # khoá dòng lịch hẹn để 2 worker không cộng điểm 2 lần
+    appt = Appointment.objects.select_for_update().select_related("customer").filter(pk=appointment_id).first()
+    if appt and appt.status == Appointment.Status.DONE:
+        award_for_appointment(appt)
+
+
+@job("stats.refresh_daily")
+def refresh_daily(branch_id, day):
+    from .stats import refresh_daily_stats
+
+    refresh_daily_stats(branch_id, date.fromisoformat(day))
+
+
+@job("waitlist.match")
+def match_waitlist(branch_id, day):
+    from .waitlist import match_day
+
+    match_day(branch_id, date.fromisoformat(day))
+
+
+@job("outbox.send", atomic=False)
+def send_outbox(batch_size=50):
+    # mỗi email được đánh dấu SENT / hẹn lại và commit riêng ngay sau khi gửi
+    from .outbox import send_queued
+
+    send_queued(batch_size)
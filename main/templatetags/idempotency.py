@@ -0,0 +1,19 @@
+# main/templatetags/idempotency.py
+from django import template
+from django.utils.html import format_html
+
+from main.idempotency import FIELD_NAME, new_key
+
+register = template.Library()
+
+
+@register.simple_tag
+def idempotency_key():
+    """Khoá mới cho 1 link thay đổi dữ liệu. Dùng: href="...?idempotency_key={% idempotency_key %}" """
+    return new_key()
+
+
+@register.simple_tag
+def idempotency_field():
+    """Input ẩn chứa khoá mới, đặt trong <form method="post">. Dùng: {% idempotency_field %}"""
+    return format_html('<input type="hidden" name="{}" value="{}">', FIELD_NAME, new_key())
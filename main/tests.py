@@ -1,3 +1,791 @@
-from django.test import TestCase
+import json
+import threading
+from datetime import time as dtime, timedelta
+from decimal import Decimal
+from time import sleep
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group
+from django.core.mail.backends import locmem
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from main import heatmap, idempotency, loyalty, waitlist
+from main.assignment import optimize_day
+from main.availability import DayAvailability, slot_range
+from main.booking import create_booking
+from main.events import board_channel, get_broker, publish_appointment_event
+from main.jobs import claim, enqueue, run_pending
+from main.management.commands.check_query_plans import BACKENDS, capture_plans, compare_plans, snapshot_path
+from main.models import (
+    Appointment, AppointmentService, AppointmentStaff, Branch, IdempotencyKey, Job, LoyaltyPoints, LoyaltyTransaction,
+    OutboxEmail, Payment, Service, StaffSchedule, StaffSlot, User,
+)
+from main.outbox import queue_email
+from main.stats import rebuild_daily_stats, schedule_daily_stats_refresh
+from main.views import RX_PAGE_SIZE
+
+
+def _service(name="Test manicure", price="150000", duration=60):
+    return Service.objects.create(service_name=name, price=Decimal(price), duration=duration)
+
+
+def _appointment(customer, branch, svc, day, at, status, paid=False):
+    """1 lịch hẹn đủ bộ như lúc đặt thật: dòng dịch vụ + payment."""
+    appt = Appointment.objects.create(
+        customer=customer, branch=branch, appointment_date=day, appointment_time=at,
+        duration_minutes=svc.duration, status=status, total_price=svc.price,
+    )
+    AppointmentService.objects.create(appointment=appt, service=svc, quantity=1, unit_price=svc.price)
+    Payment.objects.create(
+        appointment=appt, amount=svc.price, method=Payment.Method.CASH,
+        status=Payment.Status.PAID if paid else Payment.Status.UNPAID,
+    )
+    return appt
+
+
+def _retry_locked(fn, *args):
+    # SQLite chỉ cho 1 writer: "database is locked" thì thử lại (lần sau sẽ thấy dữ liệu bên thắng đã ghi)
+    for _ in range(50):
+        try:
+            return fn(*args)
+        except OperationalError:
+            sleep(0.01)
+    raise AssertionError("database stayed locked")
+
+
+def _run_concurrently(calls):
+    """Chạy các hàm không tham số cùng lúc (mỗi hàm 1 thread, xuất phát cùng nhau). Trả về (results, errors)."""
+    results, errors = [], []
+    barrier = threading.Barrier(len(calls))
+
+    def worker(fn):
+        try:
+            barrier.wait()
+            results.append(_retry_locked(fn))
+        except Exception as e:  # báo lại ở thread chính
+            errors.append(e)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(fn,)) for fn in calls]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+class MyAppointmentsQueryCountTests(TestCase):
+    """my_appointments: số query không được tăng theo số lịch hẹn của khách (không N+1)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name="Test branch", address="-")
+        cls.svc = _service()
+        cls.customer = User.objects.create_user("qc_customer")
+
+    def _add_history(self, n):
+        today = timezone.localdate()
+        for i in range(n):
+            _appointment(self.customer, self.branch, self.svc, today + timedelta(days=i + 1), dtime(9, 0),
+                         Appointment.Status.CONFIRMED)
+            _appointment(self.customer, self.branch, self.svc, today - timedelta(days=i + 1), dtime(10, 0),
+                         Appointment.Status.DONE, paid=True)
+
+    def _get(self):
+        response = self.client.get(reverse("main:my_appointments"))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_query_count_does_not_grow_with_history(self):
+        self.client.force_login(self.customer)
+
+        self._add_history(2)
+        self._get()  # làm nóng cache (catalog, roles) trước khi đếm
+        with CaptureQueriesContext(connection) as small:
+            response = self._get()
+        expected = len(small)  # đọc ngay: mỗi request mới sẽ reset connection.queries
+        self.assertEqual(len(response.context["upcoming"]), 2)
+
+        self._add_history(20)
+        self._get()
+        with self.assertNumQueries(expected):
+            response = self._get()
+        self.assertEqual(len(response.context["upcoming"]), 22)
+        self.assertEqual(len(response.context["completed"]), 12)
+
+
+class ReceptionistQueryCountTests(TestCase):
+    """Lễ tân: số query cố định dù 1 ngày có hàng trăm lịch; phân trang keyset không trùng / sót dòng."""
+
+    BUSY = 500
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name="Test branch", address="-")
+        cls.svc = _service()
+        cls.tech = User.objects.create_user("rx_tech", role=User.Role.STAFF, full_name="Tech")
+        cls.receptionist = User.objects.create_user("rx_receptionist", role=User.Role.STAFF)
+        cls.receptionist.groups.add(Group.objects.get_or_create(name="Receptionist")[0])
+
+        cls.busy_day = timezone.localdate() + timedelta(days=1)
+        cls.quiet_day = cls.busy_day + timedelta(days=1)
+        customers = [User.objects.create_user(f"rx_customer{i}") for i in range(20)]
+
+        # bulk_create: không cần signal lịch trống / heatmap cho dữ liệu đọc
+        # nhiều lịch trùng giờ -> con trỏ phải phân định bằng id
+        rows = [
+            Appointment(
+                customer=customers[i % len(customers)], branch=cls.branch, appointment_date=cls.busy_day,
+                appointment_time=dtime(8 + (i % 10), 30 * (i % 2)), duration_minutes=60,
+                status=Appointment.Status.CONFIRMED, total_price=cls.svc.price,
+            )
+            for i in range(cls.BUSY)
+        ] + [
+            Appointment(
+                customer=customers[i], branch=cls.branch, appointment_date=cls.quiet_day,
+                appointment_time=dtime(9 + i, 0), duration_minutes=60,
+                status=Appointment.Status.CONFIRMED, total_price=cls.svc.price,
+            )
+            for i in range(3)
+        ]
+        appts = Appointment.objects.bulk_create(rows)
+        AppointmentService.objects.bulk_create(
+            AppointmentService(appointment=a, service=cls.svc, quantity=1, unit_price=cls.svc.price) for a in appts
+        )
+        AppointmentStaff.objects.bulk_create(AppointmentStaff(appointment=a, staff=cls.tech) for a in appts[::2])
+
+    def setUp(self):
+        self.client.force_login(self.receptionist)
+
+    def _count(self, url, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx)
+
+    def test_dashboard_query_count_is_constant(self):
+        url = reverse("main:receptionist_dashboard")
+        self.client.get(url)  # làm nóng cache
+
+        quiet, quiet_n = self._count(url, {"date": self.quiet_day.isoformat()})
+        busy, busy_n = self._count(url, {"date": self.busy_day.isoformat()})
+
+        self.assertEqual(len(quiet.context["appointments"]), 3)
+        self.assertEqual(len(busy.context["appointments"]), self.BUSY)
+        self.assertEqual(busy_n, quiet_n)
+
+    def test_appointments_keyset_pages(self):
+        url = reverse("main:receptionist_appointments")
+        self.client.get(url)
+
+        expected = list(
+            Appointment.objects.filter(appointment_date__gte=timezone.localdate())
+            .order_by("appointment_date", "appointment_time", "id")
+            .values_list("id", flat=True)
+        )
+        seen, counts, cursor = [], set(), ""
+        while True:
+            response, n = self._count(url, {"after": cursor} if cursor else None)
+            ids = [item["id"] for item in response.context["items"]]
+            self.assertLessEqual(len(ids), RX_PAGE_SIZE)
+            seen.extend(ids)
+            counts.add(n)
+            cursor = response.context["next_cursor"]
+            if not cursor:
+                break
+
+        self.assertEqual(len(seen), len(set(seen)))  # không trùng giữa các trang
+        self.assertEqual(seen, expected)             # không sót, đúng thứ tự
+        self.assertEqual(len(counts), 1, f"query count varies between pages: {sorted(counts)}")
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """Nhiều request cùng đặt 1 giờ của 1 KTV: sổ StaffSlot chỉ cho đúng 1 bên thắng."""
+
+    THREADS = 8
+
+    def setUp(self):
+        self.branch = Branch.objects.create(name="Test branch", address="-")
+        self.svc = _service()
+        self.tech = User.objects.create_user("cb_tech", role=User.Role.STAFF)
+        self.customers = [User.objects.create_user(f"cb_customer{i}") for i in range(self.THREADS)]
+        self.day = timezone.localdate() + timedelta(days=1)
+        StaffSchedule.objects.create(
+            staff=self.tech, work_date=self.day, shift=StaffSchedule.Shift.MORNING,
+            status=StaffSchedule.Status.APPROVED, branch=self.branch,
+        )
+
+    def test_one_booking_wins(self):
+        start = dtime(9, 0)
+        # mọi thread cùng thấy KTV còn rảnh (giống các request đọc chỉ mục trước khi ai kịp ghi)
+        candidates = DayAvailability.load(self.branch, self.day).free_staff(start, self.svc.duration)
+        self.assertEqual(candidates, [self.tech.pk])
+
+        results, errors = _run_concurrently([
+            lambda c=c: create_booking(c, self.branch.pk, self.day, start, self.svc, candidates)[1]
+            for c in self.customers
+        ])
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), self.THREADS)
+        self.assertEqual(results.count(self.tech.pk), 1)
+        self.assertEqual(results.count(None), self.THREADS - 1)
+
+        booked = Appointment.objects.get()
+        self.assertEqual(booked.staff_lines.get().staff_id, self.tech.pk)
+        self.assertEqual(booked.payments.count(), 1)
+        slots = list(StaffSlot.objects.filter(staff=self.tech, date=self.day).values_list("slot", "appointment_id"))
+        self.assertEqual(sorted(n for n, _ in slots), list(slot_range(start, self.svc.duration)))
+        self.assertEqual({a for _, a in slots}, {booked.pk})
+
+
+class LoyaltyConcurrencyTests(TransactionTestCase):
+    """Nhiều request cùng cộng / trừ điểm trên 1 số dư: không mất điểm, không tiêu trùng."""
+
+    THREADS = 4
+
+    def setUp(self):
+        self.customer = User.objects.create_user("ly_customer")
+        self.branch = Branch.objects.create(name="Test branch", address="-")
+        self.svc = _service()
+        self.day = timezone.localdate() + timedelta(days=1)
+
+    def _redeem(self, appt):
+        try:
+            return loyalty.redeem_for_appointment(appt)
+        except loyalty.InsufficientPoints:
+            return 0, 0
+
+    def test_concurrent_redeem_spends_points_once(self):
+        loyalty.apply(self.customer, 150, LoyaltyTransaction.Type.EARN)
+        appts = [
+            _appointment(self.customer, self.branch, self.svc, self.day, dtime(9 + i, 0), Appointment.Status.CONFIRMED)
+            for i in range(self.THREADS)
+        ]
+
+        results, errors = _run_concurrently([lambda a=a: self._redeem(a) for a in appts])
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(results), [(0, 0)] * (self.THREADS - 1) + [(150, 15000)])
+        used = LoyaltyTransaction.objects.get(customer=self.customer, type=LoyaltyTransaction.Type.USE)
+        self.assertEqual((used.points, used.balance_after), (-150, 0))
+        lp = LoyaltyPoints.objects.get(customer=self.customer)
+        self.assertEqual((lp.current_points, lp.points_used, lp.points_earned), (0, 150, 150))
+
+    def test_overdraw_is_rejected(self):
+        # bên thua đã tính số điểm từ số dư cũ: UPDATE có điều kiện chặn lại, không ghi gì
+        loyalty.apply(self.customer, 150, LoyaltyTransaction.Type.EARN)
+        loyalty.apply(self.customer, -150, LoyaltyTransaction.Type.USE)
+        with self.assertRaises(loyalty.InsufficientPoints):
+            loyalty.apply(self.customer, -150, LoyaltyTransaction.Type.USE)
+        self.assertEqual(LoyaltyPoints.objects.get(customer=self.customer).current_points, 0)
+        self.assertEqual(LoyaltyTransaction.objects.filter(type=LoyaltyTransaction.Type.USE).count(), 1)
+
+    def test_concurrent_earn_keeps_every_point(self):
+        results, errors = _run_concurrently([
+            lambda: loyalty.apply(self.customer, 10, LoyaltyTransaction.Type.EARN) for _ in range(self.THREADS)
+        ])
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), self.THREADS)
+        lp = LoyaltyPoints.objects.get(customer=self.customer)
+        self.assertEqual((lp.current_points, lp.points_earned), (10 * self.THREADS, 10 * self.THREADS))
+        rows = LoyaltyTransaction.objects.filter(customer=self.customer)
+        self.assertEqual(rows.count(), self.THREADS)
+        # mỗi giao dịch thấy 1 số dư khác nhau: không có 2 bên cùng đọc 1 số dư cũ
+        self.assertEqual(
+            sorted(rows.values_list("balance_after", flat=True)), [10 * (i + 1) for i in range(self.THREADS)],
+        )
+
+
+class LoyaltyViewsTests(TestCase):
+    """Trang thanh toán / tài khoản chỉ đọc số dư; thanh toán lại lần 2 không trừ điểm lần nữa."""
+
+    def setUp(self):
+        self.customer = User.objects.create_user("lv_customer")
+        self.client.force_login(self.customer)
+        branch = Branch.objects.create(name="Test branch", address="-")
+        self.appt = _appointment(
+            self.customer, branch, _service(), timezone.localdate() + timedelta(days=1), dtime(9, 0),
+            Appointment.Status.CONFIRMED,
+        )
+        self.appt.payments.update(method=Payment.Method.ONLINE)
+        self.code = f"BK{self.appt.pk:06d}"
+
+    def test_read_only_pages_do_not_create_points_row(self):
+        self.assertEqual(self.client.get(reverse("main:payment", args=[self.code])).status_code, 200)
+        self.assertEqual(self.client.get(reverse("main:customer_account")).status_code, 200)
+        self.assertFalse(LoyaltyPoints.objects.exists())
+
+    def test_second_payment_complete_does_not_redeem_again(self):
+        loyalty.apply(self.customer, 150, LoyaltyTransaction.Type.EARN)
+        session = self.client.session
+        session[f"payment_use_points_{self.appt.pk}"] = True
+        session.save()
+        url = reverse("main:payment_complete", args=[self.code])
+
+        self.client.post(url)
+        # bấm lại (form cũ vẫn còn cờ dùng điểm, khoá idempotency khác nhau)
+        session = self.client.session
+        session[f"payment_use_points_{self.appt.pk}"] = True
+        session.save()
+        self.client.post(url)
+
+        self.assertEqual(self.appt.payments.get().status, Payment.Status.PAID)
+        self.assertEqual(LoyaltyTransaction.objects.filter(type=LoyaltyTransaction.Type.USE).count(), 1)
+        self.assertEqual(loyalty.balance(self.customer).current_points, 0)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+    GLAMUP_CATALOG_CACHE="default",
+)
+class QueryPlanSnapshotTests(TestCase):
+    """
+    Plan EXPLAIN của các view nóng phải khớp main/query_plans/<vendor>.json
+    (cùng phép so với manage.py check_query_plans; đổi plan có chủ đích thì chạy lại với --update).
+    """
+
+    def test_plans_match_snapshot(self):
+        vendor = connection.vendor
+        path = snapshot_path(vendor)
+        if vendor not in BACKENDS or not path.exists():
+            self.skipTest(f"no query plan snapshot for {vendor}")
+        explain, is_scan = BACKENDS[vendor]
+
+        changes, scans = compare_plans(capture_plans(explain), json.loads(path.read_text(encoding="utf-8")), is_scan)
+
+        self.assertEqual(scans, [], "new full table scan(s)")
+        self.assertEqual(changes, [], "plan changed (python manage.py check_query_plans --update if intended)")
+
+
+class HeatmapInvalidationTests(TestCase):
+    """Cache heatmap theo tháng phải bị xoá cả khi duyệt ca hàng loạt (update) và khi ca đổi chi nhánh."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name="Branch A", address="-")
+        cls.other = Branch.objects.create(name="Branch B", address="-")
+        cls.tech = User.objects.create_user("hm_tech", role=User.Role.STAFF)
+        cls.admin = User.objects.create_superuser("hm_admin", "hm_admin@example.com", None)
+        today = timezone.localdate()
+        cls.week_start = today - timedelta(days=today.weekday()) + timedelta(days=7)
+
+    def _capacity(self, branch, day):
+        data = heatmap.month_availability(branch.pk, day.year, day.month)
+        return sum(c["capacity"] for c in data.get(day.isoformat(), {}).values())
+
+    def test_bulk_approve_invalidates_month(self):
+        day = self.week_start + timedelta(days=1)
+        StaffSchedule.objects.create(staff=self.tech, work_date=day, shift=StaffSchedule.Shift.MORNING,
+                                     branch=self.branch)
+        self.assertEqual(self._capacity(self.branch, day), 0)  # ca còn PENDING, đã cache
+
+        self.client.force_login(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f"{reverse('main:admin_schedule')}?start={self.week_start.isoformat()}", {"action": "approve"},
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(StaffSchedule.objects.get().status, StaffSchedule.Status.APPROVED)
+        self.assertEqual(self._capacity(self.branch, day), heatmap.shift_minutes(StaffSchedule.Shift.MORNING))
+
+    def test_moving_schedule_invalidates_old_branch(self):
+        day = self.week_start
+        with self.captureOnCommitCallbacks(execute=True):
+            sched = StaffSchedule.objects.create(
+                staff=self.tech, work_date=day, shift=StaffSchedule.Shift.MORNING,
+                status=StaffSchedule.Status.APPROVED, branch=self.branch,
+            )
+        self.assertGreater(self._capacity(self.branch, day), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sched.branch = self.other
+            sched.save()
+        self.assertEqual(self._capacity(self.branch, day), 0)
+        self.assertGreater(self._capacity(self.other, day), 0)
+
+        self._capacity(self.other, day)
+        with self.captureOnCommitCallbacks(execute=True):
+            sched.branch = None
+            sched.save(update_fields=["branch"])
+        self.assertEqual(self._capacity(self.other, day), 0)
+
+
+class MonthAvailabilityApiTests(TestCase):
+    """API heatmap chỉ nhận chi nhánh có thật và các tháng trong khoảng đặt lịch (không để khoá cache phình vô hạn)."""
+
+    def setUp(self):
+        self.branch = Branch.objects.create(name="Branch A", address="-")
+        self.today = timezone.localdate()
+
+    def _get(self, branch_id, month):
+        return self.client.get(reverse("main:api_month_availability"), {"branch_id": branch_id, "month": month})
+
+    def _cached(self, branch_id, month):
+        year, month = map(int, month.split("-"))
+        return heatmap._cache().get(heatmap._key(branch_id, year, month)) is not None
+
+    def test_current_month(self):
+        month = self.today.strftime("%Y-%m")
+        response = self._get(self.branch.pk, month)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["month"], month)
+
+    def test_unknown_branch_is_404(self):
+        month = self.today.strftime("%Y-%m")
+        self.assertEqual(self._get(self.branch.pk + 1000, month).status_code, 404)
+        self.assertFalse(self._cached(self.branch.pk + 1000, month))
+
+    def test_month_outside_booking_window_is_rejected(self):
+        last = self.today + timedelta(days=30)
+        past = (self.today.replace(day=1) - timedelta(days=1)).strftime("%Y-%m")
+        too_far = (last.replace(day=28) + timedelta(days=4)).strftime("%Y-%m")
+        with override_settings(GLAMUP_BOOKING_DAYS_AHEAD=30):
+            self.assertEqual(self._get(self.branch.pk, last.strftime("%Y-%m")).status_code, 200)
+            for month in (past, too_far, "2999-01"):
+                self.assertEqual(self._get(self.branch.pk, month).status_code, 400)
+                self.assertFalse(self._cached(self.branch.pk, month))
+
+
+class DailyStatsRefreshJobTests(TestCase):
+    """Mỗi (chi nhánh, ngày) chỉ có 1 job stats.refresh_daily đang chờ."""
+
+    @classmethod
+    def setUpTestData(cls):
+        branch = Branch.objects.create(name="Test branch", address="-")
+        customer = User.objects.create_user("st_customer")
+        day = timezone.localdate()
+        cls.appts = [
+            _appointment(customer, branch, _service(), d, dtime(9, 0), Appointment.Status.CONFIRMED)
+            for d in (day, day, day + timedelta(days=1))
+        ]
+
+    def _jobs(self):
+        return Job.objects.filter(name="stats.refresh_daily")
+
+    def test_pending_refresh_is_reused(self):
+        for appt in self.appts:
+            schedule_daily_stats_refresh(appt)
+            schedule_daily_stats_refresh(appt)
+        self.assertEqual(self._jobs().count(), 2)  # 2 ngày khác nhau
+
+        # job đã bị worker nhận có thể đã đọc dữ liệu cũ -> lần ghi sau phải có job mới
+        claimed = claim("test-worker", ["stats.refresh_daily"])
+        self.assertIsNotNone(claimed)
+        for appt in self.appts:
+            schedule_daily_stats_refresh(appt)
+        self.assertEqual(self._jobs().filter(status=Job.Status.QUEUED).count(), 2)
+        self.assertEqual(self._jobs().count(), 3)
+
+
+class AdminDashboardStatsTests(TestCase):
+    """KPI của admin dashboard không phụ thuộc việc run_workers đã chạy job stats.refresh_daily hay chưa."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name="Test branch", address="-")
+        cls.svc = _service()
+        cls.customer = User.objects.create_user("ad_customer")
+        cls.admin = User.objects.create_superuser("ad_admin", "ad_admin@example.com", None)
+        cls.today = timezone.localdate()
+
+    def _kpi(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("main:admin_dashboard"), {"period": "month"})
+        self.assertEqual(response.status_code, 200)
+        return response.context["total_bookings"], response.context["total_revenue"]
+
+    def test_missing_day_is_computed_inline(self):
+        _appointment(self.customer, self.branch, self.svc, self.today, dtime(9, 0), Appointment.Status.DONE, paid=True)
+        self.assertEqual(self._kpi(), (1, self.svc.price))
+
+    def test_day_with_pending_refresh_is_recomputed(self):
+        appt = _appointment(self.customer, self.branch, self.svc, self.today, dtime(9, 0), Appointment.Status.CONFIRMED)
+        rebuild_daily_stats(self.today, self.today)
+        self.assertEqual(self._kpi(), (1, 0))
+
+        appt.status = Appointment.Status.CANCELED
+        appt.save(update_fields=["status"])
+        schedule_daily_stats_refresh(appt)  # job chờ worker, chưa ai chạy
+        self.assertEqual(self._kpi(), (0, 0))
+        self.assertEqual(Job.objects.get(name="stats.refresh_daily").status, Job.Status.DONE)
+
+    def test_fresh_rollup_is_read_only(self):
+        other = Branch.objects.create(name="Other branch", address="-")
+        for branch in (self.branch, other):
+            appt = _appointment(self.customer, branch, self.svc, self.today, dtime(9, 0), Appointment.Status.CONFIRMED)
+        schedule_daily_stats_refresh(appt)
+        self._kpi()
+
+        # chỉ ô có job / còn thiếu được tính lại, job đã xong -> lần sau chỉ còn SELECT
+        self.assertFalse(Job.objects.filter(status=Job.Status.QUEUED).exists())
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self._kpi(), (2, 0))
+        writes = [q["sql"] for q in ctx.captured_queries
+                  if q["sql"].lstrip().upper().startswith(("INSERT", "UPDATE", "DELETE"))
+                  and "django_session" not in q["sql"] and "last_login" not in q["sql"]]
+        self.assertEqual(writes, [])
+
+
+class WaitlistJoinTests(TestCase):
+    """Đăng ký chờ cả khoảng ngày -> hẹn match cho từng ngày còn tới trong khoảng."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name="Test branch", address="-")
+        cls.svc = _service()
+        cls.customer = User.objects.create_user("wl_customer")
+        cls.other = User.objects.create_user("wl_other")
+
+    def _match_days(self):
+        return sorted(
+            p["day"] for p in Job.objects.filter(name="waitlist.match", status=Job.Status.QUEUED)
+            .values_list("payload", flat=True)
+        )
+
+    def test_join_range_enqueues_every_day(self):
+        today = timezone.localdate()
+        days = [today + timedelta(days=i) for i in range(3)]
+        with self.captureOnCommitCallbacks(execute=True):
+            _, created = waitlist.join(self.customer, self.branch, self.svc, days[0], days[-1])
+        self.assertTrue(created)
+        self.assertEqual(self._match_days(), [d.isoformat() for d in days])
+
+        # khách khác chờ trùng ngày: job match còn chờ được dùng lại
+        with self.captureOnCommitCallbacks(execute=True):
+            waitlist.join(self.other, self.branch, self.svc, days[1], days[1])
+        self.assertEqual(self._match_days(), [d.isoformat() for d in days])
+
+    def test_range_beyond_horizon_is_rejected(self):
+        today = timezone.localdate()
+        with self.assertRaises(ValueError):
+            waitlist.join(self.customer, self.branch, self.svc, today, today + timedelta(days=3650))
+
+        self.client.force_login(self.customer)
+        response = self.client.post(reverse("main:join_waitlist"), {
+            "service_id": self.svc.pk, "branch_id": self.branch.pk,
+            "date": today.isoformat(), "date_to": "2099-12-31",
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Job.objects.filter(name="waitlist.match").exists())
+
+
+@override_settings(GLAMUP_OUTBOX_DELIVERY_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+class OutboxJobTests(TransactionTestCase):
+    """Job outbox.send không chạy trong 1 transaction: mỗi email commit riêng, lỗi sau không kéo lùi mail đã gửi."""
+
+    def test_send_runs_outside_transaction(self):
+        for i in range(3):
+            queue_email(f"Hello {i}", "-", [f"c{i}@example.com"])
+        enqueue("outbox.send")
+
+        in_atomic = []
+        real_send = locmem.EmailBackend.send_messages
+
+        def send(backend, messages):
+            in_atomic.append(connection.in_atomic_block)
+            if messages[0].subject == "Hello 2":
+                raise ConnectionError("smtp dropped")
+            return real_send(backend, messages)
+
+        with mock.patch.object(locmem.EmailBackend, "send_messages", autospec=True, side_effect=send):
+            self.assertEqual(run_pending(names=["outbox.send"]), (1, 0))
+
+        self.assertEqual(in_atomic, [False, False, False])
+        statuses = dict(OutboxEmail.objects.values_list("subject", "status"))
+        self.assertEqual(statuses["Hello 0"], OutboxEmail.Status.SENT)
+        self.assertEqual(statuses["Hello 1"], OutboxEmail.Status.SENT)
+        self.assertEqual(statuses["Hello 2"], OutboxEmail.Status.QUEUED)
+
+
+class IdempotentViewTests(TestCase):
+    """Gửi lại form cùng idempotency_key: view chỉ chạy 1 lần, lần sau nhận lại đúng response cũ."""
+
+    def setUp(self):
+        self.branch = Branch.objects.create(name="Test branch", address="-")
+        self.svc = _service()
+        self.day = timezone.localdate() + timedelta(days=1)
+        tech = User.objects.create_user("ik_tech", role=User.Role.STAFF)
+        StaffSchedule.objects.create(
+            staff=tech, work_date=self.day, shift=StaffSchedule.Shift.MORNING,
+            status=StaffSchedule.Status.APPROVED, branch=self.branch,
+        )
+        self.customer = User.objects.create_user("ik_customer")
+
+    def _book(self, key, at="09:00"):
+        return self.client.post(reverse("main:book"), {
+            "service_id": self.svc.pk, "branch_id": self.branch.pk, "date": self.day.isoformat(),
+            "time_slot": at, "payment_method": "CASH", "idempotency_key": key,
+        })
+
+    def test_replayed_booking_creates_one_appointment(self):
+        self.client.force_login(self.customer)
+        first = self._book("k1")
+        second = self._book("k1")
+
+        self.assertEqual(first.status_code, 302)
+        self.assertNotIn("Idempotent-Replayed", first)
+        self.assertEqual(second.status_code, 302)
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(second["Location"], first["Location"])
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_same_key_with_different_fields_is_rejected(self):
+        self.client.force_login(self.customer)
+        self._book("k1")
+        response = self._book("k1", at="10:00")
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_view_exception_drops_key(self):
+        self.client.force_login(self.customer)
+        with mock.patch("main.views.create_booking", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                self._book("k1")
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        # khách bấm lại với cùng khoá: chạy như lần đầu
+        response = self._book("k1")
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn("Idempotent-Replayed", response)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_retry_after_failed_first_request_is_bounded(self):
+        # dòng PROCESSING của request khác; lần nào chờ cũng thấy bên kia vừa lỗi rồi lại có request giành khoá
+        IdempotencyKey.objects.create(user=self.customer, key="k1", scope="book", fingerprint="-")
+        self.client.force_login(self.customer)
+        with mock.patch("main.idempotency.fingerprint", return_value="-"), \
+                mock.patch("main.idempotency._wait_done", return_value=None) as wait:
+            response = self._book("k1")
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(wait.call_count, idempotency.MAX_ATTEMPTS)
+        self.assertFalse(Appointment.objects.exists())
+
+    def test_double_check_out_awards_once(self):
+        receptionist = User.objects.create_user("ik_receptionist", role=User.Role.STAFF)
+        receptionist.groups.add(Group.objects.get_or_create(name="Receptionist")[0])
+        self.client.force_login(receptionist)
+        appt = _appointment(
+            self.customer, self.branch, self.svc, self.day, dtime(9, 0), Appointment.Status.IN_PROGRESS,
+        )
+        url = reverse("main:check_out", args=[appt.pk])
+
+        self.client.get(url, {"idempotency_key": "k1"})
+        replayed = self.client.get(url, {"idempotency_key": "k1"})
+        self.client.get(url, {"idempotency_key": "k2"})  # form khác, lịch đã DONE
+
+        self.assertEqual(replayed["Idempotent-Replayed"], "true")
+        self.assertEqual(Job.objects.filter(name="loyalty.award").count(), 1)
+        appt.refresh_from_db()
+        self.assertEqual(appt.status, Appointment.Status.DONE)
+
+
+class AppointmentEventTests(TestCase):
+    """Event bảng lễ tân chỉ dựng payload (vài câu SELECT) khi kênh có người đang xem."""
+
+    def setUp(self):
+        branch = Branch.objects.create(name="Test branch", address="-")
+        customer = User.objects.create_user("ev_customer")
+        self.appt = _appointment(
+            customer, branch, _service(), timezone.localdate(), dtime(9, 0), Appointment.Status.CONFIRMED,
+        )
+        self.channel = board_channel(branch.pk, self.appt.appointment_date)
+
+    def test_no_subscribers_skips_payload(self):
+        broker = get_broker()
+        self.assertFalse(broker.has_subscribers(self.channel))
+        with mock.patch.object(broker, "publish") as publish, CaptureQueriesContext(connection) as ctx:
+            with self.captureOnCommitCallbacks(execute=True):
+                publish_appointment_event(self.appt, "done")
+        self.assertEqual(len(ctx), 0)
+        publish.assert_not_called()
+
+    def test_subscriber_gets_payload(self):
+        broker = get_broker()
+        with mock.patch.object(broker, "has_subscribers", return_value=True), \
+                mock.patch.object(broker, "publish") as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                publish_appointment_event(self.appt, "done")
+        channel, payload = publish.call_args.args
+        self.assertEqual(channel, self.channel)
+        self.assertEqual(
+            (payload["type"], payload["id"], payload["service_name"]), ("done", self.appt.pk, "Test manicure"),
+        )
+
+
+class OptimizeDayTests(TestCase):
+    """Xếp lại KTV: sức chứa không bao giờ giảm và sổ StaffSlot luôn khớp AppointmentStaff."""
+
+    def setUp(self):
+        self.branch = Branch.objects.create(name="Test branch", address="-")
+        self.svc = _service()
+        self.day = timezone.localdate() + timedelta(days=1)
+        self.a = User.objects.create_user("od_tech_a", role=User.Role.STAFF)
+        self.b = User.objects.create_user("od_tech_b", role=User.Role.STAFF)
+        for tech in (self.a, self.b):
+            StaffSchedule.objects.create(
+                staff=tech, work_date=self.day, shift=StaffSchedule.Shift.MORNING,
+                status=StaffSchedule.Status.APPROVED, branch=self.branch,
+            )
+        self.customer = User.objects.create_user("od_customer")
+
+    def _book(self, at, tech):
+        appt, staff_id = create_booking(self.customer, self.branch.pk, self.day, at, self.svc, [tech.pk])
+        self.assertEqual(staff_id, tech.pk)
+        return appt
+
+    def _assert_ledger_matches(self):
+        expected = {
+            (line.staff_id, line.appointment_id, n)
+            for line in AppointmentStaff.objects.select_related("appointment")
+            for n in slot_range(line.appointment.appointment_time, line.appointment.duration_minutes)
+        }
+        ledger = list(StaffSlot.objects.filter(date=self.day).values_list("staff_id", "appointment_id", "slot"))
+        self.assertEqual(len(ledger), len(set(ledger)))
+        self.assertEqual(set(ledger), expected)
+        # 1 KTV không giữ 1 ô cho 2 lịch
+        owned = [(staff_id, slot) for staff_id, _, slot in ledger]
+        self.assertEqual(len(owned), len(set(owned)))
+
+    def test_fragmented_day_is_repacked(self):
+        # A bận 09:00, B bận 10:00 -> không ai còn trống liền 09:00-11:00
+        first = self._book(dtime(9, 0), self.a)
+        second = self._book(dtime(10, 0), self.b)
+
+        report = optimize_day(self.branch.pk, self.day, apply=True)
+
+        self.assertTrue(report["applied"])
+        self.assertEqual(report["moved"], 1)
+        self.assertGreater(report["capacity_after"], report["capacity_before"])
+        self.assertEqual(first.staff_lines.get().staff_id, self.a.pk)
+        self.assertEqual(second.staff_lines.get().staff_id, self.a.pk)
+        self._assert_ledger_matches()
+
+        # chạy lại: đã tối ưu, không đổi gì, sức chứa đọc từ DB đúng bằng số đã báo
+        again = optimize_day(self.branch.pk, self.day, apply=True)
+        self.assertEqual((again["moved"], again["applied"]), (0, False))
+        self.assertEqual(again["capacity_before"], report["capacity_after"])
+        self._assert_ledger_matches()
+
+    def test_never_lowers_capacity(self):
+        bookings = [(dtime(8, 0), self.a), (dtime(9, 30), self.b), (dtime(10, 0), self.a), (dtime(11, 0), self.b)]
+        for at, tech in bookings:
+            self._book(at, tech)
+        dry = optimize_day(self.branch.pk, self.day)
+        self.assertFalse(dry["applied"])
+
+        report = optimize_day(self.branch.pk, self.day, apply=True)
+        now_capacity = optimize_day(self.branch.pk, self.day)["capacity_before"]
+
+        self.assertEqual(report["capacity_before"], dry["capacity_before"])
+        self.assertGreaterEqual(now_capacity, report["capacity_before"])
+        self.assertEqual(now_capacity, report["capacity_after"] if report["applied"] else report["capacity_before"])
+        self._assert_ledger_matches()
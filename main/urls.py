@@ -29,6 +29,9 @@ urlpatterns = [
     path('services/', views.services, name='services'),
     path('services/<slug:slug>/', views.service_detail, name='service_detail'),
     path('book/', views.book_now, name='book'),
+    path('book/waitlist/', views.join_waitlist, name='join_waitlist'),
+    path('api/free-slots/', views.api_free_slots, name='api_free_slots'),
+    path('api/month-availability/', views.api_month_availability, name='api_month_availability'),
     path("payment/<str:code>/", views.payment, name="payment"),
     path("payment/<str:code>/complete/", views.payment_complete, name="payment_complete"),
     path("order-result/<str:code>/", views.order_result, name="order_result"),
@@ -46,7 +49,8 @@ urlpatterns = [
     path('employee/appointments/', views.staff_appointments, name='staff_appointments'),
 # Lễ tân (Receptionist)
     path('receptionist/dashboard/', views.receptionist_dashboard, name='receptionist_dashboard'),
-    path('receptionist/appointments/', views.receptionist_dashboard, name='receptionist_appointments'),
+    path('receptionist/appointments/', views.receptionist_appointments, name='receptionist_appointments'),
+    path('receptionist/stream/', views.receptionist_stream, name='receptionist_stream'),
     # Receptionist actions
     path("receptionist/check-in/<int:pk>/", views.check_in, name="check_in"),
     path("receptionist/check-out/<int:pk>/", views.check_out, name="check_out"),
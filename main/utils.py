@@ -1,8 +1,11 @@
+from .roles import group_names
+
+
 def is_admin(user):
     return (
         user.is_authenticated and (
             user.is_superuser or
-            user.groups.filter(name='Admin').exists()
+            'Admin' in group_names(user)
         )
     )
 
@@ -10,6 +13,6 @@ def is_staff_user(user):
     return (
         user.is_authenticated and (
             user.is_staff or
-            user.groups.filter(name='Staff').exists()
+            'Staff' in group_names(user)
         )
     )
@@ -15,7 +15,7 @@ from django.contrib import messages
 from django.contrib.auth import login
 from django.db import models
 from django.db.models import Avg
-from django.http import Http404, HttpResponse
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
 from .forms import StaffSelfScheduleForm, BranchForm
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
@@ -23,12 +23,17 @@ from django.utils import timezone
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
 from django.contrib import messages
-from django.db.models import Q, Count
+from django.db.models import Q, Count, Exists, OuterRef, Prefetch, Subquery
 from .models import User, Branch, StaffSchedule
 from .forms import ScheduleForm
 from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth import password_validation
+import asyncio
+import calendar
 import csv
+import json
+import logging
+from asgiref.sync import sync_to_async
 from .forms import (
     LoginForm, ContactForm, BookingForm, FeedbackForm,
     EmployeeForm, ServiceForm, ScheduleForm
@@ -37,10 +42,13 @@ from .models import (
     Service, Branch, Review, Appointment, AppointmentService, AppointmentStaff,
     Payment, User, StaffSchedule
 )
+from . import catalog
 from django.core.mail import send_mail
 from django.urls import reverse
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
+
 # ===================== Helpers giữ đúng biến template =====================
 
 PLACEHOLDER = "/static/images/placeholder.png"
@@ -53,47 +61,30 @@ BANK = {
 }
 # ====== AUTH HELPERS ======
 from django.contrib.auth.decorators import login_required, user_passes_test
+from .roles import group_names, roles_for
 
 def _in_group(user, name):
-    try:
-        return user.groups.filter(name=name).exists()
-    except Exception:
-        return False
+    # tên group được load 1 lần / request (xem main/roles.py)
+    return name in group_names(user)
 
 def is_admin(user):
-    return user.is_authenticated and (
-        user.is_superuser
-        or user.is_staff
-        or getattr(user, "role", "") == "ADMIN"
-        or _in_group(user, "Admin")
-    )
+    return roles_for(user).is_admin
 
 def is_receptionist(user):
-    return user.is_authenticated and user.groups.filter(name='Receptionist').exists()
+    return roles_for(user).is_receptionist
 
 def is_technician(user):
-    return user.is_authenticated and user.groups.filter(name='Technician').exists()
+    return roles_for(user).is_technician
 
 def is_staff_user(user):
-    return user.is_authenticated and (
-        user.is_staff
-        or getattr(user, "role", "") == "STAFF"
-        or is_receptionist(user)
-        or is_technician(user)
-        or _in_group(user, "Staff")
-    )
+    return roles_for(user).is_staff
 
 def is_customer(user):
     # đã đăng nhập và KHÔNG thuộc Admin/Staff
-    return user.is_authenticated and not is_admin(user) and not is_staff_user(user)
+    return roles_for(user).is_customer
 
 def _service_to_card(s: Service) -> dict:
     """Map Service -> dict cho thẻ dịch vụ của template (giữ nguyên + bổ sung keys)."""
-    avg = Review.objects.filter(
-        service_id=s.id,
-        status=Review.Status.PUBLISHED
-    ).aggregate(avg=Avg("rating"))["avg"]
-
     return {
         "id": s.id,  # <-- thêm để dùng cho link Edit, v.v.
         "name": s.service_name,
@@ -101,7 +92,7 @@ def _service_to_card(s: Service) -> dict:
         "duration": int(getattr(s, "duration", 60) or 60),  # giữ UI 60'
         "thumbnail_url": (s.image.url if getattr(s, "image", None) else PLACEHOLDER),
         "slug": (s.slug or str(s.id)),  # fallback nếu slug trống
-        "avg_rating": round(float(avg), 1) if avg is not None else 0,
+        "avg_rating": round(float(s.rating_avg or 0), 1),
 
         # bổ sung để admin list và client filter dùng
         "is_active": bool(getattr(s, "is_active", True)),
@@ -110,8 +101,6 @@ def _service_to_card(s: Service) -> dict:
 
 def _service_to_detail(s: Service):
     """Map Service -> dict cho trang chi tiết (giữ nguyên keys)."""
-    avg = Review.objects.filter(service=s, status=Review.Status.PUBLISHED)\
-                        .aggregate(avg=Avg("rating"))["avg"] or 0
     return {
         "id": s.id,  # <<< THÊM
         "slug": s.slug,
@@ -119,7 +108,7 @@ def _service_to_detail(s: Service):
         "price": float(s.price or 0),
         "duration": int(getattr(s, "duration", 60) or 60),
         "image_url": (s.image.url if getattr(s, "image", None) else PLACEHOLDER),
-        "avg_rating": round(float(avg), 1) if avg else 0,
+        "avg_rating": round(float(s.rating_avg or 0), 1),
         "description": s.description or "",
     }
 
@@ -183,7 +172,8 @@ def _map_appointment_for_receptionist(appt: Appointment):
     }
 # ===================== Public / Customer =====================
 
-def home(request):
+def _home_catalog() -> dict:
+    """Dữ liệu trang chủ (đã map sang dict) – được cache trong main.catalog."""
     qs = Service.objects.filter(is_active=True).order_by("service_name")[:6]
     featured_services = [_service_to_card(s) for s in qs]
     # 12 item cho OUR COLLECTION
@@ -219,15 +209,14 @@ def home(request):
             "service_name": rv.service.service_name if rv.service else "",
         })
 
-    return render(
-        request,
-        "customer/home.html",
-        {
-            "featured_services": featured_services,
-            "collection": collection,
-            "home_reviews": home_reviews,  # truyền ra template
-        }
-    )
+    return {
+        "featured_services": featured_services,
+        "collection": collection,
+        "home_reviews": home_reviews,  # truyền ra template
+    }
+
+def home(request):
+    return render(request, "customer/home.html", catalog.get_or_build("home", _home_catalog))
 
 def promotion(request):
 
@@ -249,9 +238,9 @@ def login_view(request):
         login(request, form.user)
         messages.success(request, "Login successful.")
         # điều hướng nhẹ: admin/staff/customer
-        if request.user.is_superuser or request.user.groups.filter(name="Admin").exists():
+        if request.user.is_superuser or _in_group(request.user, "Admin"):
             return redirect('main:admin_dashboard')
-        if request.user.is_staff or request.user.groups.filter(name="Staff").exists():
+        if request.user.is_staff or _in_group(request.user, "Staff"):
             # ĐỔI staff_dashboard -> staff_account
             return redirect('main:staff_account')
         return redirect('main:customer_account')
@@ -281,36 +270,32 @@ def signup_view(request):
 
     return render(request, "signup.html", {"form": form, "next": request.GET.get("next", "")})
 
+def _services_catalog() -> list:
+    """Toàn bộ service đang active (đã map sang dict) – được cache trong main.catalog."""
+    services_data = []
+    for s in Service.objects.filter(is_active=True):
+        img_url = s.image.url if getattr(s, "image", None) else PLACEHOLDER
+        services_data.append({
+            "id": s.id,
+            "name": s.service_name,
+            "slug": s.slug,
+            "price": s.price,
+            "thumbnail_url": img_url,
+            "category": (s.category or "").lower(),
+            # value này template đang dùng: s.avg_rating
+            "avg_rating": float(s.rating_avg or 0),
+            "total_reviews": s.rating_count,
+        })
+    return services_data
+
 def services(request):
         """
         Trang danh sách dịch vụ:
-          - Lấy tất cả service đang active
-          - Tính rating trung bình và số feedback
+          - Lấy tất cả service đang active (đọc từ cache catalog, xoá cache khi Service/Review đổi)
+          - Rating trung bình và số feedback đọc từ cột lưu sẵn trên Service
           - Chuẩn hóa dữ liệu để JS filter/sort ở frontend
         """
-        qs = (
-            Service.objects
-            .filter(is_active=True)
-            .annotate(
-                rating_avg=Avg("reviews__rating"),
-                review_cnt=Count("reviews"),
-            )
-        )
-
-        services_data = []
-        for s in qs:
-            img_url = s.image.url if getattr(s, "image", None) else PLACEHOLDER
-            services_data.append({
-                "id": s.id,
-                "name": s.service_name,
-                "slug": s.slug,
-                "price": s.price,
-                "thumbnail_url": img_url,
-                "category": (s.category or "").lower(),
-                # value này template đang dùng: s.avg_rating
-                "avg_rating": float(s.rating_avg or 0),
-                "total_reviews": s.review_cnt,
-            })
+        services_data = catalog.get_or_build("services", _services_catalog)
 
         # -------- PHÂN TRANG: 9 dịch vụ / 1 trang --------
         paginator = Paginator(services_data, 9)  # 9 services mỗi trang
@@ -334,8 +319,8 @@ def service_detail(request, slug):
         .filter(service=s, status=Review.Status.PUBLISHED)
         .select_related("customer")
     )
-    total_reviews = rv_qs.count()
-    avg_rating = rv_qs.aggregate(avg=Avg('rating'))['avg']  # None nếu chưa có
+    total_reviews = s.rating_count
+    avg_rating = s.rating_avg if total_reviews else None  # None nếu chưa có
 
     reviews = [{
         "user": (rv.customer.full_name or rv.customer.username),
@@ -367,6 +352,7 @@ from datetime import datetime, timedelta, time as dtime
 from decimal import Decimal
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.db import transaction
 from django.db.models import Sum
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
@@ -374,8 +360,17 @@ from django.utils import timezone
 
 from .models import (
     User, Branch, Service, Appointment, AppointmentService, AppointmentStaff,
-    StaffSchedule, Payment
+    StaffSchedule, Payment, DailyBranchServiceStats
 )
+from .availability import DEFAULT_DURATION, DayAvailability, confirm_hold
+from .booking import create_booking
+from .events import board_channel, get_broker, publish_appointment_event
+from .aggregates import GroupConcat
+from .stats import ensure_daily_stats, schedule_daily_stats_refresh
+from .outbox import queue_email
+from .jobs import enqueue
+from . import heatmap, loyalty, waitlist
+from .idempotency import idempotent
 
 PLACEHOLDER = "/static/images/placeholder.png"
 def _vnd(n):
@@ -394,18 +389,13 @@ def _shift_from_time(t: dtime):
     if dtime(12, 0) <= t <= dtime(17, 59): return StaffSchedule.Shift.AFTERNOON
     return StaffSchedule.Shift.EVENING
 
-def _overlap(a_start, a_dur_min, b_start, b_dur_min):
-    """Hai khoảng thời gian (start + duration phút) có giao nhau?"""
-    day = timezone.localdate()
-    a0 = datetime.combine(day, a_start); a1 = a0 + timedelta(minutes=int(a_dur_min or 0))
-    b0 = datetime.combine(day, b_start); b1 = b0 + timedelta(minutes=int(b_dur_min or 0))
-    return not (a1 <= b0 or b1 <= a0)
 
 
 
 
 @login_required
 @user_passes_test(is_customer)
+@idempotent("book")
 def book_now(request):
     """
     GET : nhận service=<slug|id> -> render form, prefill ảnh/tên/giá
@@ -478,96 +468,90 @@ def book_now(request):
         return redirect(request.path + back_qs)
 
     total_minutes = int(getattr(svc_obj, "duration", 60) or 60)
-    total_price   = Decimal(svc_obj.price or 0)
 
     # --- tìm staff rảnh trong ca APPROVED ---
-    shift = _shift_from_time(start_time)
-    candidates = (
-        User.objects.filter(role=User.Role.STAFF)
-        .filter(staffschedule__work_date=appt_date,
-                staffschedule__shift=shift,
-                staffschedule__status=StaffSchedule.Status.APPROVED,
-                staffschedule__branch=branch)
-        .distinct()
-    )
-
-    busy_qs = (
-        Appointment.objects
-        .filter(
-            appointment_date=appt_date,
-            status__in=[Appointment.Status.PENDING, Appointment.Status.CONFIRMED, Appointment.Status.IN_PROGRESS],
-            staff_lines__staff__in=candidates,
+    day_index = DayAvailability.load(branch, appt_date)
+    free_ids = day_index.free_staff(start_time, total_minutes)
+    if not free_ids:
+        messages.error(
+            request,
+            "There are currently no staff members available for this time slot. "
+            "Please choose a different time, or join the waitlist and we will email you when a slot opens up."
         )
-        .annotate(dur=Sum("service_lines__service__duration"))
-        .values("appointment_time", "dur", "staff_lines__staff")
-    )
-
-    busy_map = {}
-    for r in busy_qs:
-        sid = r["staff_lines__staff"]
-        busy_map.setdefault(sid, []).append((r["appointment_time"], int(r["dur"] or 60)))
-
-    def staff_is_free(st):
-        for (t_busy, d_busy) in busy_map.get(st.id, []):
-            if _overlap(start_time, total_minutes, t_busy, d_busy):
-                return False
-        return True
-
-    free_staff = [st for st in candidates if staff_is_free(st)]
-    if not free_staff:
-        messages.error(request, "There are currently no staff members available for this time slot. Please choose a different time.")
         back_qs = f"?service={svc_obj.slug or svc_obj.id}"
         return redirect(request.path + back_qs)
 
-    def day_load(st):
-        return sum(d for _, d in busy_map.get(st.id, []))
-
-    chosen = sorted(free_staff, key=day_load)[0]
-
-    # --- tạo appointment ---
-    appt = Appointment.objects.create(
-        customer=request.user,
-        branch=branch,
-        appointment_date=appt_date,
-        appointment_time=start_time,
-        duration_minutes=total_minutes,
-        status=Appointment.Status.CONFIRMED,
+    # --- tạo appointment + giữ chỗ KTV trong cùng 1 transaction ---
+    # ưu tiên KTV ít phút bận nhất trong ngày; ai vừa bị request khác giữ mất thì thử người kế
+    candidates = sorted(free_ids, key=day_index.load_minutes)
+    # ONLINE: chỉ giữ chỗ tạm (PENDING) tới khi thanh toán xong; bỏ trang thanh toán thì chỗ tự nhả
+    pay_online = pay_method == "ONLINE"
+    hold_until = None
+    if pay_online:
+        hold_until = timezone.now() + timedelta(minutes=getattr(settings, "GLAMUP_SLOT_HOLD_MINUTES", 10))
+    appt, chosen_id = create_booking(
+        request.user, branch.pk, appt_date, start_time, svc_obj, candidates,
+        # ONLINE: TẠM THỜI CHƯA set PAID; đợi bấm nút trên trang thanh toán
+        pay_method=Payment.Method.ONLINE if pay_online else Payment.Method.CASH,
+        hold_expires_at=hold_until,
         note=note,
-        total_price=total_price
+        duration=total_minutes,
     )
-    AppointmentService.objects.create(
-        appointment=appt, service=svc_obj, quantity=1, unit_price=svc_obj.price
-    )
-    AppointmentStaff.objects.create(appointment=appt, staff=chosen)
+    if chosen_id is None:
+        messages.error(request, "This time slot was just taken by another booking. Please choose a different time.")
+        back_qs = f"?service={svc_obj.slug or svc_obj.id}"
+        return redirect(request.path + back_qs)
 
-    # --- Payment theo phương thức ---
-    if pay_method == "ONLINE":
-        # TẠM THỜI CHƯA set PAID; đợi bấm nút trên trang thanh toán
-        Payment.objects.create(
-            appointment=appt,
-            amount=appt.total_price,
-            method=Payment.Method.ONLINE,
-            status=Payment.Status.UNPAID
-        )
+    # đẩy lịch mới lên bảng lễ tân (SSE) + cập nhật số liệu dashboard (chạy sau commit)
+    publish_appointment_event(appt, "created")
+    schedule_daily_stats_refresh(appt)
+
+    code = _make_booking_code(appt.id)
+    return redirect(reverse("main:payment", kwargs={"code": code}))
 
-    else:
-        Payment.objects.create(
-            appointment=appt,
-            amount=appt.total_price,
-            method=Payment.Method.CASH,
-            status=Payment.Status.UNPAID
-        )
 
-    # “thông báo” cho Lễ tân & KTV (stub)
+@login_required
+@user_passes_test(is_customer)
+@require_POST
+def join_waitlist(request):
+    """
+    Đăng ký danh sách chờ từ form đặt lịch (nút "Join waitlist"): chờ cả ngày đã chọn,
+    hoặc khoảng ngày date..date_to / khung giờ preferred_from..preferred_to nếu có gửi lên.
+    """
+    svc_param = (request.POST.get("service_id") or "").strip()
+    service = Service.objects.filter(pk=svc_param, is_active=True).first() if svc_param.isdigit() else None
+    if not service:
+        messages.error(request, "Invalid service or service is no longer available.")
+        return redirect("main:services")
+    back = reverse("main:book") + f"?service={service.slug or service.id}"
+
+    branch = Branch.objects.filter(pk=request.POST.get("branch_id") or 0).first()
     try:
-        print(
-            f"[ALERT] Receptionist: Booking mới #{appt.id} {appt.appointment_date} {appt.appointment_time} – Khách: {request.user.username}")
-        print(f"[ALERT] Technician: {chosen.username} is assigned to booking #{appt.id}.")
-    except Exception:
-        pass
+        date_from = datetime.strptime(request.POST.get("date") or "", "%Y-%m-%d").date()
+        date_to = request.POST.get("date_to")
+        date_to = datetime.strptime(date_to, "%Y-%m-%d").date() if date_to else date_from
+        pref_from = _to_time(request.POST["preferred_from"]) if request.POST.get("preferred_from") else None
+        pref_to = _to_time(request.POST["preferred_to"]) if request.POST.get("preferred_to") else None
+    except ValueError:
+        branch = None
+    if not branch or date_to < date_from or date_from < timezone.localdate():
+        messages.error(request, "Please select a branch and a valid date to join the waitlist.")
+        return redirect(back)
+    if date_to > waitlist.last_day():
+        # mỗi ngày trong khoảng là 1 job match -> không nhận khoảng dài tuỳ ý
+        return HttpResponseBadRequest(
+            f"You can join the waitlist for dates up to {waitlist.last_day():%d/%m/%Y} only."
+        )
 
-    code = _make_booking_code(appt.id)
-    return redirect(reverse("main:payment", kwargs={"code": code}))
+    entry, created = waitlist.join(request.user, branch, service, date_from, date_to, pref_from, pref_to)
+    if created:
+        messages.success(
+            request,
+            f"You are on the waitlist for {date_from:%d/%m/%Y}. We will email you as soon as a slot opens up."
+        )
+    else:
+        messages.info(request, "You are already on the waitlist for this service and date.")
+    return redirect(back)
 
 
 def _make_booking_code(appt_id: int) -> str:
@@ -623,8 +607,8 @@ def payment(request, code: str):
     use_points = bool(request.session.get(session_key, False))
 
     if customer:
-        lp, _ = LoyaltyPoints.objects.get_or_create(customer=customer)
-        available_points = lp.current_points
+        # trang xem: chỉ đọc số dư, không tạo dòng LoyaltyPoints
+        available_points = loyalty.balance(customer).current_points
 
         # NEW: xử lý nút "Apply points" / "Cancel"
         if request.method == "POST":
@@ -638,12 +622,9 @@ def payment(request, code: str):
                 request.session[session_key] = False
 
         # NEW: chỉ khi use_points == True mới tính giảm giá
-        if use_points and available_points >= 100:
-            # Dùng số điểm là bội số của 10 (10 điểm = 1.000đ)
-            usable_points = (available_points // 10) * 10
-            if usable_points >= 100:
-                points_used = usable_points
-                discount_vnd = (points_used // 10) * 1000
+        if use_points:
+            # Dùng số điểm là bội số của 10 (10 điểm = 1.000đ), tối thiểu 100 điểm
+            points_used, discount_vnd = loyalty.redeemable(available_points)
     # nếu không có customer thì giữ mặc định 0
 
     # Tổng phải trả sau giảm
@@ -677,7 +658,7 @@ from django.views.decorators.http import require_POST
 
 @require_POST
 @login_required
-
+@idempotent("payment_complete")
 def payment_complete(request, code: str):
     appt_pk = _code_to_pk(code)
     appt = get_object_or_404(Appointment, pk=appt_pk)
@@ -691,50 +672,53 @@ def payment_complete(request, code: str):
             messages.info(request, "This order was paid previously")
             return redirect("main:order_result", code=code)
 
-        pay.status = Payment.Status.PAID
-        pay.save(update_fields=["status"])
-        appt.status = Appointment.Status.CONFIRMED
-        appt.save(update_fields=["status"])
-
-        # ====== CHỈNH: CHỈ TRỪ ĐIỂM KHI KHÁCH ĐÃ CHỌN "APPLY" ======
-        customer = appt.customer
         session_key = f"payment_use_points_{appt.pk}"
-        use_points = bool(request.session.get(session_key, False))  # NEW
-
-        if customer and use_points:
-            lp, _ = LoyaltyPoints.objects.get_or_create(customer=customer)
-            available_points = lp.current_points
-
-            total_vnd = int(appt.total_price or 0)
-            points_used = 0
-            discount_vnd = 0
-
-            if available_points >= 100:
-                usable_points = (available_points // 10) * 10
-                if usable_points >= 100:
-                    points_used = usable_points
-                    discount_vnd = (points_used // 10) * 1000
-
-            if points_used >= 100:
-                lp.current_points -= points_used
-                lp.points_used += points_used
-                lp.save(update_fields=["current_points", "points_used", "last_updated"])
-
-                LoyaltyTransaction.objects.create(
-                    customer=customer,
-                    appointment=appt,
-                    type=LoyaltyTransaction.Type.USE,
-                    points=-points_used,
-                    balance_after=lp.current_points,
-                    description=(
-                        f"Redeemed {points_used} points for a {discount_vnd:,} VND "
-                        f"for booking BK{appt.id:06d}"
-                    ),
-                )
-
-            # NEW: reset cờ sau khi thanh toán xong
+        use_points = bool(request.session.get(session_key, False))
+
+        # chốt chỗ đang giữ tạm + đánh dấu PAID + trừ điểm trong 1 transaction;
+        # khoá lịch & payment để không đua với scheduler hay với cú bấm thanh toán thứ 2
+        already_paid, held = False, True
+        with transaction.atomic():
+            appt = Appointment.objects.select_for_update().get(pk=appt.pk)
+            pay = Payment.objects.select_for_update().get(pk=pay.pk)
+            if pay.status == Payment.Status.PAID:
+                already_paid = True
+            elif confirm_hold(appt):
+                pay.status = Payment.Status.PAID
+                pay.save(update_fields=["status"])
+                appt.status = Appointment.Status.CONFIRMED
+                appt.save(update_fields=["status"])
+                waitlist.offer_accepted(appt)
+                schedule_daily_stats_refresh(appt)
+
+                # ====== CHỈ TRỪ ĐIỂM KHI KHÁCH ĐÃ CHỌN "APPLY" ======
+                if appt.customer_id and use_points:
+                    loyalty.redeem_for_appointment(appt)
+            else:
+                held = False
+                transaction.set_rollback(True)
+
+        if already_paid:
+            messages.info(request, "This order was paid previously")
+            return redirect("main:order_result", code=code)
+
+        if not held:
+            if appt.status in (Appointment.Status.PENDING, Appointment.Status.CONFIRMED):
+                appt.status = Appointment.Status.CANCELED
+                appt.save(update_fields=["status"])
+                schedule_daily_stats_refresh(appt)
+            messages.error(
+                request,
+                "Your time slot hold has expired and the slot is no longer available. Please book again."
+            )
+            svc = appt.services.first()
+            if svc:
+                return redirect(reverse("main:book") + f"?service={svc.slug or svc.id}")
+            return redirect("main:services")
+
+        # reset cờ dùng điểm sau khi thanh toán xong
+        if use_points:
             request.session[session_key] = False
-        # ====== HẾT PHẦN LOYALTY ======
 
         messages.success(request, "Payment successful. The appointment has been confirmed.")
     else:
@@ -800,37 +784,106 @@ def order_result(request, code: str):
 
 
 from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
 
 @login_required
 def api_free_slots(request):
+    """
+    GET /api/free-slots/?branch_id=..&date=YYYY-MM-DD[&service=<slug|id>|&duration=<phút>]
+    Trả về số KTV còn rảnh cho từng giờ bắt đầu:
+      {"slots": [{"time": "09:00", "capacity": 2}, ...], "available": [...], "booked": [...]}
+    Có ETag theo lịch của chi nhánh/ngày -> trình duyệt gửi If-None-Match sẽ nhận 304.
+    """
     d = request.GET.get("date")
     b = request.GET.get("branch_id")
     if not (d and b):
-        return JsonResponse({"available": [], "booked": []})
-
-    d = datetime.strptime(d, "%Y-%m-%d").date()
+        return JsonResponse({"slots": [], "available": [], "booked": []})
+    try:
+        d = datetime.strptime(d, "%Y-%m-%d").date()
+        branch_id = int(b)
+    except ValueError:
+        return JsonResponse({"error": "Invalid date or branch."}, status=400)
 
-    # Các giờ đã được đặt
-    ap_qs = Appointment.objects.filter(appointment_date=d, branch_id=b)
-    booked = {a.appointment_time.strftime("%H:%M") for a in ap_qs}
+    # thời lượng: lấy theo service nếu có, không thì ?duration=, mặc định 60'
+    duration = DEFAULT_DURATION
+    svc_param = (request.GET.get("service") or "").strip()
+    if svc_param:
+        svc = Service.objects.filter(slug=svc_param, is_active=True).first()
+        if not svc and svc_param.isdigit():
+            svc = Service.objects.filter(pk=int(svc_param), is_active=True).first()
+        if svc:
+            duration = int(svc.duration or DEFAULT_DURATION)
+    elif (request.GET.get("duration") or "").isdigit():
+        duration = max(1, int(request.GET["duration"]))
 
     # Nếu là hôm nay chặn luôn các giờ đã qua
-    today = timezone.localdate()
-    if d == today:
-        now_t = timezone.localtime().time()
-        ALL_TIMES = [
-            "08:00","08:30","09:00","09:30","10:00","10:30","11:00","11:30",
-            "12:00","12:30","13:00","13:30","14:00","14:30","15:00","15:30",
-            "16:00","16:30","17:00","17:30","18:00",
-        ]
-        for s in ALL_TIMES:
-            t = _to_time(s)
-            if t <= now_t:
-                booked.add(s)
+    not_before = None
+    if d == timezone.localdate():
+        not_before = timezone.localtime().time()
+    elif d < timezone.localdate():
+        not_before = dtime.max
+
+    day_index = DayAvailability.load(branch_id, d)
+    rows = day_index.capacity(duration, not_before=not_before)
+
+    passed = sum(1 for t, _ in rows if not_before is not None and t <= not_before)
+    etag = f'"{day_index.fingerprint()}-{duration}-{passed}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified["ETag"] = etag
+        return not_modified
+
+    slots = [{"time": t.strftime("%H:%M"), "capacity": n} for t, n in rows]
+    response = JsonResponse({
+        "branch_id": branch_id,
+        "date": d.isoformat(),
+        "duration": duration,
+        "slots": slots,
+        "available": [s["time"] for s in slots if s["capacity"] > 0],
+        "booked": [s["time"] for s in slots if s["capacity"] == 0],
+    })
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
-    return JsonResponse({"available": [], "booked": sorted(booked)})
 
+def api_month_availability(request):
+    """
+    GET /api/month-availability/?branch_id=..&month=YYYY-MM
+    Số phút KTV còn trống theo ngày / ca để tô màu lịch chọn ngày:
+      {"days": [{"date": "2025-06-01", "level": "open|low|full|closed|past", "remaining": 960,
+                 "shifts": {"MORNING": {"capacity": .., "booked": .., "remaining": ..}, ...}}, ...]}
+    Tháng ngoài khoảng đặt lịch -> 400, chi nhánh không tồn tại -> 404.
+    """
+    b = request.GET.get("branch_id")
+    m = request.GET.get("month") or timezone.localdate().strftime("%Y-%m")
+    try:
+        branch_id = int(b or "")
+        first = datetime.strptime(m, "%Y-%m").date()
+    except ValueError:
+        return JsonResponse({"error": "Invalid month or branch."}, status=400)
+    # mỗi (chi nhánh, tháng) là 1 khoá cache -> chỉ nhận chi nhánh có thật và các tháng còn đặt được
+    if not heatmap.in_horizon(first.year, first.month):
+        return JsonResponse({"error": "This month is outside the booking window."}, status=400)
+    if not Branch.objects.filter(pk=branch_id).exists():
+        return JsonResponse({"error": "Branch not found."}, status=404)
+
+    data = heatmap.month_availability(branch_id, first.year, first.month)
+    today = timezone.localdate()
+    days = []
+    for i in range(calendar.monthrange(first.year, first.month)[1]):
+        d = first + timedelta(days=i)
+        shifts = data.get(d.isoformat(), {})
+        days.append({
+            "date": d.isoformat(),
+            "level": "past" if d < today else heatmap.day_level(shifts),
+            "remaining": sum(c["remaining"] for c in shifts.values()),
+            "shifts": shifts,
+        })
 
+    response = JsonResponse({"branch_id": branch_id, "month": first.strftime("%Y-%m"), "days": days})
+    patch_cache_control(response, private=True, max_age=60)
+    return response
 
 
 PLACEHOLDER = "/static/images/placeholder.png"
@@ -859,10 +912,23 @@ def my_appointments(request):
     today = timezone.localdate()
     now_t = timezone.localtime().time()
 
+    # 1 pipeline cho mọi thẻ: dòng dịch vụ prefetch sẵn + trạng thái thanh toán / đã review
+    # tính bằng subquery -> số query không phụ thuộc số lịch hẹn
     base_qs = (
         Appointment.objects
         .select_related("branch")
-        .prefetch_related("service_lines__service")
+        .prefetch_related(Prefetch(
+            "service_lines",
+            queryset=AppointmentService.objects.select_related("service").order_by("pk"),
+            to_attr="lines",
+        ))
+        .annotate(
+            pay_status=Subquery(
+                Payment.objects.filter(appointment=OuterRef("pk"))
+                .order_by("-payment_date").values("status")[:1]
+            ),
+            has_review=Exists(Review.objects.filter(appointment=OuterRef("pk"))),
+        )
         .filter(customer=request.user)
     )
 
@@ -908,17 +974,10 @@ def my_appointments(request):
         )
 
         # dòng service đầu (đủ cho thẻ)
-        first_line = appt.service_lines.select_related("service").first()
+        first_line = appt.lines[0] if appt.lines else None
         svc = first_line.service if first_line else None
         price = (first_line.unit_price or 0) if first_line else 0
 
-        # trạng thái thanh toán (nếu có)
-        pay = Payment.objects.filter(appointment=appt).first()
-        pay_status = pay.status if pay else None
-
-        # đã đánh giá?
-        has_review = Review.objects.filter(appointment=appt).exists()
-
         return {
             "id": appt.id,
             "code": f"BK{appt.id:06d}",
@@ -931,18 +990,22 @@ def my_appointments(request):
             "start_at": start_dt,
             "status": appt.status,
             "status_label": appt.get_status_display(),
-            "payment_status": pay_status,
-            "has_review": has_review,
+            "payment_status": appt.pay_status,
+            "has_review": appt.has_review,
             "can_cancel": can_cancel,
             "cancel_url": reverse("main:cancel_appointment", args=[appt.id]) if can_cancel else "",
         }
 
+    # Completed có thể rất dài với khách quen -> phân trang
+    completed_page = Paginator(completed_qs, 12).get_page(request.GET.get("page"))
+
     upcoming = [_map_booking(ap) for ap in upcoming_qs]
-    completed = [_map_booking(ap) for ap in completed_qs]
+    completed = [_map_booking(ap) for ap in completed_page.object_list]
 
     return render(request, "customer/my_appointments.html", {
         "upcoming": upcoming,
         "completed": completed,
+        "completed_page": completed_page,
         "now": now,
     })
 
@@ -972,6 +1035,8 @@ def cancel_appointment(request, pk: int):
 
     appt.status = Appointment.Status.CANCELED
     appt.save(update_fields=["status"])
+    publish_appointment_event(appt, "canceled")
+    schedule_daily_stats_refresh(appt)
     messages.success(request, "The appointment has been canceled successfully.")
     return redirect("main:my_appointments")
 
@@ -1115,10 +1180,9 @@ def service_detail(request, slug: str):
         .order_by("-review_date", "-id")
     )
 
-    # Tính trung bình
-    ratings = list(reviews_qs.values_list("rating", flat=True))
-    avg_rating = round(sum(ratings) / len(ratings), 1) if ratings else None
-    total_reviews = len(ratings)
+    # Trung bình đọc từ cột tổng hợp (xem main/ratings.py)
+    total_reviews = svc.rating_count
+    avg_rating = round(svc.rating_avg, 1) if total_reviews else None
 
     return render(request, "customer/service_details.html", {
         "service": svc,
@@ -1228,7 +1292,7 @@ def customer_account(request):
 
 
     # --------- Loyalty & Upcoming ----------
-    lp, _ = LoyaltyPoints.objects.get_or_create(customer=u)
+    lp = loyalty.balance(u)
     tier, discount = _membership_from_points(lp.points_earned)
 
     today = timezone.localdate()
@@ -1299,18 +1363,43 @@ def contact_view(request):
 
 
 # ===================== Staff (Phase 2 sẽ nối DB) =====================
+def _rx_queryset():
+    """
+    Queryset chung cho màn hình lễ tân: dòng dịch vụ & KTV được prefetch sẵn (theo pk)
+    để _map_appt_for_rx chỉ đọc dữ liệu trong bộ nhớ -> 4 query cho cả danh sách.
+    """
+    return (
+        Appointment.objects
+        .exclude(status__in=[Appointment.Status.DONE, Appointment.Status.CANCELED])
+        .select_related("branch", "customer")
+        .prefetch_related(
+            Prefetch(
+                "service_lines",
+                queryset=AppointmentService.objects.select_related("service").order_by("pk"),
+                to_attr="lines",
+            ),
+            Prefetch(
+                "staff_lines",
+                queryset=AppointmentStaff.objects.select_related("staff").order_by("pk"),
+                to_attr="staff_links",
+            ),
+        )
+    )
+
+
 def _map_appt_for_rx(appt):
-    """Map 1 Appointment → dict cho UI lễ tân."""
+    """Map 1 Appointment (lấy từ _rx_queryset) → dict cho UI lễ tân."""
     # tên dịch vụ: lấy dòng đầu tiên
-    first_line = appt.service_lines.select_related("service").first()
+    first_line = appt.lines[0] if appt.lines else None
     service_name = first_line.service.service_name if first_line else "Service"
 
-    staff_link = appt.staff_lines.select_related("staff").first()
+    staff_link = appt.staff_links[0] if appt.staff_links else None
     staff_name = staff_link.staff.full_name if (staff_link and staff_link.staff) else "Chưa gán"
 
     return {
         "id": appt.id,
         "code": _make_booking_code(appt.id),
+        "appointment_date": appt.appointment_date,
         "appointment_time": appt.appointment_time,
         "branch": appt.branch,
         "customer": appt.customer,
@@ -1319,6 +1408,29 @@ def _map_appt_for_rx(appt):
         "status": appt.status,
     }
 
+
+RX_PAGE_SIZE = 50
+
+
+def _rx_cursor(appt) -> str:
+    return f"{appt.appointment_date.isoformat()}_{appt.appointment_time.strftime('%H:%M:%S')}_{appt.id}"
+
+
+def _rx_after_cursor(cursor: str):
+    """Q lọc các lịch đứng SAU con trỏ (date, time, id); None nếu con trỏ hỏng/bỏ trống."""
+    try:
+        d_str, t_str, pk_str = cursor.split("_")
+        d = _date.fromisoformat(d_str)
+        t = dtime.fromisoformat(t_str)
+        pk = int(pk_str)
+    except (AttributeError, ValueError):
+        return None
+    return (
+        Q(appointment_date__gt=d)
+        | Q(appointment_date=d, appointment_time__gt=t)
+        | Q(appointment_date=d, appointment_time=t, pk__gt=pk)
+    )
+
 from .forms import SignupForm
 @never_cache
 @login_required
@@ -1351,13 +1463,9 @@ def receptionist_dashboard(request):
     except ValueError:
         selected_date = timezone.localdate()
 
-    qs = (Appointment.objects
+    qs = (_rx_queryset()
           .filter(appointment_date=selected_date)
-          .exclude(status__in=[Appointment.Status.DONE, Appointment.Status.CANCELED])
-          .select_related("branch", "customer")
-          # ✅ đúng related_name
-          .prefetch_related("service_lines__service", "staff_lines__staff")
-          .order_by("appointment_date", "appointment_time"))
+          .order_by("appointment_time", "id"))
 
     appointments_ctx = [_map_appt_for_rx(ap) for ap in qs]
 
@@ -1377,20 +1485,29 @@ def receptionist_dashboard(request):
 def receptionist_appointments(request):
     """
     Trang danh sách tất cả lịch hẹn sắp tới cho lễ tân (>= hôm nay).
+    Phân trang keyset theo (ngày, giờ, id): ?after=<con trỏ của dòng cuối trang trước>.
     """
     today = timezone.localdate()
-    qs = (Appointment.objects
+    qs = (_rx_queryset()
           .filter(appointment_date__gte=today)
-          .exclude(status__in=[Appointment.Status.DONE, Appointment.Status.CANCELED])
-          .select_related("branch", "customer")
-          # ✅ đúng related_name
-          .prefetch_related("service_lines__service", "staff_lines__staff")
-          .order_by("appointment_date", "appointment_time"))
+          .order_by("appointment_date", "appointment_time", "id"))
 
-    items = [_map_appt_for_rx(ap) for ap in qs]
+    after = (request.GET.get("after") or "").strip()
+    after_q = _rx_after_cursor(after) if after else None
+    if after_q is not None:
+        qs = qs.filter(after_q)
+
+    # lấy dư 1 dòng để biết còn trang sau không
+    page = list(qs[:RX_PAGE_SIZE + 1])
+    has_next = len(page) > RX_PAGE_SIZE
+    page = page[:RX_PAGE_SIZE]
+
+    items = [_map_appt_for_rx(ap) for ap in page]
     return render(request, "staff/receptionist_appointments.html", {
         "items": items,
         "today": today,
+        "next_cursor": _rx_cursor(page[-1]) if has_next else "",
+        "is_first_page": after_q is None,
         "is_receptionist": True,
         "is_technician": False,
     })
@@ -1407,6 +1524,7 @@ def check_in(request, pk: int):
     appt = get_object_or_404(Appointment, pk=pk)
     appt.status = Appointment.Status.IN_PROGRESS
     appt.save(update_fields=["status"])
+    publish_appointment_event(appt, "checked_in")
     messages.success(request, f"Successfully checked in for appointment { _make_booking_code(appt.id) }.")
     # quay lại trang trước (nếu có)
     return redirect(request.META.get("HTTP_REFERER") or "main:receptionist_dashboard")
@@ -1415,6 +1533,7 @@ def check_in(request, pk: int):
 @never_cache
 @login_required
 @user_passes_test(is_receptionist)
+@idempotent("check_out")
 def check_out(request, pk: int):
     """
     Lễ tân kết thúc lịch hẹn → DONE.
@@ -1422,18 +1541,24 @@ def check_out(request, pk: int):
       - Hoàn tất lịch hẹn
       - Cộng điểm loyalty (nếu đủ điều kiện)
     """
-    appt = get_object_or_404(Appointment, pk=pk)
+    get_object_or_404(Appointment, pk=pk)
 
-    # Tránh check-out lại những lịch đã xong/hủy
-    if appt.status in [Appointment.Status.DONE, Appointment.Status.CANCELED]:
-        messages.info(request, "This appointment has already been completed.")
-        return redirect(request.META.get("HTTP_REFERER") or "main:receptionist_dashboard")
+    # khoá dòng: 2 lần bấm không có khoá idempotency vẫn chỉ 1 lần đi tiếp
+    with transaction.atomic():
+        appt = Appointment.objects.select_for_update().get(pk=pk)
 
-    appt.status = Appointment.Status.DONE
-    appt.save(update_fields=["status"])
+        # Tránh check-out lại những lịch đã xong/hủy
+        if appt.status in [Appointment.Status.DONE, Appointment.Status.CANCELED]:
+            messages.info(request, "This appointment has already been completed.")
+            return redirect(request.META.get("HTTP_REFERER") or "main:receptionist_dashboard")
+
+        appt.status = Appointment.Status.DONE
+        appt.save(update_fields=["status"])
+        publish_appointment_event(appt, "done")
+        schedule_daily_stats_refresh(appt)
 
-    #  Cộng điểm loyalty tại bước check-out
-    _award_loyalty_for_appointment(appt)
+        #  Cộng điểm loyalty tại bước check-out (chạy nền, xem main/tasks.py)
+        enqueue("loyalty.award", appointment_id=appt.id)
     # 2) Gửi email mời đánh giá (chỉ gửi nếu đủ điều kiện)
     mail_sent = send_review_invitation(request, appt)
 
@@ -1452,10 +1577,50 @@ def check_out(request, pk: int):
     return redirect(request.META.get("HTTP_REFERER") or "main:receptionist_dashboard")
 
 
+async def receptionist_stream(request):
+    """
+    SSE cho bảng lễ tân: /receptionist/stream/?date=YYYY-MM-DD[&branch=<id>]
+    Đẩy các event created / checked_in / ongoing / done / canceled của ngày đang xem.
+    Chạy dưới ASGI (glamup_nails.asgi) để mỗi kết nối không giữ 1 worker thread.
+    """
+    user = await request.auser()
+    if not user.is_authenticated or not await sync_to_async(is_receptionist)(user):
+        return HttpResponseForbidden()
+
+    try:
+        day = _date.fromisoformat((request.GET.get("date") or "").strip())
+    except ValueError:
+        day = timezone.localdate()
+
+    branch_id = (request.GET.get("branch") or "").strip()
+    if branch_id.isdigit():
+        branch_ids = [int(branch_id)]
+    else:
+        branch_ids = [pk async for pk in Branch.objects.values_list("pk", flat=True)]
+    channels = [board_channel(pk, day) for pk in branch_ids]
+
+    async def event_stream():
+        async with get_broker().subscribe(*channels) as queue:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # giữ kết nối qua proxy
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
 def send_review_invitation(request, appt: Appointment) -> bool:
     """
-    Gửi email mời khách hàng đánh giá sau khi lịch hẹn hoàn tất (DONE).
-    Trả về True nếu ĐÃ cố gửi email, False nếu bỏ qua (không đủ điều kiện).
+    Xếp email mời khách hàng đánh giá vào hàng đợi sau khi lịch hẹn hoàn tất (DONE).
+    Trả về True nếu đã xếp email, False nếu bỏ qua (không đủ điều kiện / đã xếp trước đó).
     Điều kiện:
       - khách có email
       - lịch hẹn CHƯA có review nào
@@ -1464,12 +1629,12 @@ def send_review_invitation(request, appt: Appointment) -> bool:
 
     # 1) Không có email → bỏ qua
     if not getattr(customer, "email", None):
-        print(f"[REVIEW MAIL] Bỏ qua: customer {customer} has no email.")
+        logger.info("Review invitation skipped: customer %s has no email.", customer)
         return False
 
     # 2) Lịch đã có review → không gửi nữa
     if appt.reviews.exists():
-        print(f"[REVIEW MAIL] Bỏ qua: appointment {appt.id} already has a review.")
+        logger.info("Review invitation skipped: appointment %s already has a review.", appt.id)
         return False
 
     # 3) Tạo link tới trang feedback
@@ -1510,23 +1675,19 @@ def send_review_invitation(request, appt: Appointment) -> bool:
     # hoặc chặn HTML. Phần tên người nhận em ưu tiên lấy full_name, nếu khách chưa nhập thì fallback sang username
     # để đảm bảo email luôn có lời chào cá nhân hóa và không bị trống
 
-    try:
-        send_mail(
-            #API gửi mail của Django, wrapper của SMTP.
-            subject,
-            text_message,
-            settings.DEFAULT_FROM_EMAIL,
-            #email hệ thống (cấu hình trong settings).
-            [customer.email],
-            fail_silently=False,   # 👈 TẠM THỜI cho False để nếu lỗi SMTP sẽ hiện ở console
-            html_message=html_message,
-        )
-        print(f"[REVIEW MAIL] Successfully sent review invitation email to {customer.email} cho appt {appt.id}.")
-        return True
-    except Exception as e:
-        # Xem lỗi cụ thể ở console
-        print(f"[REVIEW MAIL] ERROR sending mail for appt {appt.id}: {e}")
-        return False
+    # Chỉ xếp vào hàng đợi (1 INSERT); worker send_outbox gửi SMTP ngoài request của lễ tân.
+    # dedupe_key: check-out lại cùng 1 lịch cũng không tạo thêm email mời.
+    _, created = queue_email(
+        subject,
+        text_message,
+        [customer.email],
+        html_body=html_message,
+        dedupe_key=f"review-invite:{appt.id}",
+    )
+    if created:
+        enqueue("outbox.send")
+        logger.info("Queued review invitation email to %s for appointment %s.", customer.email, appt.id)
+    return created
 
 
 @never_cache
@@ -1937,7 +2098,7 @@ def staff_appointments(request):
         service = getattr(svc_line, "service", None)
 
         # Lấy 1 bản ghi thanh toán (nếu có)
-        pay = Payment.objects.filter(appointment=ap).first()
+        pay = Payment.objects.filter(appointment=ap).order_by("-payment_date").first()
 
         appts.append({
             "id": ap.id,
@@ -1966,6 +2127,7 @@ def staff_appointments(request):
             # vẫn để trạng thái ở mức chờ lễ tân check-out
             appt.status = Appointment.Status.ONGOING
             appt.save(update_fields=["status"])
+            publish_appointment_event(appt, "ongoing")
             messages.success(
                 request,
                 "completed"
@@ -1973,6 +2135,7 @@ def staff_appointments(request):
         elif action == "mark_uncompleted":
             appt.status = Appointment.Status.ONGOING
             appt.save(update_fields=["status"])
+            publish_appointment_event(appt, "ongoing")
             messages.info(request, "Switched back to the 'in-progress' status")
         return redirect("main:staff_appointments")
 
@@ -1984,6 +2147,83 @@ def staff_appointments(request):
     })
 
 # ===================== Admin site =====================
+class _Echo:
+    """File-like giả cho csv.writer: write() trả lại luôn dòng vừa format."""
+    def write(self, value):
+        return value
+
+
+EXPORT_CHUNK_SIZE = 1000
+
+
+def _appointments_csv_rows(appt_qs, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Sinh từng dòng CSV cho admin export.
+    Duyệt appointment theo id (keyset, mỗi lần chunk_size dòng); tên dịch vụ và số tiền đã trả
+    được gộp bằng subquery trong cùng câu SQL -> bộ nhớ không tăng theo khoảng ngày.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow([
+        "Appointment ID",
+        "Date",
+        "Time",
+        "Branch",
+        "Customer",
+        "Services",
+        "Status",
+        "Total price",
+        "Paid amount",
+    ])
+
+    services_sq = (
+        AppointmentService.objects
+        .filter(appointment=OuterRef("pk"))
+        .order_by()
+        .values("appointment")
+        .annotate(names=GroupConcat("service__service_name", delimiter="; "))
+        .values("names")
+    )
+    paid_sq = (
+        Payment.objects
+        .filter(appointment=OuterRef("pk"), status=Payment.Status.PAID)
+        .order_by()
+        .values("appointment")
+        .annotate(total=Sum("amount"))
+        .values("total")
+    )
+    rows_qs = (
+        appt_qs
+        .annotate(services_str=Subquery(services_sq), paid_total=Subquery(paid_sq))
+        .order_by("pk")
+        .values_list(
+            "pk", "appointment_date", "appointment_time", "branch__name",
+            "customer__first_name", "customer__last_name", "customer__username",
+            "services_str", "status", "total_price", "paid_total",
+        )
+    )
+    status_labels = dict(Appointment.Status.choices)
+
+    last_pk = 0
+    while True:
+        chunk = list(rows_qs.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            break
+        for (pk, appt_date, appt_time, branch_name, first_name, last_name, username,
+             services_str, status, total_price, paid_total) in chunk:
+            yield writer.writerow([
+                pk,
+                appt_date.isoformat(),
+                appt_time.strftime("%H:%M") if appt_time else "",
+                branch_name or "",
+                f"{first_name} {last_name}".strip() or username,
+                services_str or "",
+                status_labels.get(status, status),
+                float(total_price or 0),
+                float(paid_total or 0),
+            ])
+        last_pk = chunk[-1][0]
+
+
 @never_cache
 @login_required
 @user_passes_test(is_admin)
@@ -2042,116 +2282,56 @@ def admin_dashboard(request):
     # loại lịch bị hủy
     appt_qs = appt_qs.exclude(status=Appointment.Status.CANCELED)
 
-    # ===== 4. KPI: total_bookings, total_revenue =====
-    total_bookings = appt_qs.count()
-
-    paid_payments = Payment.objects.filter(
-        appointment__in=appt_qs,
-        status=Payment.Status.PAID
-    )
-
-    total_revenue = paid_payments.aggregate(
-        total=Sum("amount")
-    )["total"] or Decimal("0")
-
-    # ===== 4b. Export CSV nếu có ?export=1 =====
+    # ===== 4a. Export CSV nếu có ?export=1 (stream, không cần tính KPI) =====
     if request.GET.get("export") == "1":
-        # tạo HttpResponse với content type CSV
         filename = f"appointments_{date_start.strftime('%Y%m%d')}_{date_end.strftime('%Y%m%d')}.csv"
-        response = HttpResponse(content_type="text/csv")
+        response = StreamingHttpResponse(_appointments_csv_rows(appt_qs), content_type="text/csv")
         response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
 
-        writer = csv.writer(response)
-        # header
-        writer.writerow([
-            "Appointment ID",
-            "Date",
-            "Time",
-            "Branch",
-            "Customer",
-            "Services",  # <── thêm cột dịch vụ
-            "Status",
-            "Total price",
-            "Paid amount",
-        ])
-
-        # map tiền đã trả cho từng appointment
-        paid_map = {
-            row["appointment_id"]: row["total"]
-            for row in paid_payments
-            .values("appointment_id")
-            .annotate(total=Sum("amount"))
-        }
+    # ===== 4. KPI: total_bookings, total_revenue (đọc bảng gộp DailyBranchServiceStats) =====
+    # worker (run_workers) chưa kịp tính lại hôm nay / ngày còn thiếu -> tính luôn tại đây
+    ensure_daily_stats(date_start, date_end, branch_id)
+    stats_qs = DailyBranchServiceStats.objects.filter(date__range=(date_start, date_end))
+    if branch_id:
+        stats_qs = stats_qs.filter(branch_id=branch_id)
+    day_totals = stats_qs.filter(service__isnull=True)
+    service_stats = stats_qs.filter(service__isnull=False)
 
-        # map danh sách dịch vụ cho từng appointment
-        svc_qs = (
-            AppointmentService.objects
-            .filter(appointment__in=appt_qs)
-            .select_related("service")
-        )
-        services_map = {}
-        for line in svc_qs:
-            appt_id = line.appointment_id
-            name = line.service.service_name if line.service else "Service"
-            services_map.setdefault(appt_id, []).append(name)
-
-        # ghi từng dòng
-        for appt in appt_qs.select_related("branch", "customer"):
-            services_str = "; ".join(services_map.get(appt.id, []))
-            writer.writerow([
-                appt.id,
-                appt.appointment_date.isoformat(),
-                appt.appointment_time.strftime("%H:%M") if appt.appointment_time else "",
-                appt.branch.name if appt.branch else "",
-                appt.customer.get_full_name() or appt.customer.username,
-                services_str,  # <── giá trị cột dịch vụ
-                appt.get_status_display(),
-                float(appt.total_price or 0),
-                float(paid_map.get(appt.id) or 0),
-            ])
-
-        return response
+    kpi = day_totals.aggregate(bookings=Sum("bookings"), revenue=Sum("paid_revenue"))
+    total_bookings = kpi["bookings"] or 0
+    total_revenue = kpi["revenue"] or Decimal("0")
 
     # ===== 5. Timeseries: bookings by day =====
     ts_qs = (
-        appt_qs.values("appointment_date")
-        .annotate(count=Count("id"))
-        .order_by("appointment_date")
+        day_totals.filter(bookings__gt=0)
+        .values("date")
+        .annotate(count=Sum("bookings"))
+        .order_by("date")
     )
-    ts_labels = [row["appointment_date"].strftime("%d/%m") for row in ts_qs]
+    ts_labels = [row["date"].strftime("%d/%m") for row in ts_qs]
     ts_values = [row["count"] for row in ts_qs]
 
-    # ===== 6. Revenue by service & Popular services =====
-    paid_appt_ids = paid_payments.values_list("appointment_id", flat=True).distinct()
-
-    as_qs = (
-        AppointmentService.objects
-        .filter(appointment_id__in=paid_appt_ids)
-        .select_related("service")
+    # ===== 6. Revenue by service & Popular services (chỉ lịch đã PAID) =====
+    # 6.1 Revenue by service
+    rev_qs = (
+        service_stats.filter(paid_lines__gt=0)
+        .values("service__service_name")
+        .annotate(total=Sum("paid_revenue"))
+        .order_by("-total")[:6]
     )
-
-    # 6.1 Revenue by service (dùng line_total của model)
-    rev_map = {}  # {service_name: Decimal}
-    for line in as_qs:
-        name = line.service.service_name if line.service else "Service"
-        rev_map.setdefault(name, Decimal("0"))
-        rev_map[name] += line.line_total
-
-    rev_items = sorted(rev_map.items(), key=lambda x: x[1], reverse=True)
-    revenue_labels = [name for name, _ in rev_items[:6]]
-    revenue_values = [float(val) for _, val in rev_items[:6]]
+    revenue_labels = [row["service__service_name"] or "Service" for row in rev_qs]
+    revenue_values = [float(row["total"] or 0) for row in rev_qs]
 
     # 6.2 Popular services (đếm số line)
     pop_qs = (
-        as_qs.values("service__service_name")
-        .annotate(cnt=Count("id"))
-        .order_by("-cnt")
+        service_stats.filter(paid_lines__gt=0)
+        .values("service__service_name")
+        .annotate(cnt=Sum("paid_lines"))
+        .order_by("-cnt")[:6]
     )
-    popular_labels = [
-        row["service__service_name"] or "Service"
-        for row in pop_qs[:6]
-    ]
-    popular_counts = [row["cnt"] for row in pop_qs[:6]]
+    popular_labels = [row["service__service_name"] or "Service" for row in pop_qs]
+    popular_counts = [row["cnt"] for row in pop_qs]
 
     # ===== 7. Latest feedback (5 review mới nhất, PUBLISHED) =====
     rv_qs = (
@@ -2474,17 +2654,24 @@ def admin_schedule(request):
         next_we = next_ws + timedelta(days=6)
         pending_qs = StaffSchedule.objects.filter(
             work_date__range=(next_ws, next_we),
-            status=getattr(STATUS, "PENDING", None),
+            status=StaffSchedule.Status.PENDING,
         )
         # nếu đang lọc branch thì chỉ approve lịch của branch đó
         if branch_id:
             pending_qs = pending_qs.filter(branch_id=branch_id)
 
-        count = pending_qs.count()
-        pending_qs.update(
-            status=getattr(STATUS, "APPROVED", None),
-            approved_by=request.user,
-        )
+        with transaction.atomic():
+            # update() không phát post_save -> tự xoá cache heatmap các (chi nhánh, tháng) vừa có ca mới
+            months = {
+                (b_id, d.replace(day=1))
+                for b_id, d in pending_qs.values_list("branch_id", "work_date").distinct()
+            }
+            pending_qs.update(
+                status=StaffSchedule.Status.APPROVED,
+                approved_by=request.user,
+            )
+            for b_id, month in months:
+                heatmap.invalidate(b_id, month)
         back = f"{request.path}?start={week_start.isoformat()}"
         if branch_id:
             back += f"&branch={branch_id}"
@@ -2506,7 +2693,7 @@ def admin_schedule(request):
             )
 
             obj.status = status
-            if status == getattr(STATUS, "APPROVED", None):
+            if status == StaffSchedule.Status.APPROVED:
                 obj.branch = branch
                 obj.approved_by = request.user
             else:
@@ -2576,7 +2763,7 @@ def admin_schedule(request):
     next_we = next_ws + timedelta(days=6)
     pending_qs = StaffSchedule.objects.filter(
         work_date__range=(next_ws, next_we),
-        status=getattr(STATUS, "PENDING", None),
+        status=StaffSchedule.Status.PENDING,
     )
     if branch_id:
         pending_qs = pending_qs.filter(branch_id=branch_id)
@@ -2949,7 +3136,7 @@ def branch_detail(request, pk):
 @user_passes_test(is_customer)
 def loyalty_history(request):
     u = request.user
-    lp, _ = LoyaltyPoints.objects.get_or_create(customer=u)
+    lp = loyalty.balance(u)
 
     txs = (
         LoyaltyTransaction.objects
@@ -2971,37 +3158,3 @@ def _membership_from_points(points: int):
     if points >= 100:
         return "Silver", 5
     return "Member", 0
-
-def _award_loyalty_for_appointment(appt: Appointment):
-    """
-    Cộng điểm loyalty cho lịch hẹn đã hoàn tất nếu:
-    - Có customer
-    - Chưa cộng trước đó (loyalty_awarded = False)
-    Quy tắc demo: 1 điểm cho mỗi 10.000đ của tổng tiền.
-    """
-    if not appt.customer or appt.loyalty_awarded:
-        return
-
-    total = int(appt.total_price or 0)
-    # Quy tắc tích điểm: 1 điểm / 10.000₫ (bạn muốn thì đổi lại)
-    pts = total // 10000
-    if pts <= 0:
-        return
-
-    lp, _ = LoyaltyPoints.objects.get_or_create(customer=appt.customer)
-    lp.current_points += pts
-    lp.points_earned += pts
-    lp.save(update_fields=["current_points", "points_earned", "last_updated"])
-
-    tx = LoyaltyTransaction.objects.create(
-        customer=appt.customer,
-        appointment=appt,
-        type=LoyaltyTransaction.Type.EARN,
-        points=pts,
-        balance_after=lp.current_points,
-        description=f"Tích {pts} điểm cho lịch {f'BK{appt.id:06d}'}",
-    )
-
-    appt.loyalty_awarded = True
-    appt.save(update_fields=["loyalty_awarded"])
-
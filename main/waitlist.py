@@ -0,0 +1,189 @@
+# main/waitlist.py
+"""
+Danh sách chờ: khách không đặt được giờ (hết KTV) đăng ký chờ theo
+(chi nhánh, dịch vụ, khoảng ngày, khung giờ muốn).
+
+  - join(...)               : tạo WaitlistEntry (trùng entry đang chờ thì dùng lại)
+  - match_day(branch, day)  : job "waitlist.match", chạy khi có lịch huỷ / giữ chỗ hết hạn.
+                              Lấy các entry WAITING phủ ngày đó (index branch/status/date_from) theo thứ tự đăng ký,
+                              ai vừa giờ trống -> tạo lịch giữ chỗ tạm (PENDING + hold_expires_at) + WaitlistOffer
+                              và email mời thanh toán. Chỗ mời chưa trả tiền tự nhả như mọi giữ chỗ khác.
+  - offer_accepted(appt)    : payment_complete chốt lịch -> offer ACCEPTED, entry BOOKED
+  - slots_freed(...)        : lịch bị huỷ (1 lịch qua signals, cả lô qua scheduler) -> offer của lịch đó EXPIRED,
+                              hẹn match lại các ngày bị ảnh hưởng
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from .availability import DEFAULT_DURATION, SLOT_TIMES, DayAvailability
+from .booking import create_booking
+from .events import publish_appointment_event
+from .jobs import enqueue
+from .models import Payment, WaitlistEntry, WaitlistOffer
+from .outbox import queue_email
+from .stats import schedule_daily_stats_refresh
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def last_day(today=None):
+    """Ngày xa nhất được đăng ký chờ (mỗi ngày trong khoảng là 1 job match)."""
+    return (today or timezone.localdate()) + timedelta(days=_setting("GLAMUP_BOOKING_DAYS_AHEAD", 30))
+
+
+def join(customer, branch, service, date_from, date_to=None, preferred_from=None, preferred_to=None):
+    """Trả về (WaitlistEntry, created). date_to quá last_day() -> ValueError."""
+    date_to = date_to or date_from
+    if date_to > last_day():
+        raise ValueError(f"Waitlist range must end by {last_day():%d/%m/%Y}.")
+    existing = WaitlistEntry.objects.filter(
+        customer=customer, branch=branch, service=service,
+        status=WaitlistEntry.Status.WAITING, date_from__lte=date_to, date_to__gte=date_from,
+    ).first()
+    if existing:
+        return existing, False
+    entry = WaitlistEntry.objects.create(
+        customer=customer, branch=branch, service=service,
+        date_from=date_from, date_to=date_to,
+        preferred_from=preferred_from, preferred_to=preferred_to,
+    )
+    # có thể đã còn chỗ ở bất kỳ ngày nào trong khoảng -> match từng ngày (ngày đã qua thì bỏ)
+    days = [date_from + timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+    days = [d for d in days if d >= timezone.localdate()]
+
+    def _match_range():
+        for day in days:
+            enqueue_match(branch.pk, day)
+
+    transaction.on_commit(_match_range)
+    return entry, True
+
+
+def enqueue_match(branch_id, day):
+    # 1 lần match phủ mọi entry của ngày đó -> đã có job chờ thì thôi
+    enqueue("waitlist.match", unique=True, branch_id=branch_id, day=day.isoformat())
+
+
+def _wanted_times(entry, not_before=None):
+    for t in SLOT_TIMES:
+        if not_before is not None and t <= not_before:
+            continue
+        if entry.preferred_from and t < entry.preferred_from:
+            continue
+        if entry.preferred_to and t > entry.preferred_to:
+            continue
+        yield t
+
+
+def _send_offer_email(offer, appt, entry):
+    if not entry.customer.email:
+        return
+    code = f"BK{appt.id:06d}"
+    pay_url = _setting("GLAMUP_SITE_URL", "").rstrip("/") + reverse("main:payment", kwargs={"code": code})
+    name = entry.customer.full_name or entry.customer.username
+    queue_email(
+        f"A slot opened up: {entry.service.service_name} at {appt.appointment_time:%H:%M}",
+        (
+            f"Dear {name},\n\n"
+            f"Good news! A slot for {entry.service.service_name} at {entry.branch.name} is now available on "
+            f"{appt.appointment_date:%d/%m/%Y} at {appt.appointment_time:%H:%M}.\n\n"
+            f"We are holding it for you until {timezone.localtime(offer.expires_at):%H:%M}. "
+            f"Complete the payment to confirm booking {code}:\n{pay_url}\n\n"
+            "If you do not need it anymore, simply ignore this email.\n"
+        ),
+        [entry.customer.email],
+        dedupe_key=f"waitlist-offer:{offer.pk}",
+    )
+    enqueue("outbox.send")
+
+
+def _make_offer(entry, day, start_time, candidates, now):
+    """Tạo lịch giữ chỗ tạm cho entry. None nếu entry vừa được xử lý nơi khác hoặc KTV vừa bị giữ mất."""
+    service = entry.service
+    expires = now + timedelta(minutes=_setting("GLAMUP_WAITLIST_OFFER_MINUTES", 30))
+    with transaction.atomic():
+        # UPDATE có điều kiện: 2 worker cùng match 1 ngày thì chỉ 1 bên mời được entry này
+        if not WaitlistEntry.objects.filter(pk=entry.pk, status=WaitlistEntry.Status.WAITING).update(
+            status=WaitlistEntry.Status.OFFERED
+        ):
+            return None
+        appt, staff_id = create_booking(
+            entry.customer, entry.branch_id, day, start_time, service, candidates,
+            pay_method=Payment.Method.ONLINE, hold_expires_at=expires, note="Waitlist offer",
+        )
+        if staff_id is None:
+            transaction.set_rollback(True)  # trả entry về WAITING
+            return None
+        offer = WaitlistOffer.objects.create(entry=entry, appointment=appt, expires_at=expires)
+        _send_offer_email(offer, appt, entry)
+        publish_appointment_event(appt, "created")
+        schedule_daily_stats_refresh(appt)
+    return offer
+
+
+def match_day(branch_id, day, now=None):
+    """Mời các entry đang chờ vào giờ còn trống của (chi nhánh, ngày). Trả về số offer đã tạo."""
+    now = now or timezone.now()
+    local_now = timezone.localtime(now)
+    if day < local_now.date():
+        return 0
+    entries = list(
+        WaitlistEntry.objects
+        .filter(branch_id=branch_id, status=WaitlistEntry.Status.WAITING, date_from__lte=day, date_to__gte=day)
+        .select_related("customer", "branch", "service")
+        .order_by("created_at", "pk")
+    )
+    if not entries:
+        return 0
+
+    index = DayAvailability.load(branch_id, day)
+    not_before = local_now.time() if day == local_now.date() else None
+    made = 0
+    for entry in entries:
+        duration = int(entry.service.duration or DEFAULT_DURATION)
+        for t in _wanted_times(entry, not_before):
+            free = index.free_staff(t, duration)
+            if not free:
+                continue
+            if _make_offer(entry, day, t, sorted(free, key=index.load_minutes), now):
+                made += 1
+            # có thay đổi (mời được hoặc bị tranh mất) -> load lại lịch bận cho entry kế
+            index = DayAvailability.load(branch_id, day)
+            break
+    return made
+
+
+def offer_accepted(appt, now=None):
+    """Gọi sau khi lịch giữ chỗ được chốt (thanh toán xong)."""
+    now = now or timezone.now()
+    offers = WaitlistOffer.objects.filter(appointment=appt, status=WaitlistOffer.Status.OFFERED)
+    entry_ids = list(offers.values_list("entry_id", flat=True))
+    if not entry_ids:
+        return
+    offers.update(status=WaitlistOffer.Status.ACCEPTED, responded_at=now)
+    WaitlistEntry.objects.filter(pk__in=entry_ids).update(status=WaitlistEntry.Status.BOOKED)
+
+
+def slots_freed(appt_ids, days, now=None):
+    """
+    Các lịch `appt_ids` vừa bị huỷ; `days` = {(branch_id, date), ...} của chúng.
+    Offer gắn với các lịch đó hết hiệu lực, rồi hẹn match lại từng ngày.
+    """
+    now = now or timezone.now()
+    offers = WaitlistOffer.objects.filter(appointment_id__in=appt_ids, status=WaitlistOffer.Status.OFFERED)
+    entry_ids = list(offers.values_list("entry_id", flat=True))
+    if entry_ids:
+        offers.update(status=WaitlistOffer.Status.EXPIRED, responded_at=now)
+        WaitlistEntry.objects.filter(pk__in=entry_ids, status=WaitlistEntry.Status.OFFERED).update(
+            status=WaitlistEntry.Status.EXPIRED
+        )
+    today = timezone.localdate(now)
+    for branch_id, day in days:
+        if day >= today:
+            enqueue_match(branch_id, day)